@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+from __future__ import division
+from datetime import datetime, timedelta
+import os
+import logging
+import sys
+from utils import get_groundstation_info, get_scheduled_passes_from_network, \
+    find_passes_stations, benchmark_scheduler, Fetcher, get_fetcher, set_fetcher, \
+    CatalogueCache, ClaimIndex
+from schedule_single_station import get_parser, check_arguments, update_catalogue, \
+    get_observer, load_satellites, select_passes, report_passes, network_login, schedule_passes
+import settings
+
+
+def priority_file(filename, ground_station_id):
+    """Priorities file of a station, a %d in the name is replaced by the station ID"""
+    if filename is not None and "%d" in filename:
+        return filename % ground_station_id
+    return filename
+
+
+def main():
+
+    # Parse arguments
+    parser = get_parser("Automatically schedule observations on several SatNOGS stations " +
+                        "sharing one catalogue and pass prediction run.")
+    parser.add_argument("-s",
+                        "--stations",
+                        help="Ground station IDs, in order of preference when coordinating",
+                        type=int,
+                        nargs="+")
+    parser.add_argument("-C",
+                        "--coordinate",
+                        help="Do not schedule a pass of a satellite already observed or " +
+                        "scheduled in the same time window by another of the stations",
+                        action="store_true")
+    parser.epilog = "The -P file name may contain %d, replaced by each station ID."
+    args = parser.parse_args()
+
+    if args.benchmark > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        benchmark_scheduler(args.benchmark)
+        sys.exit()
+
+    # Check arguments
+    if not args.stations:
+        parser.print_help()
+        sys.exit()
+
+    # Setting logging level
+    numeric_level = args.log_level
+    if not isinstance(numeric_level, int):
+        raise ValueError("Invalid log level")
+    logging.basicConfig(level=numeric_level,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    # Settings
+    check_arguments(args)
+    cache_dir = "/tmp/cache"
+    schedule = not args.dryrun
+
+    # Set time range
+    tnow = datetime.strptime(args.starttime, "%Y-%m-%dT%H:%M:%S")
+    tmin = tnow
+    tmax = tnow + timedelta(hours=args.duration)
+
+    # Create cache
+    if not os.path.isdir(cache_dir):
+        os.mkdir(cache_dir)
+
+    # Pooled API session, responses kept for conditional requests
+    set_fetcher(Fetcher(os.path.join(cache_dir, "http")))
+
+    # Get ground stations information, skipping the ones which can't be scheduled
+    ground_station_ids = list(dict.fromkeys(args.stations))
+    ground_stations = get_fetcher().map(
+        lambda ground_station_id: get_groundstation_info(ground_station_id, args.allow_testing),
+        ground_station_ids)
+    ground_stations = [ground_station for ground_station in ground_stations if ground_station]
+    if not ground_stations:
+        sys.exit()
+
+    # Printing Az window
+    logging.info('Az window set as Min(%3.0f) Max(%3.0f)' % (args.azmin, args.azmax))
+
+    # Transmitters and TLEs cache, shared by all stations
+    cache = CatalogueCache(os.path.join(cache_dir, "catalogue.sqlite"))
+    update_catalogue(cache, ground_stations, tnow, cache_dir)
+
+    # One observer per station, TLEs parsed once for all of them
+    min_pass_duration = settings.MIN_PASS_DURATION
+    tles = {}
+    jobs = []
+    for ground_station in ground_stations:
+        observer, min_culmination = get_observer(ground_station, args)
+        satellites = load_satellites(cache, ground_station['id'], tles)
+        jobs.append((satellites, observer, tmin, tmax, min_culmination, min_pass_duration))
+
+    # Find passes of all stations on one process pool
+    station_passes = find_passes_stations(jobs, cache_dir=cache_dir)
+
+    # Lists of scheduled passes
+    station_scheduledpasses = get_fetcher().run(
+        [(get_scheduled_passes_from_network, (ground_station['id'], tmin, tmax, cache_dir))
+         for ground_station in ground_stations])
+
+    # Passes already on the network are claimed before any new one is selected
+    claims = None
+    if args.coordinate:
+        claims = ClaimIndex()
+        for scheduledpasses in station_scheduledpasses:
+            for satpass in scheduledpasses:
+                claims.add(satpass)
+
+    # Run the scheduler of each station, in the order given
+    schedule_needed = False
+    for k, ground_station in enumerate(ground_stations):
+        ground_station_id = ground_station['id']
+        logging.info("Found %d scheduled passes between %s and %s on ground station %d" %
+                     (len(station_scheduledpasses[k]), tmin, tmax, ground_station_id))
+        station_scheduledpasses[k] = select_passes(station_passes[k], station_scheduledpasses[k],
+                                                   priority_file(args.priorities,
+                                                                 ground_station_id),
+                                                   args, claims)
+        if report_passes(ground_station_id, station_scheduledpasses[k]):
+            schedule_needed = True
+
+    # Login once and schedule passes
+    if schedule and schedule_needed:
+        session = network_login()
+        for ground_station, scheduledpasses in zip(ground_stations, station_scheduledpasses):
+            schedule_passes(session, ground_station['id'], scheduledpasses, args.azmin, args.azmax)
+
+        logging.info("All passes are scheduled. Exiting!")
+
+
+if __name__ == '__main__':
+    main()
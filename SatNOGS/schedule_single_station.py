@@ -9,9 +9,10 @@ import lxml.html
 import argparse
 import logging
 from utils import get_active_transmitter_info, get_transmitter_stats, \
-    get_groundstation_info, get_scheduled_passes_from_network, ordered_scheduler, \
+    get_groundstation_info, get_scheduled_passes_from_network, SCHEDULERS, \
     report_efficiency, find_passes, schedule_observation, read_priorities_transmitters, \
-    get_satellite_info, update_needed, get_priority_passes
+    get_satellite_info, get_priority_passes, benchmark_scheduler, \
+    Fetcher, get_fetcher, set_fetcher, CatalogueCache
 import settings
 from tqdm import tqdm
 import sys
@@ -21,6 +22,7 @@ _LOG_LEVEL_STRINGS = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
 
 class twolineelement:
     """TLE class"""
+    __slots__ = ('tle0', 'tle1', 'tle2', 'name', 'id')
 
     def __init__(self, tle0, tle1, tle2):
         """Define a TLE"""
@@ -32,14 +34,14 @@ class twolineelement:
             self.name = tle0[2:]
         else:
             self.name = tle0
-            if tle1.split(" ")[1] == "":
-                self.id = int(tle1.split(" ")[2][:4])
-            else:
-                self.id = int(tle1.split(" ")[1][:5])
+        # NORAD id, columns 3-7 of line 1 (blank padded below 10000)
+        self.id = int(tle1[2:7])
 
 
 class satellite:
     """Satellite class"""
+    __slots__ = ('tle0', 'tle1', 'tle2', 'id', 'name', 'transmitter', 'success_rate',
+                 'good_count', 'data_count', 'mode')
 
     def __init__(self, tle, transmitter, success_rate, good_count, data_count, mode):
         """Define a satellite"""
@@ -60,6 +62,28 @@ class satellite:
                                          self.data_count, self.mode, self.name)
 
 
+def load_satellites(cache, station, tles=None):
+    """Satellites of a station from the catalogue cache, one per transmitter
+
+    tles maps NORAD ids to the twolineelement already parsed, pass the same
+    dict for several stations to parse each TLE only once.
+    """
+    tle_rows, transmitter_rows = cache.read(station)
+    if tles is None:
+        tles = {}
+    for tle0, tle1, tle2 in tle_rows:
+        norad_cat_id = int(tle1[2:7])
+        tle = tles.get(norad_cat_id)
+        if tle is None or tle.tle1 != tle1 or tle.tle2 != tle2:
+            tles[norad_cat_id] = twolineelement(tle0, tle1, tle2)
+    satellites = []
+    for norad_cat_id, uuid, success_rate, good_count, data_count, mode in transmitter_rows:
+        tle = tles.get(norad_cat_id)
+        if tle is not None:
+            satellites.append(satellite(tle, uuid, success_rate / 100.0, good_count, data_count, mode))
+    return satellites
+
+
 def _log_level_string_to_int(log_level_string):
     if log_level_string not in _LOG_LEVEL_STRINGS:
         message = 'invalid choice: {0} (choose from {1})'.format(log_level_string,
@@ -92,12 +116,9 @@ def checkAz(Az,Azmin,Azmax):
        else:
           return False
 #*-------------------------------------------------------------------------------
-def main():
-
-    # Parse arguments
-    parser = argparse.ArgumentParser(
-        description="Automatically schedule observations on a SatNOGS station.")
-    parser.add_argument("-s", "--station", help="Ground station ID", type=int)
+def get_parser(description):
+    """Arguments common to the single and multiple station schedulers (all but the station)"""
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("-t",
                         "--starttime",
                         help="Start time (YYYY-MM-DD HH:MM:SS) [default: now]",
@@ -176,132 +197,103 @@ def main():
                         type=_log_level_string_to_int,
                         nargs="?",
                         help="Set the logging output level. {0}".format(_LOG_LEVEL_STRINGS))
-    args = parser.parse_args()
-
-    # Check arguments
-    if args.station is None:
-        parser.print_help()
-        sys.exit()
-
-    # Setting logging level
-    numeric_level = args.log_level
-    if not isinstance(numeric_level, int):
-        raise ValueError("Invalid log level")
-    logging.basicConfig(level=numeric_level,
-                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser.add_argument("-S",
+                        "--scheduler",
+                        help="Scheduler mode: ordered (by priority), random or optimal " +
+                        "(maximum priority weighted observation time) [default: ordered]",
+                        choices=sorted(SCHEDULERS.keys()),
+                        default="ordered")
+    parser.add_argument("-B",
+                        "--benchmark",
+                        help="Benchmark the scheduler on N synthetic passes over a week and exit",
+                        type=int,
+                        default=0)
+    return parser
 
-    # Settings
 
-    ground_station_id = args.station
-    if args.duration > 0.0:
-        length_hours = args.duration
-    else:
-        length_hours = 1.0
+def check_arguments(args):
+    """Bring the numeric arguments within their allowed ranges"""
+    if args.duration <= 0.0:
+        args.duration = 1.0
     if args.wait <= 0:
-        wait_time_seconds = 0
-    elif args.wait <= 3600:
-        wait_time_seconds = args.wait
-    else:
-        wait_time_seconds = 3600
+        args.wait = 0
+    elif args.wait > 3600:
+        args.wait = 3600
     if args.min_priority < 0.0:
-        min_priority = 0.0
+        args.min_priority = 0.0
     elif args.min_priority > 1.0:
-        min_priority = 1.0
-    else:
-        min_priority = args.min_priority
-
-    if (args.azmin >= 0) and (args.azmin <= 360):
-       azmin=args.azmin
-    else:
-       azmin=0
-
-    if (args.azmax>=0) and (args.azmax<=360):
-       azmax=args.azmax
-    else:
-       azmax=365
-
-
-    cache_dir = "/tmp/cache"
-    schedule = not args.dryrun
-    only_priority = args.only_priority
-    priority_filename = args.priorities
-
-    # Set time range
-    tnow = datetime.strptime(args.starttime, "%Y-%m-%dT%H:%M:%S")
-    tmin = tnow
-    tmax = tnow + timedelta(hours=length_hours)
-
-    # Get ground station information
-    ground_station = get_groundstation_info(ground_station_id, args.allow_testing)
-    if not ground_station:
-        sys.exit()
-    
-    # Create cache
-    if not os.path.isdir(cache_dir):
-        os.mkdir(cache_dir)
-
-    # Printing Az window
-    logging.info('Az window set as Min(%3.0f) Max(%3.0f)' % (azmin,azmax))
-
-    # Update logic
-    update = update_needed(tnow, ground_station_id, cache_dir)
-
-    # Update
-    if update:
-        logging.info('Updating transmitters and TLEs for station')
-        # Store current time
-        with open(os.path.join(cache_dir, "last_update_%d.txt" % ground_station_id), "w") as fp:
-            fp.write(tnow.strftime("%Y-%m-%dT%H:%M:%S") + "\n")
-
-        # Get active transmitters in frequency range of each antenna
-        transmitters = {}
-        for antenna in ground_station['antenna']:
-            for transmitter in get_active_transmitter_info(antenna["frequency"],
-                                                           antenna["frequency_max"]):
-                transmitters[transmitter['uuid']] = transmitter
-
-        # Get satellites which are alive
-        alive_norad_cat_ids = get_satellite_info()
-
-        # Get NORAD IDs
-        norad_cat_ids = sorted(
-            set([
-                transmitter["norad_cat_id"] for transmitter in transmitters.values()
-                if transmitter["norad_cat_id"] < settings.MAX_NORAD_CAT_ID and
-                transmitter["norad_cat_id"] in alive_norad_cat_ids
-            ]))
-
-        # Store transmitters
-        fp = open(os.path.join(cache_dir, "transmitters_%d.txt" % ground_station_id), "w")
-        logging.info("Requesting transmitter success rates.")
-        transmitters_stats = get_transmitter_stats()
-        for transmitter in transmitters_stats:
-            uuid = transmitter["uuid"]
-            # Skip absent transmitters
-            if uuid not in transmitters.keys():
-                continue
-            # Skip dead satellites
-            if transmitters[uuid]["norad_cat_id"] not in alive_norad_cat_ids:
-                continue
-
-            fp.write(
-                "%05d %s %d %d %d %s\n" %
-                (transmitters[uuid]["norad_cat_id"], uuid, transmitter["stats"]["success_rate"],
-                 transmitter["stats"]["good_count"], transmitter["stats"]["total_count"], transmitters[uuid]["mode"]))
+        args.min_priority = 1.0
+
+    if args.azmin is None or args.azmin < 0 or args.azmin > 360:
+        args.azmin = 0
+    if args.azmax is None or args.azmax < 0 or args.azmax > 360:
+        args.azmax = 365
+
+
+def update_catalogue(cache, ground_stations, tnow, cache_dir):
+    """Refresh the transmitters of the stations and their TLEs when stale
+
+    The satellite list and transmitter statistics are shared by all stations,
+    so they are requested once together with the transmitters in range of
+    each antenna of the stations that need an update. The stale TLEs of all
+    stations are fetched in a single fetch_tles call.
+    """
+    stale = [ground_station for ground_station in ground_stations
+             if not cache.transmitters_fresh(ground_station['id'], tnow)]
+    if stale:
+        logging.info('Updating transmitters for %d station(s)' % len(stale))
+
+        # Fetch the active transmitters in frequency range of each antenna, the
+        # satellites which are alive and the transmitter success rates concurrently
+        logging.info("Requesting transmitters, satellites and transmitter success rates.")
+        calls = [(get_active_transmitter_info, (antenna["frequency"], antenna["frequency_max"]))
+                 for ground_station in stale for antenna in ground_station['antenna']]
+        results = get_fetcher().run(calls + [(get_satellite_info, ()), (get_transmitter_stats, ())])
+        alive_norad_cat_ids = set(results[-2])
+        transmitters_stats = results[-1]
+
+        k = 0
+        for ground_station in stale:
+            transmitters = {}
+            for antenna_transmitters in results[k:k + len(ground_station['antenna'])]:
+                for transmitter in antenna_transmitters:
+                    transmitters[transmitter['uuid']] = transmitter
+            k += len(ground_station['antenna'])
+
+            # Store transmitters
+            rows = []
+            for transmitter in transmitters_stats:
+                uuid = transmitter["uuid"]
+                # Skip absent transmitters
+                if uuid not in transmitters.keys():
+                    continue
+                # Skip dead satellites
+                if transmitters[uuid]["norad_cat_id"] not in alive_norad_cat_ids:
+                    continue
+
+                rows.append((transmitters[uuid]["norad_cat_id"], uuid,
+                             transmitter["stats"]["success_rate"],
+                             transmitter["stats"]["good_count"], transmitter["stats"]["total_count"],
+                             transmitters[uuid]["mode"]))
+            cache.store_transmitters(ground_station['id'], rows, tnow)
+            cache.export_transmitters(ground_station['id'],
+                                      os.path.join(cache_dir,
+                                                   "transmitters_%d.txt" % ground_station['id']))
 
         logging.info("Transmitter success rates received!")
-        fp.close()
 
-        # Get TLEs
-        tles = fetch_tles(norad_cat_ids)
+    # Get the TLEs missing or older than CACHE_AGE
+    norad_cat_ids = set()
+    for ground_station in ground_stations:
+        norad_cat_ids.update(cache.norad_cat_ids(ground_station['id']))
+    norad_cat_ids = cache.stale_tles(sorted(norad_cat_ids), tnow)
+    if norad_cat_ids:
+        logging.info('Updating %d TLEs' % len(norad_cat_ids))
+        cache.store_tles(fetch_tles(norad_cat_ids), tnow)
 
-        # Store TLEs
-        fp = open(os.path.join(cache_dir, "tles_%d.txt" % ground_station_id), "w")
-        for norad_cat_id, (source, tle) in tles.items():
-            fp.write("%s\n%s\n%s\n" % (tle[0], tle[1], tle[2]))
-        fp.close()
 
-    # Set observer
+def get_observer(ground_station, args):
+    """Observer of the ground station and minimum culmination elevation"""
     observer = ephem.Observer()
     observer.lon = str(ground_station['lng'])
     observer.lat = str(ground_station['lat'])
@@ -328,64 +320,68 @@ def main():
             min_riseset = 90.0
         else:
             min_riseset = args.min_riseset
-            
+
     # Use minimum altitude for computing rise and set times (horizon to horizon otherwise)
     if not args.horizon:
         observer.horizon = str(min_riseset)
 
-    # Minimum duration of a pass
-    min_pass_duration = settings.MIN_PASS_DURATION
+    return observer, min_culmination
 
-    # Read tles
-    with open(os.path.join(cache_dir, "tles_%d.txt" % ground_station_id), "r") as f:
-        lines = f.readlines()
-        tles = [
-            twolineelement(lines[i], lines[i + 1], lines[i + 2]) for i in range(0, len(lines), 3)
-        ]
 
-    # Read transmitters
-    satellites = []
-    with open(os.path.join(cache_dir, "transmitters_%d.txt" % ground_station_id), "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            item = line.split()
-            norad_cat_id, uuid, success_rate, good_count, data_count, mode = int(
-                item[0]), item[1], float(item[2]) / 100.0, int(item[3]), int(item[4]), item[5]
-            for tle in tles:
-                if tle.id == norad_cat_id:
-                    satellites.append(satellite(tle, uuid, success_rate, good_count, data_count, mode))
+def in_az_window(satpass, azmin, azmax):
+    """True when the pass rises or sets within the Az window"""
+    return bool(checkAz(float(satpass['azr']), azmin, azmax) or
+                checkAz(float(satpass['azs']), azmin, azmax))
 
-    # Find passes
-    passes = find_passes(satellites, observer, tmin, tmax, min_culmination, min_pass_duration)
 
+def select_passes(passes, scheduledpasses, priority_filename, args, claims=None):
+    """Run the scheduler over the priority and then the normal passes
+
+    Passes outside the Az window are left out before selecting, they would
+    be rejected by schedule_passes. With claims (a ClaimIndex) passes already
+    claimed by another station are left out, and the ones selected here are
+    claimed in turn.
+    """
     priorities, favorite_transmitters = read_priorities_transmitters(priority_filename)
-    
-    # List of scheduled passes
-    scheduledpasses = get_scheduled_passes_from_network(ground_station_id, tmin, tmax)
-    logging.info("Found %d scheduled passes between %s and %s on ground station %d" %
-                 (len(scheduledpasses), tmin, tmax, ground_station_id))
+
+    # Drop passes outside the Az window
+    inwindow = [satpass for satpass in passes if in_az_window(satpass, args.azmin, args.azmax)]
+    if len(inwindow) < len(passes):
+        logging.info("%d passes out of the Az window left out" % (len(passes) - len(inwindow)))
+    passes = inwindow
 
     # Get passes of priority objects
     prioritypasses, normalpasses = get_priority_passes(passes, priorities, favorite_transmitters,
-                                                       only_priority, min_priority)
+                                                       args.only_priority, args.min_priority)
+    if claims is not None:
+        prioritypasses = [satpass for satpass in prioritypasses if not claims.claimed(satpass)]
+        normalpasses = [satpass for satpass in normalpasses if not claims.claimed(satpass)]
 
     # Priority scheduler
     prioritypasses = sorted(prioritypasses, key=lambda satpass: -satpass['priority'])
-    scheduledpasses = ordered_scheduler(prioritypasses, scheduledpasses, wait_time_seconds)
+    scheduler = SCHEDULERS[args.scheduler]
+    scheduledpasses = scheduler(prioritypasses, scheduledpasses, args.wait)
 
     for satpass in passes:
         logging.debug(satpass)
 
     # Normal scheduler
     normalpasses = sorted(normalpasses, key=lambda satpass: -satpass['priority'])
-    scheduledpasses = ordered_scheduler(normalpasses, scheduledpasses, wait_time_seconds)
+    scheduledpasses = scheduler(normalpasses, scheduledpasses, args.wait)
+
+    if claims is not None:
+        for satpass in scheduledpasses:
+            if not satpass['scheduled']:
+                claims.add(satpass)
 
     # Report scheduling efficiency
     report_efficiency(scheduledpasses, passes)
 
-    # Find unique objects
-    satids = sorted(set([satpass['id'] for satpass in passes]))
+    return scheduledpasses
 
+
+def report_passes(ground_station_id, scheduledpasses):
+    """Log the passes of the station, returns True when any is still to be scheduled"""
     schedule_needed = False
 
 #*----- Modify to add AzR and AzS
@@ -405,66 +401,158 @@ def main():
         if not satpass['scheduled']:
             schedule_needed = True
 
-    # Login and schedule passes
-    if schedule and schedule_needed:
-        loginUrl = '{}/accounts/login/'.format(settings.NETWORK_BASE_URL)  # login URL
-        session = requests.session()
-        login = session.get(loginUrl)  # Get login page for CSFR token
-        login_html = lxml.html.fromstring(login.text)
-        login_hidden_inputs = login_html.xpath(r'//form//input[@type="hidden"]')  # Get CSFR token
-        form = {x.attrib["name"]: x.attrib["value"] for x in login_hidden_inputs}
-        form["login"] = settings.NETWORK_USERNAME
-        form["password"] = settings.NETWORK_PASSWORD
-
-        # Login
-        result = session.post(loginUrl,
-                              data=form,
-                              headers={
-                                  'referer': loginUrl,
-                                  'user-agent': 'satnogs-auto-scheduler/0.0.1'
-                              })
-        if result.url.endswith("/accounts/login/"):
-            logging.info("Authentication failed")
-            sys.exit(-1)
-        else:
-            logging.info("Authentication successful")
+    return schedule_needed
+
+
+def network_login():
+    """Session logged in the network, exits when authentication fails"""
+    loginUrl = '{}/accounts/login/'.format(settings.NETWORK_BASE_URL)  # login URL
+    session = requests.session()
+    login = session.get(loginUrl)  # Get login page for CSFR token
+    login_html = lxml.html.fromstring(login.text)
+    login_hidden_inputs = login_html.xpath(r'//form//input[@type="hidden"]')  # Get CSFR token
+    form = {x.attrib["name"]: x.attrib["value"] for x in login_hidden_inputs}
+    form["login"] = settings.NETWORK_USERNAME
+    form["password"] = settings.NETWORK_PASSWORD
+
+    # Login
+    result = session.post(loginUrl,
+                          data=form,
+                          headers={
+                              'referer': loginUrl,
+                              'user-agent': 'satnogs-auto-scheduler/0.0.1'
+                          })
+    if result.url.endswith("/accounts/login/"):
+        logging.info("Authentication failed")
+        sys.exit(-1)
+    else:
+        logging.info("Authentication successful")
+    return session
 
-        # Sort passes
-        scheduledpasses_sorted = sorted(scheduledpasses, key=lambda satpass: satpass['tr'])
 
-        logging.info('Checking and scheduling passes as needed.')
-        for satpass in tqdm(scheduledpasses_sorted):
-            if not satpass['scheduled']:
-                #logging.debug("Scheduling %05d %s %s %3.0f %4.3f %s %s" %
-                #logging.info("Scheduling %05d %s %s %3.0f %4.3f %s %s" %
-                #              (int(satpass['id']), satpass['tr'].strftime("%Y-%m-%dT%H:%M:%S"),
-                #               satpass['ts'].strftime("%Y-%m-%dT%H:%M:%S"), float(satpass['altt']),
-                #               satpass['priority'], satpass['uuid'], satpass['name'].rstrip()))
+def schedule_passes(session, ground_station_id, scheduledpasses, azmin, azmax):
+    """Schedule on the network the selected passes within the Az window"""
+    # Sort passes
+    scheduledpasses_sorted = sorted(scheduledpasses, key=lambda satpass: satpass['tr'])
+
+    logging.info('Checking and scheduling passes as needed.')
+    for satpass in tqdm(scheduledpasses_sorted):
+        if not satpass['scheduled']:
+            #logging.debug("Scheduling %05d %s %s %3.0f %4.3f %s %s" %
+            #logging.info("Scheduling %05d %s %s %3.0f %4.3f %s %s" %
+            #              (int(satpass['id']), satpass['tr'].strftime("%Y-%m-%dT%H:%M:%S"),
+            #               satpass['ts'].strftime("%Y-%m-%dT%H:%M:%S"), float(satpass['altt']),
+            #               satpass['priority'], satpass['uuid'], satpass['name'].rstrip()))
 
 #*------ Filter passes based on Az Window
 
-                
-                if (checkAz(float(satpass['azr']),azmin,azmax)) or (checkAz(float(satpass['azs']),azmin,azmax)):
-                    logging.info("\n")
 
-                    logging.info("scheduling Sat(%d) UUID(%s) Rise(%s) Set(%s)" % (int(satpass['id']),satpass['uuid'],
-                                     satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
-                                     satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000"))
+            if in_az_window(satpass, azmin, azmax):
+                logging.info("\n")
+
+                logging.info("scheduling Sat(%d) UUID(%s) Rise(%s) Set(%s)" % (int(satpass['id']),satpass['uuid'],
+                                 satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
+                                 satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000"))
+
+                schedule_observation(session, int(satpass['id']), satpass['uuid'],
+                                 ground_station_id,
+                                 satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
+                                 satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000")
+                logging.info("\n")
+
+            else:
+                logging.info("\n")
+
+                logging.info("rejecting Sat(%d) UUID(%s) Rise(%s) Set(%s)" % (int(satpass['id']),satpass['uuid'],
+                                 satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
+                                 satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000"))
+                logging.info("\n")
+
+
+def main():
+
+    # Parse arguments
+    parser = get_parser("Automatically schedule observations on a SatNOGS station.")
+    parser.add_argument("-s", "--station", help="Ground station ID", type=int)
+    args = parser.parse_args()
+
+    if args.benchmark > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        benchmark_scheduler(args.benchmark)
+        sys.exit()
+
+    # Check arguments
+    if args.station is None:
+        parser.print_help()
+        sys.exit()
+
+    # Setting logging level
+    numeric_level = args.log_level
+    if not isinstance(numeric_level, int):
+        raise ValueError("Invalid log level")
+    logging.basicConfig(level=numeric_level,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    # Settings
+
+    ground_station_id = args.station
+    check_arguments(args)
+    cache_dir = "/tmp/cache"
+    schedule = not args.dryrun
+
+    # Set time range
+    tnow = datetime.strptime(args.starttime, "%Y-%m-%dT%H:%M:%S")
+    tmin = tnow
+    tmax = tnow + timedelta(hours=args.duration)
 
-                    schedule_observation(session, int(satpass['id']), satpass['uuid'],
-                                     ground_station_id,
-                                     satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
-                                     satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000")
-                    logging.info("\n")
+    # Create cache
+    if not os.path.isdir(cache_dir):
+        os.mkdir(cache_dir)
+
+    # Pooled API session, responses kept for conditional requests
+    set_fetcher(Fetcher(os.path.join(cache_dir, "http")))
+
+    # Get ground station information
+    ground_station = get_groundstation_info(ground_station_id, args.allow_testing)
+    if not ground_station:
+        sys.exit()
 
-                else:
-                    logging.info("\n")
+    # Printing Az window
+    logging.info('Az window set as Min(%3.0f) Max(%3.0f)' % (args.azmin, args.azmax))
 
-                    logging.info("rejecting Sat(%d) UUID(%s) Rise(%s) Set(%s)" % (int(satpass['id']),satpass['uuid'],
-                                     satpass['tr'].strftime("%Y-%m-%d %H:%M:%S") + ".000",
-                                     satpass['ts'].strftime("%Y-%m-%d %H:%M:%S") + ".000"))
-                    logging.info("\n")
+    # Transmitters and TLEs cache, updated once CACHE_AGE has passed
+    cache = CatalogueCache(os.path.join(cache_dir, "catalogue.sqlite"))
+    update_catalogue(cache, [ground_station], tnow, cache_dir)
 
+    # Set observer
+    observer, min_culmination = get_observer(ground_station, args)
+
+    # Minimum duration of a pass
+    min_pass_duration = settings.MIN_PASS_DURATION
+
+    # Read tles and transmitters
+    satellites = load_satellites(cache, ground_station_id)
+
+    # Find passes
+    passes = find_passes(satellites, observer, tmin, tmax, min_culmination, min_pass_duration,
+                         cache_dir=cache_dir)
+
+    # List of scheduled passes
+    scheduledpasses = get_scheduled_passes_from_network(ground_station_id, tmin, tmax,
+                                                        cache_dir=cache_dir)
+    logging.info("Found %d scheduled passes between %s and %s on ground station %d" %
+                 (len(scheduledpasses), tmin, tmax, ground_station_id))
+
+    # Priority and normal scheduler
+    scheduledpasses = select_passes(passes, scheduledpasses, args.priorities, args)
+
+    schedule_needed = report_passes(ground_station_id, scheduledpasses)
+
+    # Login and schedule passes
+    if schedule and schedule_needed:
+        session = network_login()
+        schedule_passes(session, ground_station_id, scheduledpasses, args.azmin, args.azmax)
 
 #*------------------------------------------------------------------------------------------------------------------------
         logging.info("All passes are scheduled. Exiting!")
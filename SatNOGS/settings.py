@@ -6,6 +6,9 @@ NETWORK_BASE_URL = config('NETWORK_BASE_URL', default='https://network.satnogs.o
 CACHE_AGE = config('CACHE_AGE', default=24)  # In hours
 MAX_NORAD_CAT_ID = config('MAX_NORAD_CAT_ID', default=90000)
 MIN_PASS_DURATION = config('MIN_PASS_DURATION', default=2)  # In minutes
+PASS_CACHE_MARGIN = config('PASS_CACHE_MARGIN', default=6)  # In hours, predicted past tmax
+MAX_OBSERVATION_HOURS = config('MAX_OBSERVATION_HOURS', default=2)  # Longest observation expected
+FIND_PASSES_PROCESSES = config('FIND_PASSES_PROCESSES', default=0)  # 0 for one per CPU
 
 # Credentials
 NETWORK_USERNAME = config('NETWORK_USERNAME', default='')
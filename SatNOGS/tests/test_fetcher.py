@@ -0,0 +1,113 @@
+import hashlib
+import http.server
+import json
+import os
+import sys
+import threading
+import urllib.parse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import Fetcher  # noqa: E402
+
+NPAGES = 4
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Paginated endpoint with ETags and 'next'/'last' links"""
+    hits = []
+    honour_etag = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        page = int(urllib.parse.parse_qs(url.query).get('page', ['1'])[0])
+        self.hits.append(page)
+        body = json.dumps([{'page': page, 'item': k} for k in range(3)]).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.honour_etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        base = 'http://127.0.0.1:%d%s' % (self.server.server_port, url.path)
+        links = ['<%s?page=%d>; rel="last"' % (base, NPAGES)]
+        if page < NPAGES:
+            links.append('<%s?page=%d>; rel="next"' % (base, page + 1))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Link', ', '.join(links))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    Handler.hits = []
+    Handler.honour_etag = True
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/api/items/' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def expected():
+    return [{'page': page, 'item': k} for page in range(1, NPAGES + 1) for k in range(3)]
+
+
+def count_stores(monkeypatch):
+    stores = []
+    store = Fetcher._store
+
+    def counting_store(self, url, entry):
+        stores.append(url)
+        store(self, url, entry)
+
+    monkeypatch.setattr(Fetcher, '_store', counting_store)
+    return stores
+
+
+def test_paginated_uses_last_link(server, tmp_path):
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get_paginated(server) == expected()
+    assert sorted(Handler.hits) == list(range(1, NPAGES + 1))
+    assert fetcher.stats['requests'] == NPAGES
+    assert fetcher.stats['not_modified'] == 0
+
+
+def test_conditional_requests(server, tmp_path, monkeypatch):
+    Fetcher(str(tmp_path)).get_paginated(server)
+    stores = count_stores(monkeypatch)
+
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get_paginated(server) == expected()
+    assert fetcher.stats['requests'] == NPAGES
+    assert fetcher.stats['not_modified'] == NPAGES
+    assert stores == []
+
+
+def test_unchanged_etag_not_rewritten(server, tmp_path, monkeypatch):
+    Fetcher(str(tmp_path)).get_paginated(server)
+    stores = count_stores(monkeypatch)
+
+    Handler.honour_etag = False
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get_paginated(server) == expected()
+    assert fetcher.stats['not_modified'] == 0
+    assert stores == []
+
+
+def test_memory_and_uncached(server, tmp_path):
+    fetcher = Fetcher(str(tmp_path))
+    fetcher.get(server, cache=False)
+    fetcher.get(server, cache=False)
+    assert Handler.hits == [1]
+    assert fetcher.stats['memory'] == 1
+    assert os.listdir(str(tmp_path)) == []
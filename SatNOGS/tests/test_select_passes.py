@@ -0,0 +1,37 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_single_station import select_passes  # noqa: E402
+from utils import ClaimIndex  # noqa: E402
+
+T0 = datetime(2024, 1, 1)
+
+
+def make_pass(norad, start, azr, azs):
+    return {'id': norad, 'uuid': 'tx%s' % norad, 'good_count': 1, 'success_rate': 1.0, 'altt': '45',
+            'tr': T0 + timedelta(minutes=start), 'ts': T0 + timedelta(minutes=start + 10),
+            'azr': str(azr), 'azs': str(azs), 'scheduled': False}
+
+
+def make_args(azmin=0, azmax=90):
+    return argparse.Namespace(azmin=azmin, azmax=azmax, only_priority=True, min_priority=0.0,
+                              scheduler='ordered', wait=0)
+
+
+def test_out_of_window_passes_not_selected():
+    passes = [make_pass('1', 0, 45, 180), make_pass('2', 30, 180, 200), make_pass('3', 60, 200, 80)]
+    scheduled = select_passes(passes, [], None, make_args())
+    assert sorted(satpass['id'] for satpass in scheduled) == ['1', '3']
+
+
+def test_out_of_window_pass_not_claimed():
+    """A pass out of one station's window must stay free for the next station"""
+    claims = ClaimIndex()
+    first = select_passes([make_pass('1', 0, 180, 200)], [], None, make_args(), claims)
+    second = select_passes([make_pass('1', 2, 45, 60)], [], None, make_args(), claims)
+    assert first == []
+    assert [satpass['id'] for satpass in second] == ['1']
@@ -9,23 +9,175 @@ import settings
 from tqdm import tqdm
 import os
 import sys
+import time
+import bisect
+import multiprocessing
+import threading
+import concurrent.futures
+import hashlib
+import json
+import sqlite3
+import urllib.parse
+
+PASS_CACHE_VERSION = 2
+OBSERVATION_CACHE_VERSION = 1
+CATALOGUE_VERSION = 1
+OBSERVATION_FIELDS = ('id', 'norad_cat_id', 'start', 'end', 'max_altitude', 'transmitter')
+
+
+class Fetcher(object):
+    """Pooled HTTP session for the SatNOGS APIs
+
+    GET requests go through one session with a connection pool shared by
+    all threads. With cache_dir every JSON response is stored on disk with
+    its ETag and Last-Modified headers, and sent back as If-None-Match /
+    If-Modified-Since so an unchanged endpoint costs a 304. Responses are
+    also kept in memory, repeated requests within a run are not resent.
+    """
+
+    def __init__(self, cache_dir=None, pool_size=8):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['user-agent'] = 'satnogs-auto-scheduler/0.0.1'
+        self.cache_dir = cache_dir
+        self.pool_size = pool_size
+        self.memory = {}
+        self.url_locks = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'memory': 0}
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _cache_file(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def _load(self, url):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_file(url), "r") as fp:
+                entry = json.load(fp)
+            if entry.get('url') == url:
+                return entry
+        except (IOError, ValueError):
+            pass
+        return None
 
+    def _store(self, url, entry):
+        if self.cache_dir is None:
+            return
+        fname = self._cache_file(url)
+        tmp = "%s.%d.%d" % (fname, os.getpid(), threading.get_ident())
+        with open(tmp, "w") as fp:
+            json.dump(entry, fp)
+        os.replace(tmp, fname)
+
+    def get(self, url, cache=True):
+        """Return (data, links) for url, links as in requests' Response.links
+
+        With cache=False the response is not kept on disk (for URLs which
+        are not requested again in later runs).
+        """
+        # Threads asking for the same url wait for the first one
+        with self.lock:
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            return self._get(url, cache)
+
+    def _get(self, url, cache):
+        with self.lock:
+            if url in self.memory:
+                self.stats['memory'] += 1
+                return self.memory[url]
+
+        entry = self._load(url) if cache else None
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        r = self.session.get(url, headers=headers)
+        with self.lock:
+            self.stats['requests'] += 1
+        if r.status_code == 304 and entry is not None:
+            logging.debug("Not modified %s" % url)
+            with self.lock:
+                self.stats['not_modified'] += 1
+        else:
+            r.raise_for_status()
+            stored = entry
+            entry = {'url': url, 'etag': r.headers.get('ETag'),
+                     'last_modified': r.headers.get('Last-Modified'),
+                     'links': r.links, 'data': r.json()}
+            # The stored copy is only rewritten when its validators changed
+            if cache and (stored is None or entry['etag'] is None or
+                          entry['etag'] != stored.get('etag')):
+                self._store(url, entry)
+
+        result = (entry['data'], entry['links'])
+        with self.lock:
+            self.memory[url] = result
+        return result
+
+    def get_json(self, url):
+        return self.get(url)[0]
+
+    def get_paginated(self, url, max_entries=None):
+        """Follow the 'next' links; when the server also gives a 'last' link
+        with a page number the remaining pages are fetched concurrently"""
+        data, links = self.get(url)
+        data = list(data)
+        last = links.get('last', {}).get('url')
+        if 'next' in links and last and not max_entries:
+            query = urllib.parse.urlsplit(last)
+            params = urllib.parse.parse_qs(query.query)
+            if 'page' in params:
+                pages = []
+                for page in range(2, int(params['page'][0]) + 1):
+                    params['page'] = [str(page)]
+                    pages.append(urllib.parse.urlunsplit(
+                        query._replace(query=urllib.parse.urlencode(params, doseq=True))))
+                for page_data in self.map(self.get_json, pages):
+                    data.extend(page_data)
+                return data
+
+        while 'next' in links and (not max_entries or len(data) < max_entries):
+            page_data, links = self.get(links['next']['url'])
+            data.extend(page_data)
+
+        return data
+
+    def map(self, function, items):
+        """function over items on a thread pool sharing the session"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.pool_size) as pool:
+            return list(pool.map(function, items))
+
+    def run(self, calls):
+        """Run independent (function, args) calls concurrently, results in order"""
+        return self.map(lambda call: call[0](*call[1]), calls)
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
+
+
+def set_fetcher(fetcher):
+    global _fetcher
+    _fetcher = fetcher
 
-def get_paginated_endpoint(url, max_entries=None):
-    r = requests.get(url=url)
-    r.raise_for_status()
-
-    data = r.json()
-
-    while 'next' in r.links and (not max_entries or len(data) < max_entries):
-        next_page_url = r.links['next']['url']
-
-        r = requests.get(url=next_page_url)
-        r.raise_for_status()
-
-        data.extend(r.json())
 
-    return data
+def get_paginated_endpoint(url, max_entries=None):
+    return get_fetcher().get_paginated(url, max_entries)
 
 
 def read_priorities_transmitters(filename):
@@ -54,12 +206,12 @@ def read_priorities_transmitters(filename):
 def get_satellite_info():
     # Open session
     logging.info("Fetching satellite information from DB.")
-    r = requests.get('{}/api/satellites'.format(settings.DB_BASE_URL))
+    satellites = get_fetcher().get_json('{}/api/satellites'.format(settings.DB_BASE_URL))
     logging.info("Satellites received!")
 
     # Select alive satellites
     norad_cat_ids = []
-    for o in r.json():
+    for o in satellites:
         if o["status"] == "alive":
             norad_cat_ids.append(o["norad_cat_id"])
 
@@ -69,12 +221,12 @@ def get_satellite_info():
 def get_active_transmitter_info(fmin, fmax):
     # Open session
     logging.info("Fetching transmitter information from DB.")
-    r = requests.get('{}/api/transmitters'.format(settings.DB_BASE_URL))
+    db_transmitters = get_fetcher().get_json('{}/api/transmitters'.format(settings.DB_BASE_URL))
     logging.info("Transmitters received!")
 
     # Loop
     transmitters = []
-    for o in r.json():
+    for o in db_transmitters:
         if o["downlink_low"]:
             if o["status"] == "active" and o["downlink_low"] > fmin and o["downlink_low"] <= fmax:
                 transmitter = {"norad_cat_id": o["norad_cat_id"], "uuid": o["uuid"], "mode": o["mode"]}
@@ -89,56 +241,112 @@ def get_transmitter_stats():
     return transmitters
 
 
-def get_scheduled_passes_from_network(ground_station, tmin, tmax):
-    # Get first page
-    client = requests.session()
-
-    # Loop
-    start = True
-    scheduledpasses = []
+def parse_iso(timestamp):
+    """Fast parser for the API timestamps, 2020-01-01T12:34:56Z"""
+    if len(timestamp) == 20 and timestamp[19] == 'Z':
+        return datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                        int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+    return datetime.fromisoformat(timestamp.replace("Z", "")).replace(tzinfo=None, microsecond=0)
+
+
+def _fetch_observations(ground_station, tfrom, tto):
+    """Observations of a station starting from tfrom, using the API start/end
+    filters. Pages come most recent first, paging stops at the first
+    observation starting before tfrom. The start/end bounds make every URL
+    unique, so the pages stay out of the HTTP disk cache (the observations
+    cache of get_scheduled_passes_from_network covers them)."""
+    url = '{}/api/observations/?ground_station={:d}&start={}&end={}'.format(
+        settings.NETWORK_BASE_URL, ground_station, tfrom.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        tto.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    observations = {}
+    while url:
+        data, links = get_fetcher().get(url, cache=False)
+        if not data:
+            break
+        for o in data:
+            if parse_iso(o['start']) >= tfrom:
+                observations[str(o['id'])] = {key: o[key] for key in OBSERVATION_FIELDS}
+        if parse_iso(data[-1]['start']) < tfrom:
+            break
+        url = links.get('next', {}).get('url')
+    return observations
 
-    logging.info("Requesting scheduled passes for ground station %d" % ground_station)
-    # Fetch observations until the time of the end of the last fetched observation happends to be
-    # before the start time of the selected timerange for scheduling
-    # NOTE: This algorithm is based on the order in which the API returns the observations, i.e.
-    # most recent observations are returned at first!
-    while True:
-        if start:
-            r = client.get('{}/api/observations/?ground_station={:d}'.format(
-                settings.NETWORK_BASE_URL, ground_station))
-            start = False
-        else:
-            nextpage = r.links.get("next")
-            r = client.get(nextpage["url"])
 
-        if not r.json():
-            # Ground station has no observations yet
-            break
+def get_scheduled_passes_from_network(ground_station, tmin, tmax, cache_dir=None):
+    """Observations of the ground station overlapping [tmin, tmax]
 
-        # r.json() is a list of dicts/observations
-        # added empty azr and azs keys in order to properly merge later with values from computed pass and be able to filter based on az window
-        for o in r.json():
-            satpass = {
-                "id": o['norad_cat_id'],
-                "tr": datetime.strptime(o['start'].replace("Z", ""), "%Y-%m-%dT%H:%M:%S"),
-                "ts": datetime.strptime(o['end'].replace("Z", ""), "%Y-%m-%dT%H:%M:%S"),
-                "scheduled": True,
-                "altt": o['max_altitude'],
-                "priority": 1,
-                "uuid": o['transmitter'],
-                "name": '',
-                "mode": '',
-                "azr":0,        
-                "azs":0
-            }
-
-            if satpass['ts'] > tmin and satpass['tr'] < tmax:
-                # Only store observations which are during the ROI for scheduling
-                scheduledpasses.append(satpass)
-
-        if satpass['ts'] < tmin:
-            # Last fetched observation is older than the ROI for scheduling, end loop.
-            break
+    Observations can only be added or removed for start times in the future,
+    so with cache_dir the known ones are kept in observations_<station>.json
+    and each run only fetches those starting after the previous sync (less a
+    margin), plus whatever part of the window was never fetched.
+    """
+    logging.info("Requesting scheduled passes for ground station %d" % ground_station)
+    span = timedelta(hours=float(settings.MAX_OBSERVATION_HOURS))
+    tnow = datetime.utcnow()
+    lo = tmin - span
+    hi = tmax + span
+
+    cache = None
+    if cache_dir is not None:
+        fname = os.path.join(cache_dir, "observations_%d.json" % ground_station)
+        try:
+            with open(fname, "r") as fp:
+                cache = json.load(fp)
+            cfrom = parse_iso(cache['from'])
+            cto = parse_iso(cache['to'])
+            synced = parse_iso(cache['synced'])
+            if cfrom <= lo and cache.get('version') == OBSERVATION_CACHE_VERSION:
+                # Only the part not known to be settled is fetched again
+                lo = max(lo, min(synced - timedelta(minutes=10), cto))
+            else:
+                cache = None
+        except (IOError, ValueError, KeyError):
+            cache = None
+
+    fetched = _fetch_observations(ground_station, lo, hi)
+
+    observations = fetched
+    if cache is not None:
+        observations = {key: o for key, o in cache['observations'].items()
+                        if parse_iso(o['start']) < lo}
+        observations.update(fetched)
+        logging.info("%d observations known, %d fetched since %s" %
+                     (len(observations) - len(fetched), len(fetched), lo))
+    if cache_dir is not None:
+        keep = tnow - timedelta(days=2) - span
+        tfrom = min(lo, parse_iso(cache['from'])) if cache is not None else lo
+        cache = {'version': OBSERVATION_CACHE_VERSION,
+                 'from': max(tfrom, keep).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                 'to': max(hi, parse_iso(cache['to']) if cache is not None else hi).strftime(
+                     "%Y-%m-%dT%H:%M:%SZ"),
+                 'synced': tnow.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                 'observations': {key: o for key, o in observations.items()
+                                  if parse_iso(o['start']) >= keep}}
+        tmp = "%s.%d" % (fname, os.getpid())
+        with open(tmp, "w") as fp:
+            json.dump(cache, fp)
+        os.replace(tmp, fname)
+
+    # added empty azr and azs keys in order to properly merge later with values from computed pass and be able to filter based on az window
+    scheduledpasses = []
+    for o in sorted(observations.values(), key=lambda o: o['start'], reverse=True):
+        satpass = {
+            "id": o['norad_cat_id'],
+            "tr": parse_iso(o['start']),
+            "ts": parse_iso(o['end']),
+            "scheduled": True,
+            "altt": o['max_altitude'],
+            "priority": 1,
+            "uuid": o['transmitter'],
+            "name": '',
+            "mode": '',
+            "azr":0,        
+            "azs":0
+        }
+
+        if satpass['ts'] > tmin and satpass['tr'] < tmax:
+            # Only store observations which are during the ROI for scheduling
+            scheduledpasses.append(satpass)
 
     logging.info("Scheduled passes for ground station %d retrieved!" % ground_station)
     return scheduledpasses
@@ -177,13 +385,168 @@ def overlap(satpass, scheduledpasses, wait_time_seconds):
     return overlap
 
 
+class PassIndex(object):
+    """Scheduled passes as [tr, ts + wait) intervals sorted by start
+
+    Gives the same answer as overlap() but only looks at the intervals that
+    start within the longest stored interval before the test pass, found by
+    bisection, instead of scanning every scheduled pass.
+    """
+
+    def __init__(self, scheduledpasses, wait_time_seconds):
+        self.wait = timedelta(seconds=wait_time_seconds)
+        self.starts = []
+        self.ends = []
+        self.longest = timedelta(0)
+        for satpass in scheduledpasses:
+            self.add(satpass)
+
+    def add(self, satpass):
+        tr = satpass['tr']
+        te = satpass['ts'] + self.wait
+        k = bisect.bisect_right(self.starts, tr)
+        self.starts.insert(k, tr)
+        self.ends.insert(k, te)
+        if te - tr > self.longest:
+            self.longest = te - tr
+
+    def overlaps(self, satpass):
+        tr = satpass['tr']
+        te = satpass['ts'] + self.wait
+        lo = bisect.bisect_left(self.starts, tr - self.longest)
+        hi = bisect.bisect_right(self.starts, te)
+        for k in range(lo, hi):
+            sr = self.starts[k]
+            se = self.ends[k]
+            # Same four cases as overlap()
+            if (sr <= tr < se) or (sr <= te < se) or (tr <= sr and se < te):
+                return True
+        return False
+
+    def intersects(self, satpass):
+        """Symmetric test, the padded intervals share any instant"""
+        tr = satpass['tr']
+        te = satpass['ts'] + self.wait
+        lo = bisect.bisect_left(self.starts, tr - self.longest)
+        hi = bisect.bisect_right(self.starts, te)
+        for k in range(lo, hi):
+            if tr <= self.ends[k]:
+                return True
+        return False
+
+
+class ClaimIndex(object):
+    """Passes claimed by any station of a batch, indexed per satellite
+
+    A pass of a satellite is taken as already claimed when its rise to set
+    window intersects the window of a pass of the same satellite claimed by
+    another station, i.e. both stations would record the same orbit.
+    """
+
+    def __init__(self):
+        self.index = {}
+
+    def add(self, satpass):
+        norad_cat_id = str(satpass['id'])
+        if norad_cat_id not in self.index:
+            self.index[norad_cat_id] = PassIndex([], 0)
+        self.index[norad_cat_id].add(satpass)
+
+    def claimed(self, satpass):
+        index = self.index.get(str(satpass['id']))
+        return index is not None and index.intersects(satpass)
+
+
 def ordered_scheduler(passes, scheduledpasses, wait_time_seconds):
     """Loop through a list of ordered passes and schedule each next one that fits"""
+    index = PassIndex(scheduledpasses, wait_time_seconds)
+
     # Loop over passes
     for satpass in passes:
         # Schedule if there is no overlap with already scheduled passes
-        if not overlap(satpass, scheduledpasses, wait_time_seconds):
+        if not index.overlaps(satpass):
             scheduledpasses.append(satpass)
+            index.add(satpass)
+
+    return scheduledpasses
+
+
+def benchmark_scheduler(npasses, days=7, wait_time_seconds=60, seed=1):
+    """Time ordered_scheduler against the linear overlap() scan on a synthetic
+    set of passes spread over some days, and check both give the same schedule"""
+    rng = random.Random(seed)
+    t0 = datetime(2020, 1, 1)
+    network = []
+    passes = []
+    for k in range(npasses):
+        tr = t0 + timedelta(seconds=rng.uniform(0, days * 86400))
+        satpass = {'id': k, 'tr': tr, 'ts': tr + timedelta(seconds=rng.uniform(120, 900)),
+                   'priority': rng.random()}
+        if k % 20 == 0:
+            network.append(satpass)
+        else:
+            passes.append(satpass)
+    passes.sort(key=lambda satpass: -satpass['priority'])
+
+    tstart = time.time()
+    reference = list(network)
+    for satpass in passes:
+        if not overlap(satpass, reference, wait_time_seconds):
+            reference.append(satpass)
+    tlinear = time.time() - tstart
+
+    tstart = time.time()
+    indexed = ordered_scheduler(passes, list(network), wait_time_seconds)
+    tindexed = time.time() - tstart
+
+    same = [satpass['id'] for satpass in reference] == [satpass['id'] for satpass in indexed]
+    logging.info("%d passes over %d days, %d scheduled: overlap() scan %.3f s, "
+                 "interval index %.3f s, same schedule: %s" %
+                 (npasses, days, len(indexed), tlinear, tindexed, same))
+    return same
+
+
+def optimal_scheduler(passes, scheduledpasses, wait_time_seconds):
+    """Schedule the set of passes with the largest total priority weighted
+    observation time (weighted interval scheduling)
+
+    Passes sharing any instant with the already scheduled ones are dropped
+    (a stricter test than overlap(), which misses a pass enclosing a scheduled
+    one when both end at the same time), the rest are
+    sorted by padded end time and for each one the best schedule either
+    takes it, on top of the best schedule of the passes ending before its
+    rise (found by bisection), or skips it.
+    """
+    index = PassIndex(scheduledpasses, wait_time_seconds)
+    wait = timedelta(seconds=wait_time_seconds)
+    candidates = sorted([satpass for satpass in passes if not index.intersects(satpass)],
+                        key=lambda satpass: satpass['ts'])
+    ends = [satpass['ts'] + wait for satpass in candidates]
+
+    best = [0.0] * (len(candidates) + 1)
+    take = [False] * len(candidates)
+    prev = [0] * len(candidates)
+    for i, satpass in enumerate(candidates):
+        # Passes [0, j) end strictly before this one rises
+        j = bisect.bisect_left(ends, satpass['tr'], 0, i)
+        weight = float(satpass['priority']) * (satpass['ts'] - satpass['tr']).total_seconds()
+        prev[i] = j
+        if best[j] + weight > best[i]:
+            best[i + 1] = best[j] + weight
+            take[i] = True
+        else:
+            best[i + 1] = best[i]
+
+    # Walk back the choices
+    chosen = []
+    i = len(candidates)
+    while i > 0:
+        if take[i - 1]:
+            chosen.append(candidates[i - 1])
+            i = prev[i - 1]
+        else:
+            i -= 1
+    scheduledpasses.extend(reversed(chosen))
 
     return scheduledpasses
 
@@ -196,6 +559,14 @@ def random_scheduler(passes, scheduledpasses, wait_time_seconds):
     return ordered_scheduler(passes, scheduledpasses, wait_time_seconds)
 
 
+# Scheduler modes selectable from schedule_single_station.py
+SCHEDULERS = {
+    'ordered': ordered_scheduler,
+    'random': random_scheduler,
+    'optimal': optimal_scheduler,
+}
+
+
 def report_efficiency(scheduledpasses, passes):
     if scheduledpasses:
         # Loop over passes
@@ -223,94 +594,256 @@ def report_efficiency(scheduledpasses, passes):
         logging.info("No appropriate passes found for scheduling.")
 
 
-def find_passes(satellites, observer, tmin, tmax, minimum_altitude, min_pass_duration):
-    # Loop over satellites
+def _predict_passes(sat, station, tmin, tmax, minimum_altitude, min_pass_duration):
+    """Passes of one satellite as a list of dicts with the TLE related fields"""
+    observer = ephem.Observer()
+    observer.lat, observer.lon, observer.elevation, observer.horizon, \
+        observer.pressure, observer.temp = station
+    observer.date = ephem.date(tmin)
+
+    # Load TLE
+    try:
+        sat_ephem = ephem.readtle(str(sat['tle0']), str(sat['tle1']), str(sat['tle2']))
+    except (ValueError, AttributeError):
+        return []
+
+    # Loop over passes
     passes = []
-    passid = 0
-    logging.info('Finding all passes for %s satellites:' % len(satellites))
-    for satellite in tqdm(satellites):
-        # Set start time
-        observer.date = ephem.date(tmin)
+    keep_digging = True
+    while keep_digging:
+        sat_ephem.compute(observer)
+        try:
+            tr, azr, tt, altt, ts, azs = observer.next_pass(sat_ephem)
+        except ValueError:
+            break  # there will be sats in our list that fall below horizon, skip
+        except TypeError:
+            break  # if there happens to be a non-EarthSatellite object in the list
+        except Exception:
+            break
 
-        # Load TLE
+        if tr is None:
+            break
+
+        # using the angles module convert the sexagesimal degree into
+        # something more easily read by a human
         try:
-            sat_ephem = ephem.readtle(str(satellite.tle0), str(satellite.tle1), str(satellite.tle2))
-        except (ValueError, AttributeError):
-            continue
+            elevation = format(math.degrees(altt), '.0f')
+            azimuth_r = format(math.degrees(azr), '.0f')
+            azimuth_s = format(math.degrees(azs), '.0f')
+        except TypeError:
+            break
 
-        # Loop over passes
-        keep_digging = True
-        while keep_digging:
-            sat_ephem.compute(observer)
-            try:
-                tr, azr, tt, altt, ts, azs = observer.next_pass(sat_ephem)
-            except ValueError:
-                break  # there will be sats in our list that fall below horizon, skip
-            except TypeError:
-                break  # if there happens to be a non-EarthSatellite object in the list
-            except Exception:
-                break
-
-            if tr is None:
-                break
-
-            # using the angles module convert the sexagesimal degree into
-            # something more easily read by a human
-            try:
-                elevation = format(math.degrees(altt), '.0f')
-                azimuth_r = format(math.degrees(azr), '.0f')
-                azimuth_s = format(math.degrees(azs), '.0f')
-            except TypeError:
-                break
-            passid += 1
-
-            pass_duration = ts.datetime() - tr.datetime()
-
-            # show only if >= configured horizon and till tmax,
-            # and not directly overhead (tr < ts see issue 199)
-
-            if tr < ephem.date(tmax):
-                if (float(elevation) >= minimum_altitude and tr < ts and
-                        pass_duration > timedelta(minutes=min_pass_duration)):
-                    valid = True
-
-                    # invalidate passes that start too soon
-                    if tr < ephem.Date(datetime.now() + timedelta(minutes=5)):
-                        valid = False
-
-                    # get pass information
-                    satpass = {
-                        'passid': passid,
-                        'mytime': str(observer.date),
-                        'name': str(satellite.name),
-                        'id': str(satellite.id),
-                        'tle1': str(satellite.tle1),
-                        'tle2': str(satellite.tle2),
-                        'tr': tr.datetime(),  # Rise time
-                        'azr': azimuth_r,  # Rise Azimuth
-                        'tt': tt.datetime(),  # Max altitude time
-                        'altt': elevation,  # Max altitude
-                        'ts': ts.datetime(),  # Set time
-                        'azs': azimuth_s,  # Set azimuth
-                        'valid': valid,
-                        'uuid': satellite.transmitter,
-                        'success_rate': satellite.success_rate,
-                        'good_count': satellite.good_count,
-                        'data_count': satellite.data_count,
-                        'mode': satellite.mode,
-                        'scheduled': False
-                    }
-                    passes.append(satpass)
-                observer.date = ephem.Date(ts).datetime() + timedelta(minutes=1)
-            else:
-                keep_digging = False
+        pass_duration = ts.datetime() - tr.datetime()
+
+        # show only if >= configured horizon and till tmax,
+        # and not directly overhead (tr < ts see issue 199)
+
+        if tr < ephem.date(tmax):
+            if (float(elevation) >= minimum_altitude and tr < ts and
+                    pass_duration > timedelta(minutes=min_pass_duration)):
+                passes.append({
+                    'mytime': str(observer.date),
+                    'tr': tr.datetime(),  # Rise time
+                    'azr': azimuth_r,  # Rise Azimuth
+                    'tt': tt.datetime(),  # Max altitude time
+                    'altt': elevation,  # Max altitude
+                    'ts': ts.datetime(),  # Set time
+                    'azs': azimuth_s,  # Set azimuth
+                })
+            observer.date = ephem.Date(ts).datetime() + timedelta(minutes=1)
+        else:
+            keep_digging = False
 
     return passes
 
 
+def _predict_chunk(job):
+    """Pool worker, predict the passes of a chunk of satellites"""
+    sats, station, tmin, tmax, minimum_altitude, min_pass_duration = job
+    return [(sat['key'], _predict_passes(sat, station, tmin, tmax, minimum_altitude,
+                                         min_pass_duration)) for sat in sats]
+
+
+PASS_TIMES = ('tr', 'tt', 'ts')
+
+
+def _load_pass_cache(fname):
+    """Pass cache from JSON (plain data only, the cache directory may be shared)"""
+    try:
+        with open(fname, "r") as fp:
+            stored = json.load(fp)
+        if stored.get('version') == PASS_CACHE_VERSION:
+            entries = {}
+            for key, entry in stored['entries']:
+                for field in ('tmin', 'tmax', 'computed'):
+                    entry[field] = datetime.fromisoformat(entry[field])
+                for orbit in entry['passes']:
+                    for field in PASS_TIMES:
+                        orbit[field] = datetime.fromisoformat(orbit[field])
+                entries[tuple(key)] = entry
+            return {'version': PASS_CACHE_VERSION, 'entries': entries}
+    except (IOError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    return {'version': PASS_CACHE_VERSION, 'entries': {}}
+
+
+def _save_pass_cache(fname, cache):
+    entries = []
+    for key, entry in cache['entries'].items():
+        stored = dict(entry)
+        for field in ('tmin', 'tmax', 'computed'):
+            stored[field] = entry[field].isoformat()
+        stored['passes'] = []
+        for orbit in entry['passes']:
+            orbit = dict(orbit)
+            for field in PASS_TIMES:
+                orbit[field] = orbit[field].isoformat()
+            stored['passes'].append(orbit)
+        entries.append((list(key), stored))
+    tmp = "%s.%d" % (fname, os.getpid())
+    with open(tmp, "w") as fp:
+        json.dump({'version': cache['version'], 'entries': entries}, fp)
+    os.replace(tmp, fname)
+
+
+def find_passes(satellites, observer, tmin, tmax, minimum_altitude, min_pass_duration,
+                cache_dir=None, processes=None):
+    """Predict the passes of all satellites between tmin and tmax (see find_passes_stations)"""
+    return find_passes_stations([(satellites, observer, tmin, tmax, minimum_altitude,
+                                  min_pass_duration)], cache_dir, processes)[0]
+
+
+def find_passes_stations(jobs, cache_dir=None, processes=None):
+    """Predict the passes for several stations at once
+
+    jobs is a list of (satellites, observer, tmin, tmax, minimum_altitude,
+    min_pass_duration), one per station, and a list of passes is returned
+    for each. The satellites of all stations are split in chunks predicted on
+    a single process pool, each worker builds its own ephem.Observer. With
+    cache_dir the orbit part of the passes is memoised on disk per satellite,
+    keyed by the TLE lines (so by TLE epoch), the station position and horizon
+    and the pass filters. Each entry covers [tmin, tmax + PASS_CACHE_MARGIN
+    hours] and is reused for CACHE_AGE hours by any run whose window falls
+    inside it. Entries are dropped once older than that or when a newer TLE
+    of the satellite is used.
+    """
+    tnow = datetime.utcnow()
+    cache = None
+    if cache_dir is not None:
+        fname = os.path.join(cache_dir, "passes.json")
+        cache = _load_pass_cache(fname)
+        max_age = timedelta(hours=float(settings.CACHE_AGE))
+
+    predicted = {}
+    current = {}
+    queued = set()
+    missing = []
+    stations = []
+    for satellites, observer, tmin, tmax, minimum_altitude, min_pass_duration in jobs:
+        station = (float(observer.lat), float(observer.lon), float(observer.elevation),
+                   float(observer.horizon), float(observer.pressure), float(observer.temp))
+        filters = station + (float(minimum_altitude), float(min_pass_duration))
+
+        sats = []
+        for satellite in satellites:
+            current[str(satellite.tle1)[2:7]] = (str(satellite.tle1), str(satellite.tle2))
+            sats.append({'key': (str(satellite.tle1), str(satellite.tle2)) + filters,
+                         'tle0': satellite.tle0, 'tle1': satellite.tle1, 'tle2': satellite.tle2})
+        stations.append(sats)
+
+        # Look up the cache
+        hits = 0
+        if cache is not None:
+            for sat in sats:
+                entry = cache['entries'].get(sat['key'])
+                if entry is not None and entry['tmin'] <= tmin and tmax <= entry['tmax'] and \
+                        tnow - entry['computed'] < max_age:
+                    predicted[sat['key']] = entry['passes']
+                    hits += 1
+            logging.info('%d of %d satellites found in the pass cache' % (hits, len(sats)))
+
+        # Jobs for the missing ones over the (extended) window
+        tend = tmax
+        if cache is not None:
+            tend = tmax + timedelta(hours=float(settings.PASS_CACHE_MARGIN))
+        todo = list({sat['key']: sat for sat in sats
+                     if sat['key'] not in predicted and sat['key'] not in queued}.values())
+        queued.update(sat['key'] for sat in todo)
+        if todo:
+            missing.append((todo, station, tmin, tend, minimum_altitude, min_pass_duration))
+
+    # Predict them all on one pool
+    if missing:
+        if processes is None:
+            processes = int(settings.FIND_PASSES_PROCESSES) or os.cpu_count() or 1
+        nsats = sum(len(todo) for todo, station, tmin, tend, minimum_altitude,
+                    min_pass_duration in missing)
+        chunks = []
+        for todo, station, tmin, tend, minimum_altitude, min_pass_duration in missing:
+            nchunk = max(1, min(len(todo), processes * 4 * len(todo) // nsats))
+            chunks.extend((todo[k::nchunk], station, tmin, tend, minimum_altitude,
+                           min_pass_duration) for k in range(nchunk))
+        logging.info('Finding all passes for %s satellites:' % nsats)
+        with multiprocessing.Pool(processes) as pool:
+            for job, result in zip(chunks, tqdm(pool.imap(_predict_chunk, chunks),
+                                                total=len(chunks))):
+                for key, satpasses in result:
+                    predicted[key] = satpasses
+                    if cache is not None:
+                        cache['entries'][key] = {'tmin': job[2], 'tmax': job[3],
+                                                 'computed': tnow, 'passes': satpasses}
+        if cache is not None:
+            # Drop expired entries and those of superseded TLEs
+            for key in [key for key, entry in cache['entries'].items()
+                        if tnow - entry['computed'] >= max_age or
+                        current.get(key[0][2:7], key[:2]) != key[:2]]:
+                del cache['entries'][key]
+            _save_pass_cache(fname, cache)
+
+    # Build the passes of each station in satellite order
+    result = []
+    tsoon = datetime.now() + timedelta(minutes=5)
+    for (satellites, observer, tmin, tmax, minimum_altitude, min_pass_duration), sats in \
+            zip(jobs, stations):
+        passes = []
+        passid = 0
+        for satellite, sat in zip(satellites, sats):
+            for orbit in predicted[sat['key']]:
+                if orbit['tr'] < tmin or orbit['tr'] >= tmax:
+                    continue
+                passid += 1
+                satpass = {
+                    'passid': passid,
+                    'name': str(satellite.name),
+                    'id': str(satellite.id),
+                    'tle1': str(satellite.tle1),
+                    'tle2': str(satellite.tle2),
+                    'valid': orbit['tr'] >= tsoon,  # invalidate passes that start too soon
+                    'uuid': satellite.transmitter,
+                    'success_rate': satellite.success_rate,
+                    'good_count': satellite.good_count,
+                    'data_count': satellite.data_count,
+                    'mode': satellite.mode,
+                    'scheduled': False
+                }
+                satpass.update(orbit)
+                passes.append(satpass)
+        result.append(passes)
+
+    return result
+
+
 def get_priority_passes(passes, priorities, favorite_transmitters, only_priority, min_priority):
     priority = []
     normal = []
+
+    # Highest number of good observations among the transmitters of each satellite
+    max_good_counts = {}
+    if only_priority:
+        for satpass in passes:
+            if satpass['good_count'] > max_good_counts.get(satpass['id'], -1):
+                max_good_counts[satpass['id']] = satpass['good_count']
+
     for satpass in passes:
         # Is this satellite a priority satellite?
         if satpass['id'] in priorities:
@@ -324,7 +857,7 @@ def get_priority_passes(passes, priorities, favorite_transmitters, only_priority
                     priority.append(satpass)
         elif only_priority:
             # Find satellite transmitter with highest number of good observations
-            max_good_count = max([s['good_count'] for s in passes if s["id"] == satpass["id"]])
+            max_good_count = max_good_counts[satpass['id']]
             if max_good_count > 0:
                 satpass['priority'] = \
                     (float(satpass['altt']) / 90.0) \
@@ -343,10 +876,10 @@ def get_groundstation_info(ground_station_id, allow_testing):
     logging.info("Requesting information for ground station %d" % ground_station_id)
 
     # Loop
-    r = requests.get("{}/api/stations/?id={:d}".format(settings.NETWORK_BASE_URL,
-                                                       ground_station_id))
+    stations = get_fetcher().get_json("{}/api/stations/?id={:d}".format(settings.NETWORK_BASE_URL,
+                                                                        ground_station_id))
 
-    selected_stations = list(filter(lambda s: s['id'] == ground_station_id, r.json()))
+    selected_stations = list(filter(lambda s: s['id'] == ground_station_id, stations))
 
     if not selected_stations:
         logging.info('No ground station information found!')
@@ -368,27 +901,95 @@ def get_groundstation_info(ground_station_id, allow_testing):
         return {}
 
 
-def get_last_update(fname):
-    try:
-        fp = open(fname, "r")
-        line = fp.readline()
-        fp.close()
-        return datetime.strptime(line.strip(), "%Y-%m-%dT%H:%M:%S")
-    except IOError:
-        return None
-
-
-def update_needed(tnow, ground_station_id, cache_dir):
-    # Get last update
-    tlast = get_last_update(os.path.join(cache_dir, "last_update_%d.txt" % ground_station_id))
-
-    if tlast is None or (tnow - tlast).total_seconds() > settings.CACHE_AGE * 3600:
-        return True
-    if not os.path.isfile(os.path.join(cache_dir, "transmitters_%d.txt" % ground_station_id)):
-        return True
-    if not os.path.isfile(os.path.join(cache_dir, "tles_%d.txt" % ground_station_id)):
-        return True
-    return False
+class CatalogueCache(object):
+    """Transmitters and TLEs cache shared by scheduler runs (SQLite)
+
+    Each station's transmitter list carries the time it was fetched, and so
+    does each TLE. Only stale TLEs are fetched again. Writes are single
+    transactions and the database runs in WAL mode, so a concurrent run
+    reads either the old or the new data, never a half-written mix. A
+    database with a different CATALOGUE_VERSION is rebuilt.
+    """
+
+    def __init__(self, fname):
+        self.db = sqlite3.connect(fname, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.db.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+            if row is None or int(row[0]) != CATALOGUE_VERSION:
+                self.db.execute("DROP TABLE IF EXISTS stations")
+                self.db.execute("DROP TABLE IF EXISTS transmitters")
+                self.db.execute("DROP TABLE IF EXISTS tles")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                                (str(CATALOGUE_VERSION),))
+            self.db.execute("CREATE TABLE IF NOT EXISTS stations "
+                            "(station INTEGER PRIMARY KEY, updated TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS transmitters "
+                            "(station INTEGER, uuid TEXT, norad_cat_id INTEGER, "
+                            "success_rate INTEGER, good_count INTEGER, data_count INTEGER, "
+                            "mode TEXT, PRIMARY KEY (station, uuid))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS tles "
+                            "(norad_cat_id INTEGER PRIMARY KEY, tle0 TEXT, tle1 TEXT, tle2 TEXT, "
+                            "updated TEXT)")
+
+    def _stale(self, updated, tnow):
+        return updated is None or \
+            (tnow - parse_iso(updated)).total_seconds() > float(settings.CACHE_AGE) * 3600
+
+    def transmitters_fresh(self, station, tnow):
+        row = self.db.execute("SELECT updated FROM stations WHERE station=?", (station,)).fetchone()
+        return row is not None and not self._stale(row[0], tnow)
+
+    def store_transmitters(self, station, rows, tnow):
+        """rows of (norad_cat_id, uuid, success_rate, good_count, data_count, mode)"""
+        with self.db:
+            self.db.execute("DELETE FROM transmitters WHERE station=?", (station,))
+            self.db.executemany("INSERT OR REPLACE INTO transmitters VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(station, uuid, norad_cat_id, success_rate, good_count,
+                                  data_count, mode)
+                                 for norad_cat_id, uuid, success_rate, good_count, data_count,
+                                 mode in rows])
+            self.db.execute("INSERT OR REPLACE INTO stations VALUES (?, ?)",
+                            (station, tnow.strftime("%Y-%m-%dT%H:%M:%SZ")))
+
+    def norad_cat_ids(self, station):
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT norad_cat_id FROM transmitters WHERE station=? AND norad_cat_id<? "
+            "ORDER BY norad_cat_id", (station, int(settings.MAX_NORAD_CAT_ID)))]
+
+    def stale_tles(self, norad_cat_ids, tnow):
+        updated = dict(self.db.execute("SELECT norad_cat_id, updated FROM tles"))
+        return [norad_cat_id for norad_cat_id in norad_cat_ids
+                if self._stale(updated.get(norad_cat_id), tnow)]
+
+    def store_tles(self, tles, tnow):
+        """tles as returned by fetch_tles, {norad_cat_id: (source, (tle0, tle1, tle2))}"""
+        stamp = tnow.strftime("%Y-%m-%dT%H:%M:%SZ")
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO tles VALUES (?, ?, ?, ?, ?)",
+                                [(norad_cat_id, tle[0], tle[1], tle[2], stamp)
+                                 for norad_cat_id, (source, tle) in tles.items()])
+
+    def read(self, station):
+        """TLEs and transmitter rows of a station from one consistent snapshot"""
+        with self.db:
+            self.db.execute("BEGIN")
+            tles = self.db.execute(
+                "SELECT tle0, tle1, tle2 FROM tles WHERE norad_cat_id IN "
+                "(SELECT norad_cat_id FROM transmitters WHERE station=?)", (station,)).fetchall()
+            transmitters = self.db.execute(
+                "SELECT norad_cat_id, uuid, success_rate, good_count, data_count, mode "
+                "FROM transmitters WHERE station=? ORDER BY rowid", (station,)).fetchall()
+        return tles, transmitters
+
+    def export_transmitters(self, station, fname):
+        """Text copy of the station transmitters (used by planSatNOGS.sh)"""
+        tmp = "%s.%d" % (fname, os.getpid())
+        with open(tmp, "w") as fp:
+            for row in self.read(station)[1]:
+                fp.write("%05d %s %d %d %d %s\n" % row)
+        os.replace(tmp, fname)
 
 
 def schedule_observation(session, norad_cat_id, uuid, ground_station_id, starttime, endtime):
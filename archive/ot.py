@@ -35,6 +35,7 @@ import datetime
 import binascii
 import inspect
 import fcntl
+import selectors
 import signal
 import psutil
 #*----------------------------------------------------------------------------
@@ -58,8 +59,10 @@ ft817_modes={ 0x00 : 'LSB',
 #*----------------------------------------------------------------------------
 #* Embedded commands for USB
 #*----------------------------------------------------------------------------
-cmdRtlSDR="rtl_sdr -s 1200000 -f %LO%  -D 2 - | csdr convert_u8_f | ncat -4l 4952 -k --send-only --allow 127.0.0.1"
-cmdDecoderUSB="ncat -v 127.0.0.1 4952 |csdr shift_addition_cc `python -c \"print float(%LO%-%FREQ%)/%SAMPLE%\"` | csdr fir_decimate_cc 25 0.05 HAMMING | csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | csdr convert_f_s16 | mplayer -nocache -rawaudio samplesize=2:channels=1:rate=48000 -demuxer rawaudio -"
+#*--- the dongle stream is fanned out thru the shared memory IQ hub (python/iqhub.py) instead of ncat
+IQHUB=os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","python","iqhub.py")
+cmdRtlSDR="rtl_sdr -s 1200000 -f %LO%  -D 2 - | python3 "+IQHUB+" --hub OT"
+cmdDecoderUSB="python3 "+IQHUB+" --attach OT | csdr convert_u8_f | csdr shift_addition_cc `python -c \"print float(%LO%-%FREQ%)/%SAMPLE%\"` | csdr fir_decimate_cc 25 0.05 HAMMING | csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | csdr convert_f_s16 | mplayer -nocache -rawaudio samplesize=2:channels=1:rate=48000 -demuxer rawaudio -"
 cmdEncoderUSB="arecord -c1 -r48000 -D default -fS16_LE - | csdr convert_i16_f | csdr fir_interpolate_cc 2 | csdr dsb_fc | csdr bandpass_fir_fft_cc 0.002 0.06 0.01 | csdr fastagc_ff  | sudo ./sendiq -i /dev/stdin -s 96000 -f %FREQ% -t float"
 
 pRX1=0
@@ -85,21 +88,52 @@ def killProc(p):
    except Exception as exception:
      pass
 #*-----------------------------------------------------------------------------------------------
+#* waitProcs
+#* waiting for several processes to start, each looking for its own OK string
+#* The stdout of all of them is watched thru a selector so no CPU is spent while
+#* waiting; the OK string is matched across chunk boundaries and a process is
+#* given up as soon as its output reaches EOF (died) or the timeout expires
+#* Returns a list with 0 (started) or -1 (failed) for each (p,stOK) pair
+#*-----------------------------------------------------------------------------------------------
+def waitProcs(plist,timeout):
+    sel=selectors.DefaultSelector()
+    rc=[-1]*len(plist)
+    for i,(p,stOK) in enumerate(plist):
+        log(2,"waitProc: waiting for string(%s) for timeout(%d)" % (stOK,timeout))
+        fd=p.stdout.fileno()
+        os.set_blocking(fd,False)
+        sel.register(fd,selectors.EVENT_READ,[i,p,stOK.encode(),b''])
+    ts=time.time()
+    while len(sel.get_map())>0:
+        remaining=timeout-(time.time()-ts)
+        if remaining<=0:
+           break
+        for key,ev in sel.select(remaining):
+            (i,p,ok,tail)=key.data
+            try:
+               data=os.read(key.fd,4096)
+            except BlockingIOError:
+               continue
+            if len(data)==0:
+               log(0,"waitProc: process PID(%d) terminated rc(%s) before OK string (%s)" % (p.pid,p.poll(),ok.decode()))
+               sel.unregister(key.fd)
+               continue
+            buf=tail+data
+            if buf.find(ok) != -1:
+               log(2,"waitProc: process PID(%d) found OK string (%s)" % (p.pid,ok.decode()))
+               rc[i]=0
+               sel.unregister(key.fd)
+               continue
+            log(1,data.decode(errors="replace").replace("\n",""))
+            key.data[3]=buf[-(len(ok)-1):] if len(ok)>1 else b''
+    sel.close()
+    return rc
+#*-----------------------------------------------------------------------------------------------
 #* waitProc
 #* waiting for a process to start looking for a given string
 #*-----------------------------------------------------------------------------------------------
 def waitProc(p,stOK,timeout):
-    log(2,"waitProc: waiting for string(%s) for timeout(%d)" % (stOK,timeout))
-    ts=time.time()
-    while (time.time()-ts) <= timeout:
-        s=non_block_read(p.stdout)
-        if s!="":
-           if s.find(stOK) != -1:
-              log(2,"waitProc: process (%s) found OK string (%s)" % (str(psutil.Process(p.pid)),stOK))
-              return 0
-           else:
-              log(1,s.replace("\n",""))
-    return -1
+    return waitProcs([(p,stOK)],timeout)[0]
 #*------------------------------------------------------------------------------------------------
 def startProc(cmd,stOK):
     log(2,"startProc: cmd(%s) OK(%s)" % (cmd,stOK))
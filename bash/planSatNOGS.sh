@@ -3,25 +3,31 @@
 #* planSatNOGS.sh
 #*
 #* Script to load SatNOGS observations automatically
+#* All stations in IDS are scheduled by a single run sharing the
+#* catalogue and the pass prediction, with -C a satellite pass is
+#* not scheduled on more than one of them
 #*
 #*--------------------------------------------------------------------
-ID=499
+IDS="499"
 TIME=1.2
-PRIORITY="priorities_$ID.txt"
-TRANSMITTERS="/tmp/cache/transmitters_$ID.txt"
-OPS=" -T -f -l INFO"
+PRIORITY="priorities_%d.txt"
+OPS=" -T -f -l INFO -C"
 MODES="CW"
 echo "*********************"
 echo "* Set priorities    *"
 echo "*********************"
-rm -r $PRIORITY
-for mode in $MODES; do
-    echo "Selecting priority for Mode($mode)"
-    awk '{if ($3>=80) print $0 }' $TRANSMITTERS | grep -e $mode | awk '{printf("%s 1.0 %s\n",$1,$2)}' | tee -a $PRIORITY
+for ID in $IDS; do
+    PRIORITYFILE=$(printf $PRIORITY $ID)
+    TRANSMITTERS="/tmp/cache/transmitters_$ID.txt"
+    rm -f $PRIORITYFILE
+    for mode in $MODES; do
+        echo "Selecting priority for Station($ID) Mode($mode)"
+        awk '{if ($3>=80) print $0 }' $TRANSMITTERS | grep -e $mode | awk '{printf("%s 1.0 %s\n",$1,$2)}' | tee -a $PRIORITYFILE
+    done
 done
 echo "*********************"
 echo "* Scheduling passes *"
 echo "*********************"
-python /home/pi/satnogs-auto-scheduler/schedule_single_station.py -s $ID -d $TIME -P $PRIORITY $OPS 
+python /home/pi/satnogs-auto-scheduler/schedule_multiple_stations.py -s $IDS -d $TIME -P $PRIORITY $OPS 
 
 exit 0
@@ -30,6 +30,8 @@
 #* Import libraries
 #*-----------------------------------------------------------------------------$
 import serial
+import asyncio
+import tty
 import zipfile
 import os
 import glob
@@ -43,6 +45,10 @@ import datetime
 import binascii
 import inspect
 import fcntl
+import struct
+import selectors
+import shlex
+import threading
 import signal
 import psutil
 #*----------------------------------------------------------------------------
@@ -62,8 +68,12 @@ ft817_modes={ 0x00 : 'LSB',
 #* Prototype commands
 #*----------------------------------------------------------------------------
 #cmdRXUSB="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f | csdr shift_addition_cc `python -c "print float(%LO%-%FREQ%)/%SAMPLE%"`| csdr fir_decimate_cc 25 0.05 HAMMING | csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | csdr convert_f_s16 | aplay -t raw -f S16_LE -c1 -r48000"
-cmdRXLSB="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f "
-cmdRXUSB="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f "
+#*--- shift_addition_cc takes its shift rate from %FIFO% so the receiver can be retuned in place
+cmdRXLSB="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f | csdr shift_addition_cc --fifo %FIFO% | csdr fir_decimate_cc 25 0.05 HAMMING | csdr bandpass_fir_fft_cc -0.5 0 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | csdr convert_f_s16 | aplay -t raw -f S16_LE -c1 -r48000"
+cmdRXUSB="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f | csdr shift_addition_cc --fifo %FIFO% | csdr fir_decimate_cc 25 0.05 HAMMING | csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | csdr convert_f_s16 | aplay -t raw -f S16_LE -c1 -r48000"
+#*--- Same receivers with the in-process NumPy demodulator (ssbdemod.py) instead of the csdr chain
+cmdRXLSBNP="rtl_sdr -s 1200000 -f %LO% -D 2 - | python3 %DIR%/ssbdemod.py -m LSB --fifo %FIFO% | aplay -t raw -f S16_LE -c1 -r48000"
+cmdRXUSBNP="rtl_sdr -s 1200000 -f %LO% -D 2 - | python3 %DIR%/ssbdemod.py -m USB --fifo %FIFO% | aplay -t raw -f S16_LE -c1 -r48000"
 cmdRXCW="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f "
 cmdRXCWR="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f "
 cmdRXAM="rtl_sdr -s 1200000 -f %LO% -D 2 - | csdr convert_u8_f "
@@ -82,6 +92,7 @@ cmdTXPKT="arecord -c1 -r48000 -D ault -fS16_LE - | csdr convert_i16_f | csdr fir
 pRX=None
 pTX=None
 z=None
+shiftFd=None
 
 #*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=
 #*                    PROCESS MANAGEMENT FUNCTIONS
@@ -100,50 +111,110 @@ def non_block_read(output):
     except:
         return ""
 
+#*----------------------------------------------------------------------------
+#* sudoSignal
+#* Signal processes this user is not allowed to (i.e. sendiq run under sudo),
+#* thru sudo itself, the whole process group of the stage when given
+#*----------------------------------------------------------------------------
+def sudoSignal(pids,sig,pgid=None):
+   args=["sudo","-n","kill","-s",sig,"--"]
+   if pgid != None:
+      args.append("-%d" % pgid)
+   args=args+[str(x) for x in pids]
+   log(2,"sudoSignal: %s",' '.join(args))
+   try:
+     subprocess.run(args,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,timeout=5)
+   except (OSError,subprocess.SubprocessError) as e:
+     log(0,"sudoSignal: unable to signal(%s) PID%s %s",sig,pids,repr(e))
+
 #*----------------------------------------------------------------------------
 #* Exception and Termination handler
+#* Children are killed before the parent, the ones owned by root (sudo) are
+#* killed thru sudoSignal along with the stage process group
 #*----------------------------------------------------------------------------
 def killProc(p):
 
    if p == None:
       log(0,"killProc: process found as None)")
       return
+   if isinstance(p,sdrPipeline):
+      p.stop()
+      return
    try:
      parent = psutil.Process(p.pid)
-     log(2,"killProc: process %s)" % parent)
-     for child in parent.children(recursive=True):  # or parent.children() for recursive=False
-       log(2,"killProc:     -- child(%s)" % child)
-       child.kill()
-     parent.kill()
-   except UnboundLocalError as error:
-     log(0,"killProc: Unable to kill parent PID")
-   except NameError as error:
-     log(2,"killProc: Allocation error")
-   except Exception as exception:
-     pass
+     procs = parent.children(recursive=True)+[parent]
+     pgid = os.getpgid(p.pid)
+   except (psutil.NoSuchProcess,ProcessLookupError):
+     return
+   if pgid != p.pid:                        #*-- not a group of its own, do not signal it
+      pgid=None
+   log(2,"killProc: process %s)",parent)
+   denied=[]
+   for proc in procs:
+     log(2,"killProc:     -- %s",proc)
+     try:
+       proc.kill()
+     except psutil.NoSuchProcess:
+       pass
+     except psutil.AccessDenied:
+       denied.append(proc.pid)
+   if len(denied)>0:
+      log(1,"killProc: PID%s not owned, killing thru sudo",denied)
+      sudoSignal(denied,"KILL",pgid)
+#*-----------------------------------------------------------------------------------------------
+#* waitProcs
+#* waiting for several processes to start, each looking for its own OK string
+#* The stdout of all of them is watched thru a selector so no CPU is spent while
+#* waiting; the OK string is matched across chunk boundaries and a process is
+#* given up as soon as its output reaches EOF (died) or the timeout expires
+#* Returns a list with 0 (started) or -1 (failed) for each (p,stOK) pair
+#*-----------------------------------------------------------------------------------------------
+def waitProcs(plist,timeout):
+    sel=selectors.DefaultSelector()
+    rc=[-1]*len(plist)
+    for i,(p,stOK) in enumerate(plist):
+        log(2,"waitProc: waiting for string(%s) for timeout(%d)",stOK,timeout)
+        fd=p.stdout.fileno()
+        os.set_blocking(fd,False)
+        sel.register(fd,selectors.EVENT_READ,[i,p,stOK.encode(),b''])
+    ts=time.time()
+    while len(sel.get_map())>0:
+        remaining=timeout-(time.time()-ts)
+        if remaining<=0:
+           break
+        for key,ev in sel.select(remaining):
+            (i,p,ok,tail)=key.data
+            try:
+               data=os.read(key.fd,4096)
+            except BlockingIOError:
+               continue
+            if len(data)==0:
+               log(0,"waitProc: process PID(%d) terminated rc(%s) before OK string (%s)",p.pid,p.poll(),ok.decode())
+               sel.unregister(key.fd)
+               continue
+            buf=tail+data
+            if buf.find(ok) != -1:
+               log(2,"waitProc: process PID(%d) found OK string (%s)",p.pid,ok.decode())
+               rc[i]=0
+               sel.unregister(key.fd)
+               continue
+            log(1,data.decode(errors="replace").replace("\n",""))
+            key.data[3]=buf[-(len(ok)-1):] if len(ok)>1 else b''
+    sel.close()
+    return rc
 #*-----------------------------------------------------------------------------------------------
 #* waitProc
 #* waiting for a process to start looking for a given string
 #*-----------------------------------------------------------------------------------------------
 def waitProc(p,stOK,timeout):
-    log(2,"waitProc: waiting for string(%s) for timeout(%d)" % (stOK,timeout))
-    ts=time.time()
-    while (time.time()-ts) <= timeout:
-        s=non_block_read(p.stdout)
-        if s!="":
-           if s.find(stOK) != -1:
-              log(2,"waitProc: process (%s) found OK string (%s)" % (str(psutil.Process(p.pid)),stOK))
-              return 0
-           else:
-              log(1,s.replace("\n",""))
-    return -1
+    return waitProcs([(p,stOK)],timeout)[0]
 #*------------------------------------------------------------------------------------------------
 #* startProc
 #* Start a process with the given command and waits till an Ok string is detected
 #*------------------------------------------------------------------------------------------------
 
 def startProc(cmd,stOK):
-    log(2,"startProc: cmd(%s) OK(%s)" % (cmd,stOK))
+    log(2,"startProc: cmd(%s) OK(%s)",cmd,stOK)
     p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     if waitProc(p,stOK,WAIT_IDLE) == 0:
        log(1,"startProc: Process successfully launched")
@@ -151,7 +222,294 @@ def startProc(cmd,stOK):
     log(0,"startProc: failed to launch process *ABORT*")
     raise Exception('startProc: general exceptions not caught by specific handling')
     return None
+#*------------------------------------------------------------------------------------------------
+#* startProcs
+#* Start several processes at once and wait for all of them in parallel, every
+#* (cmd,stOK) pair gets the whole WAIT_IDLE budget instead of paying one per launch
+#*------------------------------------------------------------------------------------------------
+
+def startProcs(clist):
+    plist=[]
+    for (cmd,stOK) in clist:
+        log(2,"startProcs: cmd(%s) OK(%s)",cmd,stOK)
+        plist.append((subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT),stOK))
+    rc=waitProcs(plist,WAIT_IDLE)
+    if -1 in rc:
+       log(0,"startProcs: failed to launch process *ABORT*")
+       for (p,stOK) in plist:
+           killProc(p)
+       raise Exception('startProcs: general exceptions not caught by specific handling')
+    log(1,"startProcs: %d processes successfully launched",len(plist))
+    return [p for (p,stOK) in plist]
        
+#*------------------------------------------------------------------------------------------------
+#* sdrPipeline
+#* Supervised SDR pipeline, the shell pipeline string is split into stages and
+#* each stage is launched (no shell) with its stdin/stdout chained to its
+#* neighbours, so every stage process is owned and can be checked, paused and
+#* accounted individually. Stage stderr is collected on a single pipe used to
+#* detect readiness (stOK) and then drained to the log.
+#* A pipeline can be paused (all stages and their children SIGSTOPped) to be
+#* kept as a warm standby and resumed in milliseconds.
+#* A gated pipeline (TX) never launches its last stage (sendiq) on start, a
+#* SIGSTOPped sendiq keeps its clock running and radiating, so the RF stage is
+#* only launched on key() reading from the pipe held open by the pipeline and
+#* killed on unkey(); the audio and DSP stages are the ones kept warm.
+#* Stage macros (%LO%, %FREQ%, ...) are expanded as each stage is launched, so
+#* a restart or a key() picks the current frequencies up.
+#* Every stage is a process group of its own, so stages run under sudo can be
+#* signalled as a group (see killProc).
+#* Since stages are chained thru pipes a stage can not be replaced alone, when
+#* any stage dies the supervisor restarts the whole pipeline.
+#*------------------------------------------------------------------------------------------------
+sdrPipelines=[]
+SUPERVISE_PERIOD=2
+SUPERVISE_HEALTH=2                      #*-- log level of the per period health report
+
+class sdrPipeline:
+    def __init__(self,name,cmd,stOK=None,gated=False,expand=None):
+        self.name=name
+        self.cmd=cmd
+        self.expand=expand
+        self.stOK=stOK
+        self.stages=[x.strip() for x in cmd.split("|")]
+        self.gated=gated and len(self.stages)>1
+        self.procs=[]
+        self.rf=None
+        self.gate=None
+        self.errw=None
+        self.keyed=False
+        self.rfCmd=None
+        self.pid=None
+        self.stdout=None
+        self.running=False
+        self.paused=False
+        self.restarts=0
+        self.started=0
+        self.io={}
+        self.lock=threading.RLock()
+
+    def stage(self,i):
+        if self.expand == None:
+           return self.stages[i]
+        return self.expand(self.stages[i])
+
+    def start(self):
+        with self.lock:
+           (r,w)=os.pipe()
+           prev=None
+           self.procs=[]
+           n=len(self.stages)
+           if self.gated:
+              n=n-1                     #*-- RF stage left to key()
+           for i in range(n):
+               if i==len(self.stages)-1:
+                  out=subprocess.DEVNULL
+               else:
+                  out=subprocess.PIPE
+               p=subprocess.Popen(shlex.split(self.stage(i)),stdin=prev,stdout=out,stderr=w,start_new_session=True)
+               if prev != None:
+                  prev.close()          #*-- only the stages keep the pipe ends
+               prev=p.stdout
+               self.procs.append(p)
+           if self.gated:
+              self.gate=prev            #*-- held open, the RF stage reads it once keyed
+              self.errw=w
+           else:
+              os.close(w)
+           self.pid=self.procs[0].pid
+           self.stdout=os.fdopen(r,'rb',0)
+           self.started=time.time()
+           self.running=True
+           self.paused=False
+           if self.stOK != None and waitProcs([(self,self.stOK)],WAIT_IDLE)[0] != 0:
+              self.stop()
+              raise Exception('sdrPipeline: %s failed to start' % self.name)
+           threading.Thread(target=self.drain,args=(self.stdout,),daemon=True).start()
+           if self not in sdrPipelines:
+              sdrPipelines.append(self)
+           log(1,"sdrPipeline: %s started %d stages",self.name,len(self.procs))
+        return self
+
+    def drain(self,f):
+        os.set_blocking(f.fileno(),True)
+        for line in f:
+            log(2,"sdrPipeline: %s %s",self.name,line.decode(errors="replace").replace("\n",""))
+        f.close()
+
+    def poll(self):
+        for p in self.procs:
+            rc=p.poll()
+            if rc != None:
+               return rc
+        return None
+
+    def stop(self):
+        with self.lock:
+           self.running=False
+           if self in sdrPipelines:
+              sdrPipelines.remove(self)
+           for p in self.procs:
+               killProc(p)
+           for p in self.procs:
+               try:
+                  p.wait(timeout=1)
+               except subprocess.TimeoutExpired:
+                  log(0,"sdrPipeline: %s stage PID(%d) did not terminate",self.name,p.pid)
+           self.procs=[]
+           self.rf=None
+           self.keyed=False
+           for f in (self.gate,self.errw):
+               if f == None:
+                  continue
+               try:
+                  if isinstance(f,int):
+                     os.close(f)
+                  else:
+                     f.close()
+               except OSError:
+                  pass
+           self.gate=None
+           self.errw=None
+           log(1,"sdrPipeline: %s stopped",self.name)
+
+    def restart(self):
+        with self.lock:
+           paused=self.paused
+           keyed=self.keyed
+           self.stop()
+           self.restarts=self.restarts+1
+           self.start()
+           if keyed:
+              self.key()
+           elif paused:
+              self.pause()
+
+#*--- Gated pipelines, launch (key) and kill (unkey) the RF stage
+
+    def key(self):
+        with self.lock:
+           if not self.gated or self.keyed or self.gate == None:
+              return
+           fd=self.gate.fileno()
+           os.set_blocking(fd,False)            #*-- drop audio queued while on standby
+           try:
+              while len(os.read(fd,65536))>0:
+                 pass
+           except BlockingIOError:
+              pass
+           os.set_blocking(fd,True)             #*-- shared with the RF stage, restore it
+           self.rfCmd=self.stage(-1)
+           self.rf=subprocess.Popen(shlex.split(self.rfCmd),stdin=self.gate,stdout=subprocess.DEVNULL,stderr=self.errw,start_new_session=True)
+           self.procs.append(self.rf)
+           self.keyed=True
+           self.resume()
+           log(1,"sdrPipeline: %s keyed PID(%d)",self.name,self.rf.pid)
+
+    def unkey(self):
+        with self.lock:
+           if not self.keyed:
+              return
+           rf=self.rf
+           self.procs.remove(rf)
+           self.rf=None
+           self.keyed=False
+           killProc(rf)
+           try:
+              rf.wait(timeout=1)
+           except subprocess.TimeoutExpired:
+              log(0,"sdrPipeline: %s RF stage PID(%d) did not terminate",self.name,rf.pid)
+           self.pause()
+           log(1,"sdrPipeline: %s unkeyed",self.name)
+
+    def retune(self):                           #*-- relaunch a keyed RF stage if its command changed
+        with self.lock:
+           if not self.keyed or self.stage(-1) == self.rfCmd:
+              return False
+           self.unkey()
+           self.key()
+           return True
+
+    def signal(self,resume):
+        if resume:
+           sig="CONT"
+        else:
+           sig="STOP"
+        for p in self.procs:
+            denied=[]
+            try:
+               parent=psutil.Process(p.pid)
+               for proc in [parent]+parent.children(recursive=True):
+                   try:
+                      if resume:
+                         proc.resume()
+                      else:
+                         proc.suspend()
+                   except psutil.AccessDenied:
+                      denied.append(proc.pid)
+            except psutil.Error as e:
+               log(0,"sdrPipeline: %s unable to signal PID(%d) %s",self.name,p.pid,repr(e))
+            if len(denied)>0:
+               sudoSignal(denied,sig,p.pid)
+
+    def pause(self):
+        with self.lock:
+           self.signal(False)
+           self.paused=True
+
+    def resume(self):
+        with self.lock:
+           self.signal(True)
+           self.paused=False
+
+#*--- Per stage health and throughput (bytes/sec read and written since last call)
+
+    def health(self):
+        h=[]
+        t=time.time()
+        for i,p in enumerate(self.procs):
+            st={'stage':self.stages[i].split(" ")[0],'pid':p.pid,'alive':p.poll()==None,'rd':0,'wr':0,'rdps':0.0,'wrps':0.0}
+            try:
+               c=psutil.Process(p.pid).io_counters()
+               st['rd']=c.read_chars
+               st['wr']=c.write_chars
+               if p.pid in self.io:
+                  (tp,rp,wp)=self.io[p.pid]
+                  if t>tp:
+                     st['rdps']=(st['rd']-rp)/(t-tp)
+                     st['wrps']=(st['wr']-wp)/(t-tp)
+               self.io[p.pid]=(t,st['rd'],st['wr'])
+            except (psutil.Error,AttributeError):
+               pass
+            h.append(st)
+        return h
+
+    def putHealth(self,d):
+        if d>DEBUGLEVEL:                        #*-- health() polls psutil for every stage
+           return
+        log(d,"sdrPipeline: %s running(%s) paused(%s) keyed(%s) restarts(%d) up(%d s)",self.name,self.running,self.paused,self.keyed,self.restarts,time.time()-self.started)
+        for st in self.health():
+            log(d,"sdrPipeline:    -- %s PID(%d) alive(%s) in(%.0f B/s) out(%.0f B/s)",st['stage'].ljust(10," "),st['pid'],st['alive'],st['rdps'],st['wrps'])
+
+#*------------------------------------------------------------------------------------------------
+#* superviseSDR
+#* Supervisor thread, restarts any running pipeline with a dead stage, the
+#* health report (psutil polling of every stage) only runs at -v SUPERVISE_HEALTH
+#*------------------------------------------------------------------------------------------------
+def superviseSDR():
+    while True:
+        time.sleep(SUPERVISE_PERIOD)
+        for pl in list(sdrPipelines):
+            with pl.lock:
+               if pl.running and pl.poll() != None:
+                  log(0,"superviseSDR: %s stage died rc(%s), restarting",pl.name,pl.poll())
+                  try:
+                     pl.restart()
+                  except Exception as e:
+                     log(0,"superviseSDR: %s restart failed %s",pl.name,repr(e))
+            if DEBUGLEVEL>=SUPERVISE_HEALTH:
+               pl.putHealth(SUPERVISE_HEALTH)
+
 #*-----------------------------------------------------------------------------
 #* killProcList  (CANDIDATE TO REMOVE)
 #* find all matches to a given process name or substring and then kill them all
@@ -175,6 +533,7 @@ def startProc(cmd,stOK):
 #*----------------------------------------------------------------------------
 def signal_handler(sig, frame):
    log(0,"signal_handler: Transceiver is being terminated, clean up completed!")
+   retuneReport()
    try:
      if pRX != None:
         killProc(pRX)
@@ -194,24 +553,27 @@ def signal_handler(sig, frame):
    except:
      log(0,"signal_handler: unable to kill virtual serial port (CAT)")
    
-sys.exit(0)
+   sys.exit(0)
 #*-------------------------------------------------------------------------
 #* Exception management
 #*-------------------------------------------------------------------------
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
+signal.signal(signal.SIGUSR1, lambda sig,frame: trace_handler(sig,frame))
 #*----------------------------------------------------------------------------
 #* SDR Configuration Topology Dictionary
 #* Pointers to implemented SDR processors (only USB so far)
+#* [receiver, transmitter, NumPy receiver alternative ("" if none)]
 #*----------------------------------------------------------------------------
-sdr_modes={ 0x00 : [cmdRXLSB,cmdTXLSB] ,
-            0x01 : [cmdRXUSB,cmdTXUSB],
-            0x02 : [cmdRXCW,cmdTXCW],
-            0x03 : [cmdRXCWR,cmdTXCWR],
-            0x04 : [cmdRXAM,cmdTXAM],
-            0x08 : [cmdRXFM,cmdTXFM],
-            0x0A : [cmdRXDIG,cmdTXDIG],
-            0x0C : [cmdRXPKT,cmdTXPKT]}
+sdr_modes={ 0x00 : [cmdRXLSB,cmdTXLSB,cmdRXLSBNP] ,
+            0x01 : [cmdRXUSB,cmdTXUSB,cmdRXUSBNP],
+            0x02 : [cmdRXCW,cmdTXCW,""],
+            0x03 : [cmdRXCWR,cmdTXCWR,""],
+            0x04 : [cmdRXAM,cmdTXAM,""],
+            0x08 : [cmdRXFM,cmdTXFM,""],
+            0x0A : [cmdRXDIG,cmdTXDIG,""],
+            0x0C : [cmdRXPKT,cmdTXPKT,""]}
+OTDIR=os.path.dirname(os.path.abspath(__file__))
 #*----------------------------------------------------------------------------
 #* Transceiver state variables
 #*----------------------------------------------------------------------------
@@ -225,16 +587,26 @@ MODE=0x01
 LOCK=False
 CLAR=False
 LO=14100000
+LO_OFFSET=26000
 SAMPLE=1200000
+RX_GUARD=24000
+SHIFT_FIFO="/tmp/ot817.shift"
 TIME_LIMIT=2
 WAIT_IDLE=5
+CAT_TIMEOUT=0.2
+CAT_MAXBUFFER=320
+CAT_TRACE_FILE="/tmp/ot817.trace"
 DEBUGLEVEL=0
 
 #*----------------------------------------------------------------------------
 #* Function definitions
 #*----------------------------------------------------------------------------
-def log(d,logText):
+#*--- Arguments are only formatted into logText when the level is emitted
+
+def log(d,logText,*args):
     if d<=DEBUGLEVEL:
+       if len(args)>0:
+          logText=logText % args
        print("%s:%s %s" % (sys.argv[0],time.ctime(),logText))
 
 #*----------------------------------------------------------------------------
@@ -253,7 +625,7 @@ def execute(cmd):
     rc = p.wait()
 
     if rc != 0:
-        log(0,"Error: failed to execute command: %s" % cmd)
+        log(0,"Error: failed to execute command: %s",cmd)
         log(0,error)
     return result
 #*-----------------------------------------------------------------------
@@ -261,14 +633,56 @@ def execute(cmd):
 #* used to dump content of byte array used for CAT commands and responses
 #*-----------------------------------------------------------------------
 def printBuffer(rx):
-    i=0
-    o=''
-    while i<len(rx):
-      j=rx[i]
-      h=hex(j)[2:].zfill(2)
-      o=o+' '+h
-      i=i+1
-    return o
+    if len(rx)==0:
+       return ''
+    return ' '+bytes(rx).hex(' ')
+#*-----------------------------------------------------------------------
+#* hexBuffer
+#* printBuffer deferred till the log record is actually emitted
+#*-----------------------------------------------------------------------
+class hexBuffer:
+    __slots__=('rx',)
+    def __init__(self,rx):
+        self.rx=rx
+
+    def __str__(self):
+        return printBuffer(self.rx)
+#*-----------------------------------------------------------------------
+#* catTrace
+#* Binary ring of the last n CAT frames (timestamp + 5 bytes), recording
+#* costs a pack_into; text is only produced when dumped (on SIGUSR1)
+#*-----------------------------------------------------------------------
+CAT_TRACE_REC=struct.Struct("<d5s")
+
+class catTrace:
+    def __init__(self,n):
+        self.n=n
+        self.buf=bytearray(n*CAT_TRACE_REC.size)
+        self.count=0
+
+    def record(self,frame):
+        CAT_TRACE_REC.pack_into(self.buf,(self.count%self.n)*CAT_TRACE_REC.size,time.time(),bytes(frame))
+        self.count=self.count+1
+
+    def dump(self,f=None):
+        first=max(0,self.count-self.n)
+        log(0,"catTrace: last %d of %d CAT frames",self.count-first,self.count)
+        for i in range(first,self.count):
+            (ts,frame)=CAT_TRACE_REC.unpack_from(self.buf,(i%self.n)*CAT_TRACE_REC.size)
+            log(0,"catTrace: %s.%03d [%s]",time.strftime("%H:%M:%S",time.localtime(ts)),int(ts*1000)%1000,hexBuffer(frame))
+        if f!=None:
+           with open(f,"wb") as fp:
+              for i in range(first,self.count):
+                  j=(i%self.n)*CAT_TRACE_REC.size
+                  fp.write(self.buf[j:j+CAT_TRACE_REC.size])
+
+trace=None
+
+def trace_handler(sig, frame):
+    if trace==None:
+       log(0,"trace_handler: CAT trace not enabled (-T)")
+       return
+    trace.dump(CAT_TRACE_FILE)
 #*--------------------------------------------------------------------------------
 #* Identify if the nth bit is set in the x word variable CANDIDATE TO REMOVE
 #*--------------------------------------------------------------------------------
@@ -280,58 +694,76 @@ def printBuffer(rx):
 #* Convert nibble
 #*---------------------------------------------------------------------------
 def bcdToDec(val):
-  return  (val/16*10) + (val%16) 
+  return  (val//16*10) + (val%16) 
 #*--------------------------------------------------------------------------
 #* decToBcd
 #* Convert nibble
 #*-------------------------------------------------------------------------
 def decToBcd(val):
-  return  (val/10*16) + (val%10)
+  return  (val//10*16) + (val%10)
+#*--------------------------------------------------------------------------
+#* BCD lookup tables
+#* BCD_ENC 0..99 into its packed BCD byte, BCD_DEC any byte back into its
+#* value (invalid nibbles keep the arithmetic meaning of bcdToDec)
+#*--------------------------------------------------------------------------
+BCD_ENC=bytes([decToBcd(i) for i in range(100)])
+BCD_DEC=[bcdToDec(i) for i in range(256)]
+BCD_ENC_NP=np.frombuffer(BCD_ENC,dtype=np.uint8)
+BCD_DEC_NP=np.array(BCD_DEC,dtype=np.int64)
+BCD_POW=np.array([1000000,10000,100,1],dtype=np.int64)
 #*----------------------------------------------------------------------
 #* Decode integer into BCD
 #* Frequency is expressed as / 10
 #*----------------------------------------------------------------------
 def dec2BCD(f):
-
-  fz=int(f/10)
-  f0=int(fz/1000000)
-  
-  x1=fz-f0*1000000
-  f1=int(x1/10000)
-  
-  x2=x1-f1*10000
-  f2=int(x2/100)
-
-  x3=x2-f2*100
-  f3=int(x3)
-
-  f0=decToBcd(f0)
-  f1=decToBcd(f1)
-  f2=decToBcd(f2)
-  f3=decToBcd(f3)
-
-  log(2,'dec2BCD: f(%d)->f(%d) %x %x %x %x' % (f,fz,f0,f1,f2,f3))
-  return bytearray([f0,f1,f2,f3,0x00])
+  fz=int(f)//10
+  return bytearray([BCD_ENC[fz//1000000%100],BCD_ENC[fz//10000%100],BCD_ENC[fz//100%100],BCD_ENC[fz%100],0x00])
 #*-----------------------------------------------------------------------
 #* BCD2Dec
 #* Convert frequency /10 from BCD to integer
 #*-----------------------------------------------------------------------
 def BCD2Dec(rxBuffer):
-    f=0
-    f=f+bcdToDec(rxBuffer[0])*1000000
-    f=f+bcdToDec(rxBuffer[1])*10000
-    f=f+bcdToDec(rxBuffer[2])*100
-    f=f+bcdToDec(rxBuffer[3])*1
-    f=f*10
-    log(2,'BCD2Dec: Cmd[%s] f=%d' % (printBuffer(rxBuffer),f))
-    return f
+    return (BCD_DEC[rxBuffer[0]]*1000000+BCD_DEC[rxBuffer[1]]*10000+BCD_DEC[rxBuffer[2]]*100+BCD_DEC[rxBuffer[3]])*10
+#*-----------------------------------------------------------------------
+#* dec2BCDArray / BCD2DecArray
+#* Batch versions for memory channel dumps and scans, n frequencies into
+#* a (n,4) uint8 array of BCD bytes and back (extra columns are ignored)
+#*-----------------------------------------------------------------------
+def dec2BCDArray(f):
+    fz=np.asarray(f,dtype=np.int64)//10
+    return BCD_ENC_NP[(fz[:,None]//BCD_POW)%100]
+
+def BCD2DecArray(b):
+    b=np.asarray(b,dtype=np.uint8)
+    return (BCD_DEC_NP[b[:,:4]]@BCD_POW)*10
+#*-----------------------------------------------------------------------
+#* benchBCD
+#* Throughput of the scalar and array API (the codec is checked against a
+#* reference by tests/test_bcd.py)
+#*-----------------------------------------------------------------------
+def benchBCD(n):
+    f=np.random.randint(0,1000000000,size=n,dtype=np.int64)
+    fl=[int(x) for x in f]
+    ts=time.perf_counter()
+    bl=[dec2BCD(x) for x in fl]
+    te=time.perf_counter()
+    for x in bl:
+        BCD2Dec(x)
+    td=time.perf_counter()
+    print("benchBCD: scalar encode %8.0f/s decode %8.0f/s" % (n/(te-ts),n/(td-te)))
+    ts=time.perf_counter()
+    b=dec2BCDArray(f)
+    te=time.perf_counter()
+    BCD2DecArray(b)
+    td=time.perf_counter()
+    print("benchBCD: array  encode %8.0f/s decode %8.0f/s" % (n/(te-ts),n/(td-te)))
 
 #*-----------------------------------------------------------------------
 #* getFT817
 #* Returns FT817's byte descriptor given the mode
 #*-----------------------------------------------------------------------
 def getFT817mode(m):
-    log(2,"getFT817mode: Argument received %d" % m)
+    log(2,"getFT817mode: Argument received %d",m)
     return ft817_modes[m]
 #*-------------------------------------------------------------------------
 #* Creates a visual clue of the transceiver status (just crude at this point)
@@ -356,7 +788,7 @@ def getStatus():
 
 #*------------------------------------------------------------------------
 def putStatus():
- log(0,'[Status]->%s' % str(getStatus()).replace("\n",""))
+ log(0,'[Status]->%s',str(getStatus()).replace("\n",""))
  return
 
 
@@ -364,31 +796,106 @@ def putStatus():
 #* Operating actuators
 #*=======================================================================
 
+#*-----------------------------------------------------------------------
+#* getVFOFreq
+#* returns the frequency of the current VFO
+#*-----------------------------------------------------------------------
+def getVFOFreq():
+    if vfoAB==0:
+       return fVFOA
+    return fVFOB
+#*-----------------------------------------------------------------------
+#* setShift
+#* Feed the shift rate needed to bring f to baseband into the receiver
+#* chain thru the shift_addition_cc fifo, the chain keeps running
+#*-----------------------------------------------------------------------
+def setShift(f):
+    global shiftFd
+    if shiftFd==None:
+       if not os.path.exists(SHIFT_FIFO):
+          os.mkfifo(SHIFT_FIFO)
+       shiftFd=os.open(SHIFT_FIFO,os.O_RDWR)       #*-- RDWR never blocks nor sees EOF
+    os.write(shiftFd,("%.9f\n" % (float(LO-f)/SAMPLE)).encode())
+    log(2,'setShift: f(%d) LO(%d) rate(%.9f)',f,LO,float(LO-f)/SAMPLE)
 #*-----------------------------------------------------------------------
 #* ot_setfreq
-#* Set new frequency, kill the receiver process and start a new one
+#* Set new frequency. When it falls within the LO +/- SAMPLE/2 window (less
+#* a guard for the channel bandwidth) the shift is changed in place and the
+#* receiver chain keeps running, otherwise the LO is moved which requires
+#* restarting rtl_sdr. A keyed transmitter has its RF stage relaunched when
+#* the sendiq frequency changed, an idle one takes the new frequency when
+#* keyed. Retune latency (including the TX relaunch) is measured and accumulated
 #*-----------------------------------------------------------------------
+retuneStats={'shift':[0,0.0,0.0],'LO':[0,0.0,0.0],'shift+TX':[0,0.0,0.0],'LO+TX':[0,0.0,0.0]}
+
 def ot_setfreq():
-    global stime
-    killProc(pRX)
-    pRX=startReceiver(MODE)
-    log(2,'OT[ot_set] VFO(A)=%d VFO(B)=%d' % (fVFOA,fVFOB))
+    global pRX,LO
+    ts=time.perf_counter()
+    f=getVFOFreq()
+    if (pRX != None and pRX.poll() == None and sdr_modes[MODE][0].find("%FIFO%") != -1 and
+        abs(f-LO) <= SAMPLE/2-RX_GUARD):
+       setShift(f)
+       how='shift'
+    else:
+       LO=f+LO_OFFSET
+       killProc(pRX)
+       pRX=startReceiver(MODE)
+       how='LO'
+    if pTX != None and pTX.retune():
+       how=how+'+TX'
+    dt=time.perf_counter()-ts
+    st=retuneStats[how]
+    st[0]=st[0]+1
+    st[1]=st[1]+dt
+    st[2]=max(st[2],dt)
+    log(1,'OT[ot_set] retune(%s) f(%d) LO(%d) in %.3f ms',how,f,LO,dt*1000.0)
+    log(2,'OT[ot_set] VFO(A)=%d VFO(B)=%d',fVFOA,fVFOB)
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
+#* retuneReport
+#* Log count, average and worst retune latency per retune path
+#*-----------------------------------------------------------------------
+def retuneReport():
+    for how in retuneStats:
+        (n,t,m)=retuneStats[how]
+        if n>0:
+           log(0,'retuneReport: %s n(%d) avg(%.3f ms) max(%.3f ms)',how.ljust(8," "),n,t*1000.0/n,m*1000.0)
+#*-----------------------------------------------------------------------
 #* ot_changeVFO
 #* Set the receiver to the informed VFO                  ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_changeVFO():
-    log(2,'OT[ot_vfo] VFO (%d/%s)' % (vfoAB,getVFO(vfoAB)))
+    log(2,'OT[ot_vfo] VFO (%d/%s)',vfoAB,getVFO(vfoAB))
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
 #* ot_ptt
-#* Change the PTT                                       ---PENDING---
+#* Change the PTT, the receiver is paused and the warm transmitter keyed (its
+#* RF stage launched) or the other way around, the RF stage is killed before
+#* the receiver is resumed
 #*-----------------------------------------------------------------------
 def ot_ptt():
-    log(2,'OT[ot_ptt] PTT change (%s)' % (PTT))
+    ts=time.perf_counter()
+    if PTT==True:
+       if pRX != None and not pRX.paused:
+          pRX.pause()
+       if pTX != None:
+          pTX.key()
+    else:
+       if pTX != None:
+          pTX.unkey()
+       if pRX != None and pRX.paused:
+          pRX.resume()
+    log(1,'OT[ot_ptt] PTT change (%s) in %.3f ms',PTT,(time.perf_counter()-ts)*1000.0)
+    putStatus()
+    return 0
+#*-----------------------------------------------------------------------
+#* ot_split
+#* Change the split                                         ---PENDING---
+#*-----------------------------------------------------------------------
+def ot_split():
+    log(2,'OT[ot_spl] Split change (%s)',SPLIT)
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
@@ -396,7 +903,7 @@ def ot_ptt():
 #* Change the clarify                                       ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_clarify():
-    log(2,'OT[ot_clr] Clafify change (%s)' % (CLAR))
+    log(2,'OT[ot_clr] Clafify change (%s)',CLAR)
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
@@ -404,7 +911,7 @@ def ot_clarify():
 #* Change the clarify                                       ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_mode():
-    log(2,'OT[ot_mod] Mode change (%d/%s)' % (MODE,getFT817mode(MODE)))
+    log(2,'OT[ot_mod] Mode change (%d/%s)',MODE,getFT817mode(MODE))
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
@@ -412,7 +919,7 @@ def ot_mode():
 #* Implement the lock                                       ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_lock():
-    log(2,'OT[ot_lck] Lock change (%s)' % (LOCK))
+    log(2,'OT[ot_lck] Lock change (%s)',LOCK)
     putStatus()
     return 0
 #*-----------------------------------------------------------------------
@@ -420,7 +927,7 @@ def ot_lock():
 #* Implement the read TX meter                              ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_readTXmeter():
-    log(2,'OT[ot_readTXmeter] Read TX meter change (%s)' % ("Not Implemented"))
+    log(2,'OT[ot_readTXmeter] Read TX meter change (%s)',"Not Implemented")
     putStatus()
     return 0
 
@@ -429,24 +936,343 @@ def ot_readTXmeter():
 #* Implement the clarifier frequency                         ---PENDING---
 #*-----------------------------------------------------------------------
 def ot_setClar():
-    log(2,'OT[ot_setClar] Set clarifier frequency (%s)' % ("Not Implemented"))
+    log(2,'OT[ot_setClar] Set clarifier frequency (%s)',"Not Implemented")
     putStatus()
     return 0
 #*=========================[End of actuators]============================
 
+#*=======================================================================
+#* CAT command handlers
+#* Each handler receives the 5 byte command frame and the serial port to
+#* answer on, operates the transceiver state and the ot_* actuators and
+#* writes the response. Handlers are reached thru the catHandlers table
+#*=======================================================================
+
+#*--- Precomputed response templates
+
+RESP_NONE=bytearray([0,0,0,0,0])
+RESP_ACK=bytes([0x00])
+RESP_NAK=bytes([0xf0])
+RESP_EEPROM=bytes([0x00,0x00])
+
+#*--- TX status (0xF7) indexed by PTT*2+SPLIT, PTT bit is inverted
+
+RESP_TXSTATUS=[bytes([0b10000000]),
+               bytes([0b10100000]),
+               bytes([0b00000000]),
+               bytes([0b00100000])]
+
+#*--- Frequency query (0x03) response cache, rebuilt only when VFO or mode changes
+
+catFreqKey=None
+catFreqResp=None
+
+#*--(0x01=Set Frequency)
+
+def catSetFreq(rxBuffer,s):
+    global fVFOA,fVFOB
+    f=BCD2Dec(rxBuffer[0:4])
+    prevfVFOA=fVFOA
+    prevfVFOB=fVFOB
+    if vfoAB == 0:
+       fVFOA =  int(f)
+    else:
+       fVFOB =  int(f)
+    rc=ot_setfreq()                #*-- Change the execution topology
+    s.write(RESP_ACK)
+    log(1,'CAT[0x01] [%s] VFO[%d/%d] set to VFO[%d/%d]',hexBuffer(rxBuffer),prevfVFOA,prevfVFOB,fVFOA,fVFOB)
+
+#*--(0x03=Query Frequency)
+
+def catGetFreq(rxBuffer,s):
+    global catFreqKey,catFreqResp
+    if vfoAB==0:
+       f=fVFOA
+    else:
+       f=fVFOB
+    k=(f,MODE)
+    if k != catFreqKey:
+       r=dec2BCD(int(f))
+       r[4]=MODE
+       catFreqResp=bytes(r)
+       catFreqKey=k
+    s.write(catFreqResp)
+    log(2,'CAT[0x03] [%s] VFO[%d/%d] resp[%s]',hexBuffer(rxBuffer),fVFOA,fVFOB,hexBuffer(catFreqResp))
+
+#*--(0xf7=Read TX status)
+
+def catTXStatus(rxBuffer,s):
+    r=RESP_TXSTATUS[PTT*2+SPLIT]
+    s.write(r)
+    log(2,'CAT[0xf7][%s] PTT(%s) SPL(%s) resp[%s]',hexBuffer(rxBuffer),PTT,SPLIT,hexBuffer(r))
+
+#*--(0xE7=Read RX status)
+
+def catRXStatus(rxBuffer,s):
+    s.write(RESP_ACK)
+    log(2,'CAT[0xE7][%s] resp[%s]',hexBuffer(rxBuffer),hexBuffer(RESP_ACK))
+
+#*--(0xBB=Read EEPROM *Response falsified*)
+
+def catReadEEPROM(rxBuffer,s):
+    s.write(RESP_EEPROM)
+    log(2,'CAT[0xBB] *TEMP* [%s] resp[%s]',hexBuffer(rxBuffer),hexBuffer(RESP_EEPROM))
+
+#*--(0x81=Switch VFO A/B)
+
+def catSwitchVFO(rxBuffer,s):
+    global vfoAB
+    prevAB=vfoAB
+    vfoAB=1-vfoAB
+    rc=ot_changeVFO()               #*--- change topology
+    s.write(RESP_ACK)
+    log(1,'CAT[0x81] [%s] VFO(%s->%s) resp[%s]',hexBuffer(rxBuffer),getVFO(prevAB),getVFO(vfoAB),hexBuffer(RESP_ACK))
+
+#*--(0x00=Lock on)
+
+def catLockOn(rxBuffer,s):
+    global LOCK
+    prevLOCK=LOCK
+    if LOCK==True:
+       r=RESP_NAK
+       LOCK=False
+    else:
+       r=RESP_ACK
+       LOCK=True
+    rc=ot_lock()
+    s.write(r)
+    log(1,'CAT[0x00] [%s] LOCK(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevLOCK,LOCK,hexBuffer(r))
+
+#*--(0x02=SPLIT on)
+
+def catSplitOn(rxBuffer,s):
+    global SPLIT
+    prevSPLIT=SPLIT
+    if SPLIT==True:
+       r=RESP_NAK
+       SPLIT=False
+    else:
+       r=RESP_ACK
+       SPLIT=True
+    rc=ot_split()
+    s.write(r)
+    log(1,'CAT[0x02] [%s] SPLIT(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevSPLIT,SPLIT,hexBuffer(r))
+
+#*--(0x07=Set MODE)
+
+def catSetMode(rxBuffer,s):
+    global MODE
+    prevMODE=MODE
+    prevs=getFT817mode(MODE)
+    nextMODE=rxBuffer[0]
+    m=ft817_modes.get(nextMODE)
+    if m==None:
+       log(0,'CAT[0x07] Invalid CAT Mode(%d), ignore',nextMODE)
+    else:
+       MODE=nextMODE
+    rc=ot_mode()
+    s.write(RESP_ACK)
+    log(1,'CAT[0x07] [%s] MODE(%d<%s>->%d<%s>)  resp[%s]',hexBuffer(rxBuffer),prevMODE,prevs,MODE,m,hexBuffer(RESP_ACK))
+
+#*-- (0x08=PTT ON place transceiver in transmit mode)
+
+def catPTTOn(rxBuffer,s):
+    global PTT
+    prevPTT=PTT
+    PTT=True
+    if prevPTT==True:
+       r=RESP_NAK
+    else:
+       r=RESP_ACK
+    rc=ot_ptt()
+    s.write(r)
+    log(1,'CAT[0x08] [%s] PTT(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevPTT,PTT,hexBuffer(r))
+
+#*-- Commands not implemented (and unlikely to be used in HF)
+#*--(0x09=Set Repeater offset direction)
+#*--(0x0A=Set DCS/CTCSS mode)
+#*--(0x0B=Set CTCSS Tone Frequency)
+#*--(0x0C=Set DCS Code)
+#*--(0x0F=Turn on FT817)
+
+def catNotImplemented(rxBuffer,s):
+    log(0,'CAT[NI] [%s] ignored',hexBuffer(rxBuffer))
+
+#--(0x10=Read TX keyed state (undocumented command) source:http://www.ka7oei.com/ft817_meow.html
+
+def catTXKeyed(rxBuffer,s):
+    if PTT==True:
+       r=RESP_NAK
+    else:
+       r=RESP_ACK
+    s.write(r)
+    log(1,'CAT[0x10] [%s] PTT(%s)  resp[%s]',hexBuffer(rxBuffer),PTT,hexBuffer(r))
+
+#--(0x82=SPLIT off)
+
+def catSplitOff(rxBuffer,s):
+    global SPLIT
+    prevSPLIT=SPLIT
+    if SPLIT==True:
+       r=RESP_ACK
+    else:
+       r=RESP_NAK
+    SPLIT=False
+    rc=ot_split()
+    s.write(r)
+    log(1,'CAT[0x82] [%s] SPLIT(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevSPLIT,SPLIT,hexBuffer(r))
+
+#*--(0x85=Clarifier off)
+
+def catClarOff(rxBuffer,s):
+    global CLAR
+    prevCLAR=CLAR
+    if CLAR==True:
+       r=RESP_ACK
+    else:
+       r=RESP_NAK
+    CLAR=False
+    rc=ot_clarify()
+    s.write(r)
+    log(1,'CAT[0x85] [%s] CLARIFIER(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevCLAR,CLAR,hexBuffer(r))
+
+#*--(0x05=Clarifier On)
+
+def catClarOn(rxBuffer,s):
+    global CLAR
+    prevCLAR=CLAR
+    if CLAR==True:
+       r=RESP_NAK
+    else:
+       r=RESP_ACK
+    CLAR=True
+    rc=ot_clarify()
+    s.write(r)
+    log(1,'CAT[0x05] [%s] CLARIFIER(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevCLAR,CLAR,hexBuffer(r))
+
+#*--(0x80=Lock off)
+
+def catLockOff(rxBuffer,s):
+    global LOCK
+    prevLOCK=LOCK
+    if LOCK==True:
+       r=RESP_ACK
+    else:
+       r=RESP_NAK
+    LOCK=False
+    rc=ot_lock()
+    s.write(r)
+    log(1,'CAT[0x80] [%s] LOCK(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevLOCK,LOCK,hexBuffer(r))
+
+#*--(0x88=PTT Off and give status)
+
+def catPTTOff(rxBuffer,s):
+    global PTT
+    prevPTT=PTT
+    PTT=False
+    if prevPTT==True:
+       r=RESP_ACK
+    else:
+       r=RESP_NAK
+    rc=ot_ptt()
+    s.write(r)
+    log(1,'CAT[0x88] [%s] PTT(%s->%s)  resp[%s]',hexBuffer(rxBuffer),prevPTT,PTT,hexBuffer(r))
+
+#*--Commands ignored
+#*--(0x8f=Turn off FT817)
+#*--(0xBA=Unknown status, not documented)
+#*--(0xBC=Write EEPROM, there is no EEPROM here, just ignore it)
+
+def catIgnored(rxBuffer,s):
+    log(0,'CAT[N*] [%s] ignored',hexBuffer(rxBuffer))
+
+#*--(0xBD=Reads TX Metering , NOT IMPLEMENTED YET)
+
+def catReadTXMeter(rxBuffer,s):
+    rc=ot_readTXmeter()
+    log(0,'CAT[0xBD] [%s] PTT(%s)',hexBuffer(rxBuffer),PTT)
+
+#*--(0xF5=Set clarifier frequency , NOT IMPLEMENTED YET)
+
+def catSetClar(rxBuffer,s):
+    rc=ot_setClar()
+    log(0,'CAT[0xF5] [%s] PTT(%s)',hexBuffer(rxBuffer),PTT)
+
+#*-- Commands ignored
+#*--(0xF9=Set Repeater Offset Amount
+#*--(0xBE=Reset FT817 to factory defaults, unable to
+
+def catFactory(rxBuffer,s):
+    log(0,'CAT[N-] [%s] ignored',hexBuffer(rxBuffer))
+
+#*-- Anything else is not part of the FT-817 CAT command set
+
+def catUnknown(rxBuffer,s):
+    log(0,'CAT[??] [%s] unknown command, ignored',hexBuffer(rxBuffer))
+
+#*-----------------------------------------------------------------------
+#* catHandlers
+#* Opcode (rxBuffer[4]) to handler table, 256 entries so any byte is a
+#* valid index and dispatching a frame costs a single lookup
+#*-----------------------------------------------------------------------
+catHandlers=[catUnknown]*256
+for (k,h) in ((0x01,catSetFreq),(0x03,catGetFreq),(0xf7,catTXStatus),(0xe7,catRXStatus),
+              (0xbb,catReadEEPROM),(0x81,catSwitchVFO),(0x00,catLockOn),(0x02,catSplitOn),
+              (0x07,catSetMode),(0x08,catPTTOn),(0x09,catNotImplemented),(0x0a,catNotImplemented),
+              (0x0b,catNotImplemented),(0x0c,catNotImplemented),(0x0f,catNotImplemented),
+              (0x10,catTXKeyed),(0x82,catSplitOff),(0x85,catClarOff),(0x05,catClarOn),
+              (0x80,catLockOff),(0x88,catPTTOff),(0x8f,catIgnored),(0xa7,catIgnored),
+              (0xba,catIgnored),(0xbc,catIgnored),(0xbd,catReadTXMeter),(0xf5,catSetClar),
+              (0xbe,catFactory),(0xf9,catFactory)):
+    catHandlers[k]=h
+
 #*=======================================================================
 #* processFT817
 #* main CAT command processor
-#* Command recognition and response format is made here, command operation
-#* for implemented commands is set thru the call to a ot_* actuator
+#* Command recognition is a lookup on the opcode (rxBuffer[4]) into the
+#* catHandlers table, the handler formats the response and, for implemented
+#* commands, operates the transceiver thru the call to a ot_* actuator
 #* Not all commands are implemented, not all actuators are more than a stub
 #* at this point (work in progress)
+#* Commands are executed one at a time under catLock (the asyncio server
+#* runs them from more than one thread, the trace, the transceiver state and
+#* the response cache are shared), dispatchFT817 expects the lock held
 #*=======================================================================
+catLock=threading.Lock()
+
+def dispatchFT817(rxBuffer,s):
+    if trace!=None:
+       trace.record(rxBuffer)
+    catHandlers[rxBuffer[4]](rxBuffer,s)
+
 def processFT817(rxBuffer,n,s):
+    with catLock:
+       dispatchFT817(rxBuffer,s)
+    return  bytearray([0,0,0,0,0]),0
+
+#*-----------------------------------------------------------------------
+#* benchFT817
+#* Micro-benchmark of the CAT dispatcher, feeds the high volume polls
+#* (0x03, 0xE7, 0xF7, 0x10) to processFT817 and reports per frame latency
+#* side by side with baselineFT817, the former if-chain processor
+#*-----------------------------------------------------------------------
+class nullPort:
+    def write(self,b):
+        return len(b)
+
+#*-----------------------------------------------------------------------
+#* baselineFT817
+#* BENCH ONLY, never used to serve CAT. Frozen copy of the if-chain
+#* processFT817 this dispatcher replaced, kept as the "before" of benchFT817.
+#* Only fixed where it could not run: the status bits once tested thru
+#* is_set, the port overwritten by the mode name (0x07), CLAR missing from
+#* the globals and undefined names logged by 0xBD/0xF5
+#*-----------------------------------------------------------------------
+def baselineFT817(rxBuffer,n,s):
 
 #*--- Required definition to avoid re-entrancy problems
 
-    global vfoAB,fVFOA,fVFOB,PTT,CAT,MODE,SPLIT,LOCK
+    global vfoAB,fVFOA,fVFOB,PTT,CAT,MODE,SPLIT,LOCK,CLAR
 
 #*--- Process command chain
 
@@ -491,7 +1317,7 @@ def processFT817(rxBuffer,n,s):
           STATUS = STATUS | 0b00100000
        r=bytearray([STATUS])
        s.write(r)
-       log(2,'CAT[0xf7][%s] PTT(%s) SPL(%s) resp[%s]' % (printBuffer(rxBuffer),not is_set(STATUS,7),is_set(STATUS,5),printBuffer(r)))
+       log(2,'CAT[0xf7][%s] PTT(%s) SPL(%s) resp[%s]' % (printBuffer(rxBuffer),(STATUS & 0x80) == 0,(STATUS & 0x20) != 0,printBuffer(r)))
        return  bytearray([0,0,0,0,0]),0
 
 #*--(0xE7=Read RX status)
@@ -560,8 +1386,8 @@ def processFT817(rxBuffer,n,s):
        prevMODE=MODE
        prevs=getFT817mode(MODE)
        nextMODE=rxBuffer[0]
-       s=getFT817mode(nextMODE)
-       if s==None:
+       m=getFT817mode(nextMODE)
+       if m==None:
           log(0,'CAT[0x07] Invalid CAT Mode(%d), ignore' % (nextMODE))
           r=bytearray([0x00])
        else:   
@@ -569,7 +1395,7 @@ def processFT817(rxBuffer,n,s):
           r=bytearray([0x00])
        rc=ot_mode()
        s.write(r)
-       log(1,'CAT[0x07] [%s] MODE(%d<%s>->%d<%s>)  resp[%s]' % (printBuffer(rxBuffer),prevMODE,prevs,MODE,s,printBuffer(r)))
+       log(1,'CAT[0x07] [%s] MODE(%d<%s>->%d<%s>)  resp[%s]' % (printBuffer(rxBuffer),prevMODE,prevs,MODE,m,printBuffer(r)))
        return  bytearray([0,0,0,0,0]),0
 
 #*-- (0x08=PTT ON place transceiver in transmit mode)
@@ -690,14 +1516,14 @@ def processFT817(rxBuffer,n,s):
 
     if rxBuffer[4] == 0xBD:            #*--- YET TO BE IMPLEMENTED
        rc=ot_readTXmeter()
-       log(0,'CAT[0xBD] [%s] PTT(%s->%s)  resp[%s]' % (printBuffer(rxBuffer),prevPTT,PTT,printBuffer(r)))
+       log(0,'CAT[0xBD] [%s] PTT(%s)' % (printBuffer(rxBuffer),PTT))
        return  bytearray([0,0,0,0,0]),0
 
 #*--(0xF5=Set clarifier frequency , NOT IMPLEMENTED YET)
 
     if rxBuffer[4] == 0xF5:            #*--- YET TO BE IMPLEMENTED
        rc=ot_setClar()
-       log(0,'CAT[0xF5] [%s] PTT(%s->%s)  resp[%s]' % (printBuffer(rxBuffer),prevPTT,PTT,printBuffer(r)))
+       log(0,'CAT[0xF5] [%s] PTT(%s)' % (printBuffer(rxBuffer),PTT))
        return  bytearray([0,0,0,0,0]),0
 
 #*-- Commands ignored
@@ -707,7 +1533,223 @@ def processFT817(rxBuffer,n,s):
     if ((rxBuffer[4] == 0xbe) or (rxBuffer[4] == 0xf9)):
        log(0,'CAT[N-] [%s] ignored' % (printBuffer(rxBuffer)))
        return  bytearray([0,0,0,0,0]),0
+
+def benchFT817(nframes):
+    s=nullPort()
+    for k in [0x03,0xe7,0xf7,0x10]:
+        rxBuffer=bytearray([0,0,0,0,k])
+        dt=[]
+        for f in (baselineFT817,processFT817):
+            ts=time.perf_counter()
+            for i in range(nframes):
+                f(rxBuffer,5,s)
+            dt.append((time.perf_counter()-ts)/nframes)
+        print("benchFT817: CAT[0x%02x] if-chain %8.3f us/frame table %8.3f us/frame" % (k,dt[0]*1e6,dt[1]*1e6))
 #*===================================================================================================
+#*----------------------------------------------------------------------------
+#* catFramer
+#* Framed reader for the CAT port, drains whatever is waiting with a single
+#* read (blocking up to the port timeout when nothing is) and splits it into
+#* 5 byte frames in one pass.
+#* The FT-817 protocol carries no sync byte, so resync is done two ways:
+#*    - a candidate frame whose opcode is not a known command is assumed to
+#*      be misaligned and the leading byte is dropped
+#*    - 0x00 (LOCK ON) is a valid opcode but also the usual parameter byte,
+#*      such a frame is only taken when it ends the buffer (the client waits
+#*      for the answer, so a real command is followed by a gap) or when no
+#*      other alignment of the next bytes gives a known non 0x00 opcode
+#*    - a partial frame left over when the port times out is discarded, the
+#*      same inter-byte timeout the real rig applies
+#* The pending buffer never grows beyond CAT_MAXBUFFER bytes
+#*----------------------------------------------------------------------------
+class catFramer:
+    def __init__(self,s,maxBuffer=CAT_MAXBUFFER):
+        self.s=s
+        self.maxBuffer=maxBuffer
+        self.buf=bytearray()
+        self.frames=0
+        self.dropped=0
+
+    def flush(self):
+        if len(self.buf)>0:
+           log(1,'catFramer: timeout, partial frame [%s] discarded',hexBuffer(self.buf))
+           self.dropped=self.dropped+len(self.buf)
+           self.buf.clear()
+
+    def feed(self,c):
+        self.buf+=c
+        if len(self.buf)>self.maxBuffer:
+           k=len(self.buf)-self.maxBuffer
+           self.dropped=self.dropped+k
+           del self.buf[:k]
+        frames=[]
+        i=0
+        l=len(self.buf)
+        while l-i>=5:
+           op=self.buf[i+4]
+           if catHandlers[op] is catUnknown or (op==0x00 and self.misaligned(i)):
+              self.dropped=self.dropped+1
+              i=i+1
+              continue
+           frames.append(self.buf[i:i+5])
+           i=i+5
+        del self.buf[:i]
+        self.frames=self.frames+len(frames)
+        return frames
+
+    def misaligned(self,i):
+        for j in range(i+5,min(i+9,len(self.buf))):
+            if self.buf[j]!=0x00 and catHandlers[self.buf[j]] is not catUnknown:
+               return True
+        return False
+
+    def read(self):
+        n=self.s.in_waiting
+        c=self.s.read(n if n>0 else 1)
+        if len(c)==0:
+           self.flush()
+           return []
+        return self.feed(c)
+
+#*=======================================================================
+#* Asyncio CAT server
+#* Serves several CAT clients at once (virtual serial ports and/or TCP
+#* sockets) over the same transceiver state. Read only queries are answered
+#* right away from the in-memory state, commands changing the transceiver
+#* are queued and executed in arrival order by a single worker so slow
+#* actuators (i.e. receiver restart) never block the event loop. All of them
+#* are serialised by catLock, a query arriving while a command is being
+#* executed waits for it off the event loop (and sees its outcome).
+#* Each client still gets its responses in the order it sent its
+#* commands. The command handlers are the very same used by processFT817
+#*=======================================================================
+CAT_READONLY=frozenset([0x03,0xe7,0xf7,0x10,0xbb])
+
+#*-----------------------------------------------------------------------
+#* ptyPort
+#* Virtual serial port without socat, the slave side is linked to the given
+#* path for the client to open, the master side is served here. The slave is
+#* kept open so clients can come and go without the master reading EOF
+#*-----------------------------------------------------------------------
+class ptyPort:
+    def __init__(self,link):
+        self.link=link
+        (self.master,self.slave)=os.openpty()
+        tty.setraw(self.slave)
+        if os.path.lexists(link):
+           os.remove(link)
+        os.symlink(os.ttyname(self.slave),link)
+
+    def read(self):
+        try:
+           return os.read(self.master,CAT_MAXBUFFER)
+        except OSError:
+           return b''
+
+    def write(self,b):
+        os.write(self.master,b)
+
+    def close(self):
+        if os.path.islink(self.link):
+           os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+#*-----------------------------------------------------------------------
+#* loopPort
+#* Hands writes made from the executor thread back to the event loop
+#*-----------------------------------------------------------------------
+class loopPort:
+    def __init__(self,loop,port):
+        self.loop=loop
+        self.port=port
+
+    def write(self,b):
+        self.loop.call_soon_threadsafe(self.port.write,bytes(b))
+
+class catServer:
+    def __init__(self):
+        self.setQueue=None
+        self.clients=0
+
+#*--- Single worker, executes state changing commands in order
+
+    async def setWorker(self):
+        loop=asyncio.get_running_loop()
+        while True:
+           (rxBuffer,port,done)=await self.setQueue.get()
+           try:
+              await loop.run_in_executor(None,processFT817,rxBuffer,5,loopPort(loop,port))
+           except Exception as e:
+              log(0,'catServer: command [%s] failed (%s)',hexBuffer(rxBuffer),repr(e))
+           if not done.done():
+              done.set_result(True)
+
+    async def process(self,rxBuffer,port):
+        if rxBuffer[4] in CAT_READONLY:
+           if catLock.acquire(blocking=False):
+              try:
+                 dispatchFT817(rxBuffer,port)
+              finally:
+                 catLock.release()
+           else:
+              loop=asyncio.get_running_loop()
+              await loop.run_in_executor(None,processFT817,rxBuffer,5,loopPort(loop,port))
+           return
+        done=asyncio.get_running_loop().create_future()
+        await self.setQueue.put((rxBuffer,port,done))
+        await done
+
+#*--- Frame and process whatever a client sends till it goes away
+
+    async def serve(self,name,readChunk,port):
+        self.clients=self.clients+1
+        log(0,'catServer: client[%s] connected (%d active)',name,self.clients)
+        framer=catFramer(None)
+        try:
+           while True:
+              try:
+                 c=await asyncio.wait_for(readChunk(),CAT_TIMEOUT)
+              except asyncio.TimeoutError:
+                 framer.flush()
+                 continue
+              if len(c)==0:
+                 break
+              for rxBuffer in framer.feed(c):
+                  await self.process(rxBuffer,port)
+        finally:
+           self.clients=self.clients-1
+           log(0,'catServer: client[%s] gone, frames(%d) dropped(%d)',name,framer.frames,framer.dropped)
+
+    async def serveTCP(self,reader,writer):
+        try:
+           await self.serve(str(writer.get_extra_info('peername')),lambda: reader.read(CAT_MAXBUFFER),writer)
+        finally:
+           writer.close()
+
+    async def servePty(self,link):
+        loop=asyncio.get_running_loop()
+        port=ptyPort(link)
+        q=asyncio.Queue()
+        loop.add_reader(port.master,lambda: q.put_nowait(port.read()))
+        try:
+           await self.serve(link,q.get,port)
+        finally:
+           loop.remove_reader(port.master)
+           port.close()
+
+    async def run(self,links,tcpPorts):
+        self.setQueue=asyncio.Queue()
+        tasks=[asyncio.create_task(self.setWorker())]
+        for link in links:
+            tasks.append(asyncio.create_task(self.servePty(link)))
+            log(0,'catServer: serving CAT at %s',link)
+        for t in tcpPorts:
+            server=await asyncio.start_server(self.serveTCP,'127.0.0.1',t)
+            tasks.append(asyncio.create_task(server.serve_forever()))
+            log(0,'catServer: serving CAT at tcp:127.0.0.1:%d',t)
+        await asyncio.gather(*tasks)
+
 #*----------------------------------------------------------------------------
 #* SDR Capabilities
 #*----------------------------------------------------------------------------
@@ -725,19 +1767,27 @@ def isSDRCapable(m,t):
 def bootSDR():
     for key in sdr_modes:
         SDRmodeStr=getFT817mode(SDRmode).ljust(4," ")
-        log(0,"SDR Capabilities: Mode <%s> RX(%s) TX(%s)" % (SDRmodeStr.ljust(3," "),str(isSDRCapable(key,0)).ljust(5," "),str(isSDRCapable(key,1)).ljust(5," ")))
+        log(0,"SDR Capabilities: Mode <%s> RX(%s) TX(%s)",SDRmodeStr.ljust(3," "),str(isSDRCapable(key,0)).ljust(5," "),str(isSDRCapable(key,1)).ljust(5," "))
 
 #*--------------------------------------------------------------------------------
-#* startSDR
-#* Start SDR processor with macro expansion, wait for success key to happen
+#* expandSDR
+#* Expand the macros of a pipeline command with the current settings
 #*--------------------------------------------------------------------------------
-def startSDR(cmd,stOK):
-
+def expandSDR(cmd):
     cmd=cmd.replace("%LO%",str(LO))
     cmd=cmd.replace("%FREQ%",str(fVFOA))
     cmd=cmd.replace("%SAMPLE%",str(SAMPLE))
-    log(1,"startSDR:%s" % cmd)
-    p=startProc(cmd,stOK)
+    cmd=cmd.replace("%FIFO%",SHIFT_FIFO)
+    cmd=cmd.replace("%DIR%",OTDIR)
+    return cmd
+#*--------------------------------------------------------------------------------
+#* startSDR
+#* Start SDR pipeline with macro expansion, wait for success key to happen
+#*--------------------------------------------------------------------------------
+def startSDR(name,cmd,stOK,gated=False):
+
+    log(1,"startSDR:%s",expandSDR(cmd))
+    p=sdrPipeline(name,cmd,stOK,gated,expandSDR).start()
     if p==None:
        log(0,"startSDR: Process launch failed")
     return p
@@ -748,21 +1798,37 @@ def startSDR(cmd,stOK):
 
 #*----------------------------------------------------------------------------------
 #* startReceiver
-#* manages the capability and launch receiver
+#* manages the capability and launch receiver, paused when it is (re)started
+#* while the PTT is keyed
 #*----------------------------------------------------------------------------------
 def startReceiver(m):
-    global PTT
-    
-    PTT=False
     log(1,"startReceiver: Starting front-end processor")
     s=sdr_modes[m][0]
     if s=="":
        log(0,"Front-End SDR processor not found, QUITTING!")
        exit()
-    p=startSDR(s,"Reading samples in async mode..")
+    if s.find("%FIFO%") != -1:
+       setShift(getVFOFreq())               #*-- Creates the fifo and primes the shift
+    p=startSDR("RX",s,"Reading samples in async mode..")
+    if PTT==True:
+       p.pause()
     log(1,"startReceiver: Starting listener process")
     return p
 #*----------------------------------------------------------------------------------
+#* startTransmitter
+#* launch the transmitter of the mode as a paused warm standby, the RF stage
+#* (sendiq) is held off until PTT keys it
+#*----------------------------------------------------------------------------------
+def startTransmitter(m):
+    s=sdr_modes[m][1]
+    if s=="":
+       log(0,"startTransmitter: no transmitter for mode %s",getFT817mode(m))
+       return None
+    p=startSDR("TX",s,None,gated=True)
+    p.pause()
+    log(1,"startTransmitter: Transmitter ready as warm standby")
+    return p
+#*----------------------------------------------------------------------------------
 #* killReceiver
 #* kill receiver process and nullify it
 #*----------------------------------------------------------------------------------
@@ -777,7 +1843,7 @@ def killReceiver():
 #* MAIN PROGRAM
 #*----------------------------------------------------------------------------
 try:
- log(0,"Booting transceiver PID(%d)" % (os.getPid()))
+ log(0,"Booting transceiver PID(%d)",os.getpid())
 
 #*----------------------------------------------------------------------------
 #* Process arguments
@@ -792,6 +1858,12 @@ try:
  p.add_argument('-f', help="Frequency",default=14074000)
  p.add_argument('-c', help="Clarifier",action="store_true",default=False)
  p.add_argument('-s', help="Split",action="store_true",default=False)
+ p.add_argument('-b', help="Benchmark CAT dispatcher and BCD codec and exit",action="store_true",default=False)
+ p.add_argument('-a', help="Multi-client asyncio CAT server",action="store_true",default=False)
+ p.add_argument('-T', help="Keep a binary trace of the last N CAT frames, dumped on SIGUSR1",type=int,default=0)
+ p.add_argument('-n', help="Use the NumPy demodulator where the mode has one",action="store_true",default=False)
+ p.add_argument('-p', help="Additional virtual serial ports (-a), comma separated",default="")
+ p.add_argument('-t', help="CAT TCP ports (-a), comma separated",default="")
 
 #*----------------------------------------------------------------------------
 #* Establish initial values based on arguments
@@ -800,12 +1872,29 @@ try:
  args = p.parse_args()
  fVFOA=int(args.f)
  fVFOB=int(args.f)
- MODE=args.m
+ MODE=int(args.m)
  LOCK=args.l
  SPLIT=args.s
  CLAR=args.c
- DEBUGLEVEL=args.v
+ DEBUGLEVEL=int(args.v)
  SDRmode=0x01
+ if args.T > 0:
+    trace=catTrace(args.T)
+
+ if args.n == True:
+    for key in sdr_modes:
+        if sdr_modes[key][2] != "":
+           sdr_modes[key][0]=sdr_modes[key][2]
+           log(1,"main: mode %s receiver set to NumPy demodulator",getFT817mode(key))
+
+#*-----------------------------------------------------------------------------
+#* Benchmark the CAT dispatcher and BCD codec, no virtual port nor SDR processes are needed
+#*-----------------------------------------------------------------------------
+
+ if args.b == True:
+    benchFT817(100000)
+    benchBCD(100000)
+    sys.exit(0)
 
 #*-----------------------------------------------------------------------------
 #* Special feature, force removal of all involved processes
@@ -816,19 +1905,34 @@ try:
 #    killProcList('rtl_sdr')
 #    killProcList('socat')
 
+#*-----------------------------------------------------------------------------
+#* Multi-client server, virtual serial ports are served directly (no socat)
+#*-----------------------------------------------------------------------------
+
+ if args.a == True:
+    rc=bootSDR()
+    pRX=startReceiver(MODE)
+    pTX=startTransmitter(MODE)
+    threading.Thread(target=superviseSDR,daemon=True).start()
+    putStatus()
+    links=[args.i]+[x for x in args.p.split(",") if x!=""]
+    tcpPorts=[int(x) for x in args.t.split(",") if x!=""]
+    asyncio.run(catServer().run(links,tcpPorts))
+    sys.exit(0)
+
 #*----------------------------------------------------------------------------
 #* Start virtual serial port pair to communicate CAT commands
 #*----------------------------------------------------------------------------
  z=startProc('socat -d -d pty,raw,echo=0,link=/tmp/ttyv0 pty,raw,echo=0,link=/tmp/ttyv1',"starting data transfer loop")
- log(0,"main: started virtual serial port %s" %  psutil.Process(z.pid))
+ log(0,"main: started virtual serial port %s",psutil.Process(z.pid))
  time.sleep(1)
 #*----------------------------------------------------------------------------
 #* Boot SDR processor and perform initialization
 #*---------------------------------------------------------------------------- 
  rc=bootSDR()
 
- s=serial.Serial(args.o,args.r)
- log(0,'Client[%s]==>(%s) (%d)' % (args.o,args.i,args.r))
+ s=serial.Serial(args.o,args.r,timeout=CAT_TIMEOUT)
+ log(0,'Client[%s]==>(%s) (%d)',args.o,args.i,args.r)
 
  CAT=args.r
  vfoAB=0
@@ -837,32 +1941,24 @@ try:
 #* Start SDR processor, always starts with the receiver of the mode
 #*----------------------------------------------------------------------------
  pRX=startReceiver(MODE)
+ pTX=startTransmitter(MODE)
+ threading.Thread(target=superviseSDR,daemon=True).start()
 
 #*----------------------------------------------------------------------------
 #* Main receiving loop
 #*----------------------------------------------------------------------------
- o=''
- n=0
  vfoAB=0
- rxBuffer=bytearray([0,0,0,0,0])
+ cat=catFramer(s)
  putStatus()
 #*----------------------------------------------------------------------------
 #* Infinite loop
 #*----------------------------------------------------------------------------
  while True :
 
-#*------ Process CAT commands block if none (to improve performance avoiding polling)
-#  if ( (s.inWaiting()>0) ):
-
-     c = s.read()
-     for d in c:
-         i = ord(d)
-         rxBuffer[n]=i
-         h = hex(i)[2:]
-         o = o + ' ' + h
-         n=n+1
-         if n==5:
-            (rxBuffer,n)=processFT817(rxBuffer,n,s)
+#*------ Process CAT commands, block up to CAT_TIMEOUT if none (avoid polling)
+
+     for rxBuffer in cat.read():
+         processFT817(rxBuffer,5,s)
 
 #*===========================[infinite loop]====================================
 
@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+#*--------------------------------------------------------------------------
+#* iqhub
+#*
+#* IQ fan-out hub, one dongle feeds several decoders
+#*
+#* The hub reads the rtl_sdr stream once, straight into a ring buffer kept
+#* in shared memory. Consumers (SSB audio, FT8, WSPR, waterfall...) attach to
+#* the ring by name, each one with its own read cursor, and read the samples
+#* in place (no per consumer copy, no TCP loopback as with ncat).
+#* A consumer falling more than the ring size behind is skipped forward to
+#* the live edge and its overrun counter is increased.
+#*
+#*   rtl_sdr -s 1200000 -f 14100000 -D 2 - | iqhub.py --hub OT &
+#*   iqhub.py --attach OT | csdr convert_u8_f | csdr shift_addition_cc ...
+#*   iqhub.py --stats OT
+#*
+#*-------------------------------------------------------------------------
+#// License:
+#//   This program is free software: you can redistribute it and/or modify
+#//   it under the terms of the GNU General Public License as published by
+#//   the Free Software Foundation, either version 2 of the License, or
+#//   (at your option) any later version.
+#//
+#//   This program is distributed in the hope that it will be useful,
+#//   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#//   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#//   GNU General Public License for more details.
+#//
+#//   You should have received a copy of the GNU General Public License
+#//   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#// lu7did: initial load
+#*-------------------------------------------------------------------------
+#* import the necessary packages
+#*-------------------------------------------------------------------------
+import argparse
+import os
+import sys
+import time
+import fcntl
+import signal
+import numpy as np
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+#*-------------------------------------------------------------------------
+#* Shared memory layout
+#*   header    int64[8]   magic, ring size, seq, write position, state, hub PID
+#*   consumers int64[MAX_CONSUMERS][4]   pid, read position, overruns, bytes
+#*   ring      uint8[ring size]
+#* The write position is a monotonic byte count published thru a seqlock
+#* (seq odd while being updated) so readers never see a torn 64 bit value.
+#* The hub marks the segment closed before unlinking it, consumers then
+#* drain what is left and end (they also end if the hub PID is gone)
+#*-------------------------------------------------------------------------
+MAGIC=0x4f54495148554231
+MAX_CONSUMERS=8
+HDR_WORDS=8
+SLOT_WORDS=4
+DATA_OFFSET=(HDR_WORDS+MAX_CONSUMERS*SLOT_WORDS)*8
+RING_SIZE=32*1024*1024
+CHUNK=256*1024
+POLL=0.005
+
+H_MAGIC=0
+H_SIZE=1
+H_SEQ=2
+H_WPOS=3
+H_STATE=4
+H_PID=5
+
+ST_RUNNING=1
+ST_CLOSED=2
+
+S_PID=0
+S_RPOS=1
+S_OVERRUN=2
+S_BYTES=3
+
+DEBUGLEVEL=0
+
+def log(d,st):
+    if d<=DEBUGLEVEL:
+       sys.stderr.write("iqhub: %s %s\n" % (time.ctime(),st))
+
+#*-------------------------------------------------------------------------
+#* iqRing
+#* Views over the shared memory segment common to hub and consumers
+#*-------------------------------------------------------------------------
+class iqRing:
+    def __init__(self,name,size=0):
+        if size>0:
+           self.shm=shared_memory.SharedMemory(name=name,create=True,size=DATA_OFFSET+size)
+        else:
+           self.shm=shared_memory.SharedMemory(name=name)
+           resource_tracker.unregister(self.shm._name,"shared_memory")     #*-- the hub owns the segment
+        buf=self.shm.buf
+        self.hdr=np.ndarray((HDR_WORDS,),dtype=np.int64,buffer=buf)
+        self.slots=np.ndarray((MAX_CONSUMERS,SLOT_WORDS),dtype=np.int64,buffer=buf,offset=HDR_WORDS*8)
+        if size>0:
+           self.hdr[:]=0
+           self.slots[:]=0
+           self.hdr[H_SIZE]=size
+           self.hdr[H_MAGIC]=MAGIC
+        elif self.hdr[H_MAGIC]!=MAGIC:
+           raise Exception("iqRing: %s is not an IQ hub segment" % name)
+        self.size=int(self.hdr[H_SIZE])
+        self.data=buf[DATA_OFFSET:DATA_OFFSET+self.size]
+
+    def writePos(self):
+        while True:
+            s=self.hdr[H_SEQ]
+            w=int(self.hdr[H_WPOS])
+            if s%2==0 and s==self.hdr[H_SEQ]:
+               return w
+
+    def publish(self,w):
+        self.hdr[H_SEQ]+=1
+        self.hdr[H_WPOS]=w
+        self.hdr[H_SEQ]+=1
+
+    def closed(self):
+        return self.hdr[H_STATE]!=ST_RUNNING or not pidAlive(int(self.hdr[H_PID]))
+
+    def close(self):
+        self.data.release()
+        del self.hdr
+        del self.slots
+        try:
+           self.shm.close()
+        except BufferError:
+           pass                                     #*-- views still held, released at exit
+
+#*-------------------------------------------------------------------------
+#* runHub
+#* Read the IQ stream from stdin into the ring till EOF or signal
+#*-------------------------------------------------------------------------
+def runHub(name,size):
+    ring=iqRing(name,size)
+    ring.hdr[H_PID]=os.getpid()
+    ring.hdr[H_STATE]=ST_RUNNING
+    log(0,"hub(%s) ring(%d bytes) PID(%d)" % (name,size,os.getpid()))
+    w=0
+    try:
+       while True:
+           i=w%size
+           k=os.readv(0,[ring.data[i:min(size,i+CHUNK)]])
+           if not k:
+              break
+           w=w+k
+           ring.publish(w)
+    finally:
+       log(0,"hub(%s) ending after %d bytes" % (name,w))
+       ring.hdr[H_STATE]=ST_CLOSED
+       ring.close()
+       ring.shm.unlink()
+
+#*-------------------------------------------------------------------------
+#* iqConsumer
+#* Attach to a hub with an own cursor starting at the live edge.
+#* read() returns memoryviews over the ring (one or two when wrapping)
+#* of the samples not yet consumed, release() advances the cursor.
+#* Once the hub is closed and all its samples consumed read() returns None
+#*-------------------------------------------------------------------------
+class iqConsumer:
+    def __init__(self,name):
+        self.ring=iqRing(name)
+        self.slot=-1
+        with open("/tmp/iqhub_%s.lck" % name,"w") as lck:
+           fcntl.flock(lck,fcntl.LOCK_EX)
+           for i in range(MAX_CONSUMERS):
+               pid=int(self.ring.slots[i][S_PID])
+               if pid==0 or not pidAlive(pid):
+                  self.slot=i
+                  break
+           if self.slot<0:
+              raise Exception("iqConsumer: no free consumer slot in hub %s" % name)
+           s=self.ring.slots[self.slot]
+           s[S_RPOS]=self.ring.writePos()
+           s[S_OVERRUN]=0
+           s[S_BYTES]=0
+           s[S_PID]=os.getpid()
+        self.s=self.ring.slots[self.slot]
+        self.r=int(self.s[S_RPOS])
+
+    def read(self,maxBytes=CHUNK):
+        size=self.ring.size
+        w=self.ring.writePos()
+        if w-self.r>size-CHUNK:                    #*-- lapped (or about to be) by the hub
+           self.s[S_OVERRUN]+=1
+           log(1,"consumer slot(%d) overrun, %d bytes skipped" % (self.slot,w-self.r))
+           self.r=w
+           self.s[S_RPOS]=w
+        n=min(w-self.r,maxBytes)
+        if n==0:
+           if self.ring.closed() and self.ring.writePos()==self.r:
+              return None
+           return []
+        i=self.r%size
+        if i+n<=size:
+           return [self.ring.data[i:i+n]]
+        return [self.ring.data[i:size],self.ring.data[0:n-(size-i)]]
+
+    def release(self,n):
+        if self.ring.writePos()-self.r>self.ring.size-CHUNK:   #*-- overwritten while being read
+           self.s[S_OVERRUN]+=1
+        self.r=self.r+n
+        self.s[S_RPOS]=self.r
+        self.s[S_BYTES]+=n
+
+    def close(self):
+        self.s[S_PID]=0
+        del self.s
+        self.ring.close()
+
+def pidAlive(pid):
+    try:
+       os.kill(pid,0)
+       return True
+    except ProcessLookupError:
+       return False
+    except PermissionError:
+       return True
+
+#*-------------------------------------------------------------------------
+#* runConsumer
+#* Attach to the hub and copy the stream to stdout (to feed csdr & co)
+#*-------------------------------------------------------------------------
+def runConsumer(name):
+    c=iqConsumer(name)
+    log(0,"consumer of hub(%s) slot(%d)" % (name,c.slot))
+    try:
+       while True:
+           views=c.read()
+           if views is None:
+              log(0,"hub(%s) closed, consumer slot(%d) ending" % (name,c.slot))
+              break
+           if len(views)==0:
+              time.sleep(POLL)
+              continue
+           n=0
+           for v in views:
+               k=0
+               while k<len(v):
+                   k=k+os.write(1,v[k:])
+               n=n+len(v)
+               v.release()
+           c.release(n)
+    finally:
+       c.close()
+
+#*-------------------------------------------------------------------------
+#* putStats
+#* Print write position and each consumer lag and overrun counters
+#*-------------------------------------------------------------------------
+def putStats(name):
+    ring=iqRing(name)
+    w=ring.writePos()
+    print("hub(%s) ring(%d) written(%d) closed(%s)" % (name,ring.size,w,ring.closed()))
+    for i in range(MAX_CONSUMERS):
+        (pid,r,o,b)=[int(x) for x in ring.slots[i]]
+        if pid!=0:
+           print("   slot(%d) PID(%d) alive(%s) lag(%d) overruns(%d) read(%d)" % (i,pid,pidAlive(pid),w-r,o,b))
+    ring.close()
+
+#*============================================================================
+#* Main Program
+#*============================================================================
+if __name__ == "__main__":
+   signal.signal(signal.SIGTERM,lambda sig,frame: sys.exit(0))
+   ap=argparse.ArgumentParser()
+   ap.add_argument("--hub",help="Run the hub reading IQ from stdin",default=None)
+   ap.add_argument("--attach",help="Attach to a hub and write its IQ to stdout",default=None)
+   ap.add_argument("--stats",help="Show hub consumers and overrun counters",default=None)
+   ap.add_argument("--size",help="Ring size in bytes",type=int,default=RING_SIZE)
+   ap.add_argument("-v",help="Verbose",type=int,default=0)
+   args=ap.parse_args()
+   DEBUGLEVEL=args.v
+   try:
+      if args.hub!=None:
+         runHub(args.hub,args.size)
+      elif args.attach!=None:
+         runConsumer(args.attach)
+      elif args.stats!=None:
+         putStats(args.stats)
+      else:
+         ap.print_help()
+   except FileNotFoundError:
+      sys.stderr.write("iqhub: no hub named %s\n" % (args.attach if args.attach!=None else args.stats))
+      sys.exit(1)
+   except (BrokenPipeError,KeyboardInterrupt):
+      pass
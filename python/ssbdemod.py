@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+#*--------------------------------------------------------------------------
+#* ssbdemod
+#*
+#* In-process SSB demodulator, replaces the csdr receiving chain
+#*
+#*   csdr convert_u8_f | csdr shift_addition_cc | csdr fir_decimate_cc 25 0.05 HAMMING |
+#*   csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff |
+#*   csdr limit_ff | csdr convert_f_s16
+#*
+#* by a single process doing the same steps as NumPy block operations over
+#* preallocated buffers. Reads the u8 IQ stream of rtl_sdr from stdin and
+#* writes S16_LE audio at SAMPLE/25 to stdout, i.e.
+#*
+#*   rtl_sdr -s 1200000 -f LO - | ssbdemod.py -m USB --fifo /tmp/ot817.shift | aplay ...
+#*
+#* The shift rate ((LO-f)/SAMPLE, same as csdr shift_addition_cc) is given
+#* with -r or thru a fifo the way OT817 retunes the receiver in place.
+#* Run with --bench to measure the CPU load against the csdr chain.
+#*-------------------------------------------------------------------------
+#// License:
+#//   This program is free software: you can redistribute it and/or modify
+#//   it under the terms of the GNU General Public License as published by
+#//   the Free Software Foundation, either version 2 of the License, or
+#//   (at your option) any later version.
+#//
+#//   This program is distributed in the hope that it will be useful,
+#//   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#//   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#//   GNU General Public License for more details.
+#//
+#//   You should have received a copy of the GNU General Public License
+#//   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#// lu7did: initial load
+#*-------------------------------------------------------------------------
+#* import the necessary packages
+#*-------------------------------------------------------------------------
+import argparse
+import os
+import sys
+import time
+import subprocess
+import tempfile
+import numpy as np
+#*-------------------------------------------------------------------------
+#* Demodulator parameters (mirror the csdr chain arguments)
+#*-------------------------------------------------------------------------
+SAMPLE=1200000
+DECIMATION=25
+TRANSITION=0.05
+NFFT=2048
+AGC_TARGET=0.8
+AGC_MAXGAIN=65535.0
+AGC_DECAY=0.05
+DEBUGLEVEL=0
+
+def log(d,st):
+    if d<=DEBUGLEVEL:
+       sys.stderr.write("ssbdemod: %s\n" % st)
+
+#*-------------------------------------------------------------------------
+#* fft, ifft
+#* Transforms into a given buffer, NumPy 2.0 and later write there directly,
+#* older versions (as shipped with Raspberry Pi OS) return a new array
+#*-------------------------------------------------------------------------
+try:
+   np.fft.fft(np.zeros(4,dtype=np.complex64),out=np.empty(4,dtype=np.complex64))
+   def fft(a,out):
+       return np.fft.fft(a,out=out)
+   def ifft(a,out):
+       return np.fft.ifft(a,out=out)
+except TypeError:
+   def fft(a,out):
+       out[:]=np.fft.fft(a)
+       return out
+   def ifft(a,out):
+       out[:]=np.fft.ifft(a)
+       return out
+
+#*-------------------------------------------------------------------------
+#* lowpassTaps
+#* Hamming windowed sinc, cutoff as a fraction of the sample rate and
+#* length set by the transition bandwidth as csdr does (4/transition)
+#*-------------------------------------------------------------------------
+def lowpassTaps(cutoff,transition):
+    n=int(4.0/transition)
+    if n%2==0:
+       n=n+1
+    m=np.arange(n)-(n-1)/2.0
+    h=2*cutoff*np.sinc(2*cutoff*m)*np.hamming(n)
+    return (h/h.sum()).astype(np.float32)
+
+#*-------------------------------------------------------------------------
+#* ssbDemod
+#* Block demodulator, every call to process() consumes DECIMATION*nout
+#* IQ pairs (u8) and returns nout S16 samples. All buffers are allocated
+#* once and every step writes into them in place, state (oscillator
+#* phase, filter history, AGC gain) carries over
+#*-------------------------------------------------------------------------
+class ssbDemod:
+    def __init__(self,mode="USB",rate=0.0):
+        self.rate=rate
+        self.phase=0.0
+
+#*--- Decimating FIR, history keeps the last ntaps-1 input samples
+
+        self.dtaps=lowpassTaps(0.5/DECIMATION,TRANSITION)[::-1].copy()
+        nd=len(self.dtaps)
+
+#*--- Sideband filter (overlap-save), a lowpass of half the band moved to
+#*--- +/- a quarter of the rate selects the upper or lower sideband
+
+        h=lowpassTaps(0.25,TRANSITION).astype(np.complex64)
+        nb=len(h)
+        if mode=="LSB":
+           h=h*np.exp(-2j*np.pi*0.25*np.arange(nb))
+        else:
+           h=h*np.exp(2j*np.pi*0.25*np.arange(nb))
+        self.H=np.fft.fft(h,NFFT).astype(np.complex64)
+
+        self.nout=NFFT-nb+1
+        self.nin=self.nout*DECIMATION
+        self.nbytes=self.nin*2
+
+        self.raw=np.empty(self.nbytes,dtype=np.uint8)
+        self.u=np.empty((self.nin,2),dtype=np.float32)
+        self.iq=np.empty(self.nin,dtype=np.complex64)
+        self.x=np.zeros(self.nin+nd-1,dtype=np.complex64)
+        self.win=np.lib.stride_tricks.sliding_window_view(self.x,nd)[::DECIMATION][:self.nout]
+        self.dtaps=self.dtaps.astype(np.complex64)
+        self.lo=np.empty(self.nin,dtype=np.complex64)
+        self.mixer=np.empty(self.nin,dtype=np.complex64)
+        self.mixerRate=None
+        self.ola=np.zeros(NFFT,dtype=np.complex64)
+        self.spec=np.empty(NFFT,dtype=np.complex64)
+        self.audio=np.empty(self.nout,dtype=np.float32)
+        self.gains=np.empty(self.nout,dtype=np.float32)
+        self.pcm=np.empty(self.nout,dtype=np.int16)
+        self.gain=1.0
+        self.ramp=np.linspace(0.0,1.0,self.nout,dtype=np.float32)
+        self.nd=nd
+        self.nb=nb
+
+#*--- Oscillator table exp(j*w*n) for one block, rebuilt only when the rate changes
+
+    def setMixer(self):
+        w=2*np.pi*self.rate
+        np.exp(1j*w*np.arange(self.nin),out=self.mixer,casting="same_kind")
+        self.mixerRate=self.rate
+
+    def process(self,raw):
+
+#*--- convert_u8_f
+
+        np.copyto(self.u,raw.reshape(-1,2),casting="unsafe")
+        self.u-=127.5
+        self.u*=1.0/127.5
+        self.iq.real=self.u[:,0]
+        self.iq.imag=self.u[:,1]
+
+#*--- shift_addition_cc, continuous phase from block to block
+
+        if self.rate!=self.mixerRate:
+           self.setMixer()
+        np.multiply(self.mixer,np.complex64(np.exp(1j*self.phase)),out=self.lo)
+        self.phase=(self.phase+2*np.pi*self.rate*self.nin)%(2*np.pi)
+        nd=self.nd
+        np.multiply(self.iq,self.lo,out=self.x[nd-1:])
+
+#*--- fir_decimate_cc, only the kept outputs are computed, straight into the
+#*--- overlap-save buffer of the sideband filter
+
+        self.ola[:self.nb-1]=self.ola[-(self.nb-1):]
+        np.matmul(self.win,self.dtaps,out=self.ola[self.nb-1:])
+        self.x[:nd-1]=self.x[-(nd-1):]
+
+#*--- bandpass_fir_fft_cc (overlap-save) and realpart_cf
+
+        fft(self.ola,self.spec)
+        self.spec*=self.H
+        ifft(self.spec,self.spec)
+        np.copyto(self.audio,self.spec[self.nb-1:].real)
+
+#*--- agc_ff, fast attack slow decay, gain ramped within the block
+
+        peak=max(float(self.audio.max()),-float(self.audio.min()))
+        target=AGC_MAXGAIN if peak==0.0 else min(AGC_TARGET/peak,AGC_MAXGAIN)
+        if target<self.gain:
+           g=target
+        else:
+           g=self.gain+(target-self.gain)*AGC_DECAY
+        np.multiply(self.ramp,g-self.gain,out=self.gains)
+        self.gains+=self.gain
+        self.audio*=self.gains
+        self.gain=g
+
+#*--- limit_ff and convert_f_s16
+
+        np.clip(self.audio,-1.0,1.0,out=self.audio)
+        self.audio*=32767.0
+        np.copyto(self.pcm,self.audio,casting="unsafe")
+        return self.pcm
+
+#*-------------------------------------------------------------------------
+#* readShift
+#* Non blocking read of the shift rate fifo, the last value written wins
+#*-------------------------------------------------------------------------
+def readShift(fd,rate):
+    try:
+       b=os.read(fd,4096)
+    except BlockingIOError:
+       return rate
+    for line in b.decode(errors="ignore").split("\n"):
+        try:
+           rate=float(line)
+        except ValueError:
+           pass
+    return rate
+
+#*-------------------------------------------------------------------------
+#* readFull
+#* Fill the buffer from a pipe, returns False at EOF
+#*-------------------------------------------------------------------------
+def readFull(f,buf):
+    mv=memoryview(buf)
+    i=0
+    while i<len(buf):
+        k=f.readinto(mv[i:])
+        if not k:
+           return False
+        i=i+k
+    return True
+
+#*-------------------------------------------------------------------------
+#* run
+#* Demodulate stdin into stdout till EOF
+#*-------------------------------------------------------------------------
+def run(mode,rate,fifo):
+    d=ssbDemod(mode,rate)
+    fd=None
+    if fifo!=None:
+       fd=os.open(fifo,os.O_RDONLY|os.O_NONBLOCK)
+       d.rate=readShift(fd,d.rate)
+    fin=sys.stdin.buffer
+    fout=sys.stdout.buffer
+    log(0,"mode(%s) rate(%.9f) block(%d) samples" % (mode,d.rate,d.nin))
+    while readFull(fin,d.raw):
+        if fd!=None:
+           d.rate=readShift(fd,d.rate)
+        fout.write(d.process(d.raw).tobytes())
+        fout.flush()
+
+#*-------------------------------------------------------------------------
+#* bench
+#* CPU load of the demodulator and of the csdr chain (when csdr is found)
+#* over the same synthetic signal, as % of one core for real time operation
+#*-------------------------------------------------------------------------
+def bench(seconds):
+    nsamples=int(SAMPLE*seconds)
+    t=np.arange(nsamples)/SAMPLE
+    s=0.5*np.exp(2j*np.pi*(-25000.0+1000.0)*t)+0.05*(np.random.randn(nsamples)+1j*np.random.randn(nsamples))
+    raw=np.empty(2*nsamples,dtype=np.uint8)
+    raw[0::2]=np.clip(s.real*127.5+127.5,0,255)
+    raw[1::2]=np.clip(s.imag*127.5+127.5,0,255)
+
+    d=ssbDemod("USB",25000.0/SAMPLE)
+    c0=time.process_time()
+    for i in range(0,len(raw)-d.nbytes+1,d.nbytes):
+        d.process(raw[i:i+d.nbytes])
+    cpu=time.process_time()-c0
+    print("bench: numpy   %6.1f%% CPU (%.2f s CPU for %.1f s of signal)" % (100.0*cpu/seconds,cpu,seconds))
+
+    with tempfile.NamedTemporaryFile() as f:
+       f.write(raw.tobytes())
+       f.flush()
+       cmd=("cat %s | csdr convert_u8_f | csdr shift_addition_cc %.9f | csdr fir_decimate_cc 25 0.05 HAMMING | "
+            "csdr bandpass_fir_fft_cc 0 0.5 0.05 | csdr realpart_cf | csdr agc_ff | csdr limit_ff | "
+            "csdr convert_f_s16 > /dev/null" % (f.name,25000.0/SAMPLE))
+       t0=os.times()
+       rc=subprocess.call(cmd,shell=True,stderr=subprocess.DEVNULL)
+       t1=os.times()
+       if rc!=0:
+          print("bench: csdr    not available, skipped")
+          return
+       cpu=(t1.children_user-t0.children_user)+(t1.children_system-t0.children_system)
+       print("bench: csdr    %6.1f%% CPU (%.2f s CPU for %.1f s of signal)" % (100.0*cpu/seconds,cpu,seconds))
+
+#*============================================================================
+#* Main Program
+#*============================================================================
+if __name__ == "__main__":
+   ap=argparse.ArgumentParser()
+   ap.add_argument("-m","--mode",help="Sideband USB or LSB",default="USB")
+   ap.add_argument("-r","--rate",help="Shift rate (LO-f)/SAMPLE",type=float,default=0.0)
+   ap.add_argument("--fifo",help="Read shift rate updates from fifo",default=None)
+   ap.add_argument("--bench",help="Benchmark CPU load for the given seconds of signal",type=float,default=0.0)
+   ap.add_argument("-v",help="Verbose",type=int,default=0)
+   args=ap.parse_args()
+   DEBUGLEVEL=args.v
+   if args.bench>0:
+      bench(args.bench)
+      sys.exit(0)
+   try:
+      run(args.mode.upper(),args.rate,args.fifo)
+   except (BrokenPipeError,KeyboardInterrupt):
+      pass
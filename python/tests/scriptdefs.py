@@ -0,0 +1,34 @@
+"""Load selected definitions of a script without running it
+
+The scripts in this directory are programs (serial port, GPIO, SDR and
+radio processes set up at module level), tests only take the functions,
+classes and constants they exercise out of the source.
+"""
+import ast
+import os
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def assigned(node):
+    """Names a top level statement defines (a for loop, the names it fills)"""
+    if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, ast.Assign):
+        return [t.id for t in node.targets if isinstance(t, ast.Name)]
+    if isinstance(node, ast.For):
+        return [t.value.id for n in ast.walk(node) if isinstance(n, ast.Assign)
+                for t in n.targets if isinstance(t, ast.Subscript) and isinstance(t.value, ast.Name)]
+    return []
+
+
+def load_defs(script, names, g):
+    """Execute the top level definitions of script named in names (or
+    accepted by names when it is a callable) into g"""
+    path = os.path.join(SCRIPTS, script)
+    match = names if callable(names) else names.__contains__
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    nodes = [node for node in tree.body if any(match(name) for name in assigned(node))]
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), path, "exec"), g)
+    return g
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scriptdefs import load_defs  # noqa: E402
+
+# OT817.py is a script (serial port, SDR processes), only the codec is loaded
+CODEC = ("bcdToDec", "decToBcd", "BCD_ENC", "BCD_DEC", "BCD_ENC_NP", "BCD_DEC_NP", "BCD_POW",
+         "dec2BCD", "BCD2Dec", "dec2BCDArray", "BCD2DecArray")
+
+codec = load_defs("OT817.py", CODEC, {"np": np})
+
+
+def ref_dec2bcd(f):
+    """Reference encoder built on the decimal string of the frequency / 10"""
+    return bytearray.fromhex("%08d" % (int(f) // 10 % 100000000)) + bytearray([0])
+
+
+EDGES = [0, 9, 10, 99, 100, 7074000, 14074000, 144000000, 430000000, 99999990, 999999990]
+
+
+def test_tables():
+    for i in range(100):
+        assert codec["BCD_ENC"][i] == int("%02d" % i, 16)
+        assert codec["BCD_DEC"][codec["BCD_ENC"][i]] == i
+    assert len(codec["BCD_DEC"]) == 256
+
+
+@pytest.mark.parametrize("f", EDGES)
+def test_scalar_round_trip(f):
+    ref = ref_dec2bcd(f)
+    assert codec["dec2BCD"](f) == ref
+    assert codec["BCD2Dec"](ref) == f // 10 * 10
+
+
+def test_scalar_random():
+    for f in np.random.default_rng(817).integers(0, 10**9, 10000):
+        f = int(f)
+        ref = ref_dec2bcd(f)
+        assert codec["dec2BCD"](f) == ref, f
+        assert codec["BCD2Dec"](ref) == f // 10 * 10, f
+
+
+def test_array_matches_scalar():
+    f = np.concatenate([np.array(EDGES, dtype=np.int64),
+                        np.random.default_rng(17).integers(0, 10**9, 10000)])
+    b = codec["dec2BCDArray"](f)
+    assert b.shape == (len(f), 4) and b.dtype == np.uint8
+    for k in (0, 5, len(EDGES), len(f) - 1):
+        assert bytes(b[k]) == bytes(ref_dec2bcd(f[k])[:4])
+    assert np.array_equal(codec["BCD2DecArray"](b), f // 10 * 10)
+
+
+def test_array_ignores_extra_columns():
+    frames = np.array([ref_dec2bcd(f) for f in EDGES], dtype=np.uint8)
+    assert frames.shape[1] == 5
+    assert list(codec["BCD2DecArray"](frames)) == [f // 10 * 10 for f in EDGES]
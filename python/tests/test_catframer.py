@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scriptdefs import load_defs  # noqa: E402
+
+ot = load_defs("OT817.py", lambda name: name.startswith("cat") or name == "CAT_MAXBUFFER",
+               {"log": lambda *a: None, "hexBuffer": lambda b: b, "threading": threading})
+
+FREQ = bytes.fromhex("01407000 01")     # set 14.070.00 MHz
+GET = bytes.fromhex("00000000 03")
+RXST = bytes.fromhex("00000000 e7")
+LOCK = bytes.fromhex("00000000 00")
+
+
+def feed(*chunks):
+    framer = ot["catFramer"](None)
+    frames = []
+    for c in chunks:
+        frames += [bytes(f) for f in framer.feed(c)]
+    return frames, framer
+
+
+def test_back_to_back():
+    frames, framer = feed(FREQ + GET + RXST)
+    assert frames == [FREQ, GET, RXST]
+    assert framer.dropped == 0
+
+
+@pytest.mark.parametrize("cut", range(1, 15))
+def test_split(cut):
+    data = FREQ + GET + RXST
+    frames, framer = feed(data[:cut], data[cut:])
+    assert frames == [FREQ, GET, RXST]
+
+
+@pytest.mark.parametrize("garbage", [b"\xff", b"\xff\x00", b"\x00\xff\x00", b"\x55\x00\x00\x00"])
+def test_garbage_prefix(garbage):
+    frames, framer = feed(garbage + GET + RXST)
+    assert frames == [GET, RXST]
+    assert framer.dropped == len(garbage)
+
+
+def test_garbage_prefix_split():
+    data = b"\xff" + GET + RXST
+    frames, framer = feed(data[:3], data[3:8], data[8:])
+    assert frames == [GET, RXST]
+
+
+def test_lock_on():
+    assert feed(LOCK)[0] == [LOCK]
+    assert feed(LOCK + GET)[0] == [LOCK, GET]
+    assert feed(LOCK, FREQ)[0] == [LOCK, FREQ]
+
+
+def test_partial_frame_flushed():
+    framer = ot["catFramer"](None)
+    assert framer.feed(GET[:3]) == []
+    framer.flush()
+    assert [bytes(f) for f in framer.feed(RXST)] == [RXST]
+    assert framer.dropped == 3
@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scriptdefs import load_defs  # noqa: E402
+
+SCHEDULER = ("SLOT", "SLOT_PREWARM", "SLOT_MINLEAD", "jitterMax", "missedSlots", "nextSlot", "sleepUntil",
+             "planSlot", "putJitter", "launchSlot", "HOP_WSPRNET", "hopList", "hopBand",
+             "setBand", "bands", "getFreq", "status", "bandStats", "doService", "doReceiveBlock")
+
+T0 = 1600000037.0
+
+
+class Stop(BaseException):
+    pass
+
+
+class FakeClock:
+    """time module stand-in, sleep() advances the clock"""
+
+    def __init__(self, t):
+        self.t = t
+        self.strftime = time.strftime
+        self.gmtime = time.gmtime
+
+    def time(self):
+        return self.t
+
+    def sleep(self, d):
+        self.t += d
+
+
+def service(cycles, decode, ntx, hop=None, rxonly=False):
+    """Run doService on a fake clock, rtlsdr_wsprd ends decode seconds after
+    the end of its last slot, stopped after ntx transmissions (or receptions
+    when rxonly). Returns the [(what, band, slot, cycles)] run by it"""
+    clock = FakeClock(T0)
+    runs = []
+
+    def doReceive(cmd, *args):
+        k = int(re.search(r"-n (\d+)", cmd).group(1))
+        slot = g["status"]["slot"]
+        runs.append(("RX", g["status"]["band"], slot, k))
+        clock.t = max(clock.t, slot + g["SLOT"] * k + decode)
+        if rxonly and len(runs) >= ntx:
+            raise Stop()
+        return 0
+
+    def doTransmit(cmd, slot):
+        runs.append(("TX", cmd.split()[-1], slot, 1))
+        clock.t = slot + 111
+        if sum(1 for r in runs if r[0] == "TX") >= ntx:
+            raise Stop()
+
+    g = {"time": clock, "log": lambda *a: None, "setPTT": lambda ptt: None,
+         "args": types.SimpleNamespace(ntpd=False, cycle=str(cycles), txonly=False,
+                                       rxonly=rxonly, tlmroot="/", gain=29),
+         "cycle": cycles, "band": "20m", "id": "LU7DID", "grid": "GF05", "pwr": "20",
+         "tlmSampler": lambda *a: types.SimpleNamespace(start=lambda: None),
+         "tlmSource": lambda *a: None, "ctlServer": None,
+         "threading": types.SimpleNamespace(Thread=lambda **kw: types.SimpleNamespace(start=lambda: None)),
+         "tlmFile": None, "doReceive": doReceive, "doTransmit": doTransmit}
+    load_defs("wsprRxTx.py", SCHEDULER, g)
+    if hop is not None:
+        g["hopList"] = hop
+    with pytest.raises(Stop):
+        g["doService"](0)
+    return runs
+
+
+def test_transmit_follows_receive():
+    """The decoder ends after the pre-warm point but before the boundary,
+    the next slot is still caught"""
+    runs = service(cycles=2, decode=-2, ntx=3)
+    slots = [r[2] for r in runs]
+    assert [r[0] for r in runs] == ["RX", "TX"] * 3
+    assert all(b - a == 120 * r[3] for (a, b, r) in zip(slots, slots[1:], runs))
+    assert slots[0] == (int(T0) // 120 + 1) * 120
+
+
+def test_late_decoder_misses_one_slot():
+    runs = service(cycles=1, decode=3, ntx=2)
+    assert [(r[0], r[2] - runs[0][2]) for r in runs] == [("RX", 0), ("TX", 240),
+                                                         ("RX", 360), ("TX", 600)]
+
+
+def test_hop_rotation_visits_every_band():
+    """A late decoder misses every other slot, still all of the bands are
+    received in rotation order"""
+    g = {}
+    load_defs("wsprRxTx.py", ("HOP_WSPRNET",), g)
+    hop = g["HOP_WSPRNET"]
+    runs = service(cycles=1, decode=3, ntx=len(hop), hop=hop, rxonly=True)
+    bands = [r[1] for r in runs]
+    first = hop.index(bands[0])
+    assert bands == [hop[(first + i) % len(hop)] for i in range(len(hop))]
+    assert all(b - a == 240 for (a, b) in zip([r[2] for r in runs], [r[2] for r in runs][1:]))
+
+
+def test_hop_rotation_follows_slot():
+    """Nothing missed, the band is the one of the coordinated rotation"""
+    g = {}
+    load_defs("wsprRxTx.py", ("HOP_WSPRNET",), g)
+    hop = g["HOP_WSPRNET"]
+    runs = service(cycles=1, decode=-2, ntx=len(hop), hop=hop, rxonly=True)
+    assert [r[1] for r in runs] == [hop[(r[2] // 120) % len(hop)] for r in runs]
+    assert len(set(r[1] for r in runs)) == len(hop)
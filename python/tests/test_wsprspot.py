@@ -0,0 +1,59 @@
+import collections
+import os
+import re
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scriptdefs import load_defs  # noqa: E402
+
+SPOTS = ("SLOT", "wsprSpot", "SPOT_RE", "RX_DECODE", "cycleSlot", "parseSpot")
+
+SLOT0 = 1592755320          # 2020-06-21 16:02:00 UTC
+
+
+class FakeClock:
+    def __init__(self, t):
+        self.t = t
+        self.strftime = time.strftime
+        self.gmtime = time.gmtime
+
+    def time(self):
+        return self.t
+
+
+@pytest.fixture
+def spots():
+    return load_defs("wsprRxTx.py", SPOTS, {"collections": collections, "re": re,
+                                            "time": FakeClock(SLOT0)})
+
+
+@pytest.mark.parametrize("line,call,grid,dbm", [
+    ("Spot :  2020-06-21 16:02:00  -21.00   0.30  14.097012  0  LU7DID GF05 20", "LU7DID", "GF05", 20),
+    ("Spot :  -21.00   0.30  14.097012  0  LU7DID GF05 20", "LU7DID", "GF05", 20),
+    ("Spot :  -21.00   0.30  14.097012  0  <LU7DID> 10", "<LU7DID>", "", 10),
+    ("Spot :  -21.00   0.30  14.097012  0  LU7DID/P 37", "LU7DID/P", "", 37),
+    ("Spot :  -21.00   0.30  14.097012  0  <LU7DID> GF05te 37", "<LU7DID>", "GF05te", 37),
+])
+def test_message_types(spots, line, call, grid, dbm):
+    spot = spots["parseSpot"](line, SLOT0)
+    assert (spot.call, spot.grid, spot.dbm) == (call, grid, dbm)
+    assert spot.time == "2020-06-21 16:02"
+
+
+def test_not_a_spot(spots):
+    assert spots["parseSpot"]("Using device 0: Generic RTL2832U", SLOT0) is None
+
+
+def test_slot_without_timestamp(spots):
+    """Spots printed in an odd minute belong to the slot being decoded"""
+    clock = spots["time"]
+    line = "Spot :  -21.00   0.30  14.097012  0  LU7DID GF05 20"
+    for (t, slot) in [(SLOT0 + 117, SLOT0), (SLOT0 + 150, SLOT0), (SLOT0 + 237, SLOT0 + 120),
+                      (SLOT0 + 270, SLOT0 + 120), (SLOT0 + 400, SLOT0 + 240)]:
+        clock.t = t
+        spot = spots["parseSpot"](line, spots["cycleSlot"](SLOT0, 3))
+        assert spot.time == time.strftime("%Y-%m-%d %H:%M", time.gmtime(slot))
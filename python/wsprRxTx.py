@@ -50,18 +50,30 @@ import datetime
 import random
 import RPi.GPIO as GPIO
 import signal
+import threading
+import atexit
+import glob
+import re
+import collections
+import struct
+import fcntl
+import socket
 #*--------------------------------------------------------------------------
 #* WSPR Band Table
 #*--------------------------------------------------------------------------
 bands={
-     "160m":1800000,
-     "80m": 3500000,
-     "40m": 7000000,
+     "160m":1836600,
+     "80m": 3568600,
+     "60m": 5287200,
+     "40m": 7038600,
+     "30m":10138700,
      "20m":14095600,
-     "15m":21000000,
-     "10m":28000000,
-     "6m" :50000000,
-     "2m":144000000
+     "17m":18104600,
+     "15m":21094600,
+     "12m":24924600,
+     "10m":28124600,
+     "6m" :50293000,
+     "2m":144489000
      }
 #*-------------------------------------------------------------------------
 #* Init global variables
@@ -75,11 +87,21 @@ tx=True
 VERSION='1.1'
 PROGRAM="wsprRxTx"
 cycle=5
-lckFile=("%s.lck") % PROGRAM
+RUNDIR=os.path.dirname(os.path.abspath(__file__))   #*-- found by --stop/--status from any directory
+lckFile=os.path.join(RUNDIR,("%s.lck") % PROGRAM)
+pidFile=os.path.join(RUNDIR,("%s.pid") % PROGRAM)
+ctlSocket=os.path.join(RUNDIR,("%s.sock") % PROGRAM)
+pidFd=None
 logFile=("%s.log") % PROGRAM
-tlmFile=("%s.tlm") % PROGRAM
+tlmFile=("%s.tlb") % PROGRAM
+spotFile=("%s.spt") % PROGRAM
 myPID=os.getpid()
 DEBUGLEVEL=0
+sink=None
+LOG_FLUSHBYTES=8192
+LOG_FLUSHTIME=10
+LOG_MAXSIZE=1024*1024
+LOG_KEEP=5
 #*------------------------------------------------------------------------
 #*  Set  GPIO out port for PTT
 #*------------------------------------------------------------------------
@@ -93,10 +115,10 @@ GPIO.setup(27, GPIO.OUT)
 def setPTT(PTT):
     if PTT==False:
        GPIO.output(27, GPIO.LOW)
-       log(0,"setPTT: GPIO27->PTT(%s) -- Receiving mode" % PTT)
+       log(0,"setPTT: GPIO27->PTT(%s) -- Receiving mode",PTT)
     else:
        GPIO.output(27, GPIO.HIGH)
-       log(0,"setPTT: GPIO27->PTT(%s) -- Transmit mode" % PTT)
+       log(0,"setPTT: GPIO27->PTT(%s) -- Transmit mode",PTT)
 #*-------------------------------------------------------------------------
 #* getFreq(band)
 #* Transform band into frequency
@@ -109,22 +131,113 @@ def getFreq(b):
 #* log(string)
 #* print log thru standard output
 #*-------------------------------------------------------------------------
-def log(d,st):
+def log(d,st,*args):
     if d<=DEBUGLEVEL:
+       if len(args)>0:
+          st=st % args
        m=datetime.datetime.now()
-       if logFile != '' : 
-          with open(logFile, 'a') as f:
-               f.write('%s %s\n' % (m,st))
+       if sink != None :
+          sink.write(m,'%s %s\n' % (m,st))
        print('%s %s' % (m,st))
+#*-------------------------------------------------------------------------
+#* logSink
+#* Log file kept open, lines are buffered and written when LOG_FLUSHBYTES
+#* are pending or LOG_FLUSHTIME seconds elapsed (background flusher).
+#* The file is rotated when it grows over LOG_MAXSIZE or the day changes,
+#* keeping the last LOG_KEEP rotated files
+#*-------------------------------------------------------------------------
+class logSink:
+    def __init__(self,name,maxSize=LOG_MAXSIZE,flushBytes=LOG_FLUSHBYTES,flushTime=LOG_FLUSHTIME,keep=LOG_KEEP):
+        self.name=name
+        self.maxSize=maxSize
+        self.flushBytes=flushBytes
+        self.flushTime=flushTime
+        self.keep=keep
+        self.lock=threading.Lock()
+        self.pending=[]
+        self.nPending=0
+        self.f=open(name,'a')
+        self.size=self.f.tell()
+        self.day=datetime.date.today()
+        self.closed=False
+        t=threading.Thread(target=self.flusher,daemon=True)
+        t.start()
+
+    def write(self,m,line):
+        with self.lock:
+            if self.closed:
+               return
+            if m.date()!=self.day or self.size>=self.maxSize:
+               self.rotate(m)
+            self.pending.append(line)
+            self.nPending=self.nPending+len(line)
+            self.size=self.size+len(line)
+            if self.nPending>=self.flushBytes:
+               self.drain()
+
+    def drain(self):
+        if self.nPending>0:
+           self.f.write(''.join(self.pending))
+           self.f.flush()
+           self.pending=[]
+           self.nPending=0
+
+    def rotate(self,m):
+        self.drain()
+        self.f.close()
+        os.rename(self.name,"%s.%s" % (self.name,m.strftime("%Y%m%d-%H%M%S")))
+        old=sorted(glob.glob("%s.[0-9]*" % self.name))
+        for f in old[:max(0,len(old)-self.keep)]:
+            os.remove(f)
+        self.f=open(self.name,'a')
+        self.size=0
+        self.day=m.date()
+
+    def flusher(self):
+        while not self.closed:
+            time.sleep(self.flushTime)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.closed:
+               self.drain()
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+               self.drain()
+               os.fsync(self.f.fileno())
+               self.f.close()
+               self.closed=True
 #*----------------------------------------------------------------------------
 #* Exception and Termination handler
+#* The handler only records the signal and unwinds the main thread with
+#* SystemExit; logging, PTT release and the log flush are done by shutdown()
+#* once out of the handler, so a signal landing while the main thread holds
+#* the logSink lock can not deadlock
 #*----------------------------------------------------------------------------
+stopSignal=None
+
 def signal_handler(sig, frame):
-   log(0,"signal_handler: WSPR Monitor and Beacon is being terminated, clean up completed!")
+   global stopSignal
+   if stopSignal != None:
+      return
+   stopSignal=sig
+   raise SystemExit(0)
+
+def shutdown():
+   if stopSignal != None:
+      log(0,"signal_handler: WSPR Monitor and Beacon is being terminated by signal(%d)",stopSignal)
    log(0,'Turning GPIO27 low as PTT')
    setPTT(False)
+   if child != None and child.poll() == None:
+      log(0,"Terminating child PID(%d)",child.pid)
+      child.terminate()
+   releaseLock()
    log(0,"Process terminated, clean up completed!")
-   sys.exit(0)
+   if sink != None:
+      sink.close()
 #*-------------------------------------------------------------------------
 #* Exception management
 #*-------------------------------------------------------------------------
@@ -136,7 +249,7 @@ signal.signal(signal.SIGTERM, signal_handler)
 #* Execute a command and return the result
 #*--------------------------------------------------------------------------
 def doExec(cmd):
-    log(1,"doExec: [cmd] %s" % cmd)
+    log(1,"doExec: [cmd] %s",cmd)
     p = subprocess.Popen(cmd, shell=True, 
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE)
@@ -151,18 +264,313 @@ def doExec(cmd):
 #* Execute a command as a shell and print to std out and std error
 #*--------------------------------------------------------------------------
 def doShell(cmd):
-    log(1,"doShell: [cmd] %s" % cmd)
+    log(1,"doShell: [cmd] %s",cmd)
     p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     (result, error) = p.communicate()
     rc = p.wait()
-    log(1,"doShell: [stdout]= %s" % result)
-    log(1,"doShell: [stderr]= %s" % error)
+    log(1,"doShell: [stdout]= %s",result)
+    log(1,"doShell: [stderr]= %s",error)
 
     if rc != 0:
-        log(0,"Error: failed to execute command: %s" % cmd)
+        log(0,"Error: failed to execute command: %s",cmd)
         log(0,error)
     return result.decode("utf-8")
 
+#*--------------------------------------------------------------------------
+#* WSPR spot ingestion
+#* rtlsdr_wsprd prints one line per decoded spot at the end of each cycle
+#*   Spot :  2020-06-21 16:02:00  -21.00   0.30  14.097012  0  LU7DID GF05 20
+#* (older builds omit the date and time, the spot then takes the slot being
+#* decoded, see cycleSlot). Type 2 messages carry no grid (CALL/P 37,
+#* <CALL> 37), a grid is only taken when it is a Maidenhead locator.
+#* Each spot is parsed into a wsprSpot record and pushed to every callable
+#* registered in spotSinks.
+#* The receiver runs under stdbuf -oL so spots are seen as each cycle ends
+#*--------------------------------------------------------------------------
+wsprSpot=collections.namedtuple("wsprSpot","time snr dt freq drift call grid dbm")
+SPOT_RE=re.compile(r"^Spot\s*:\s*(?:(\d{4}-\d\d-\d\d \d\d:\d\d(?::\d\d)?)\s+)?"
+                   r"(-?[\d.]+)\s+(-?[\d.]+)\s+([\d.]+)\s+(-?\d+)\s+(\S+)"
+                   r"(?:\s+([A-Ra-r]{2}\d{2}(?:[A-Xa-x]{2})?))?(?:\s+(\d+))?\s*$")
+RX_DECODE=4                        #*-- rtlsdr_wsprd stops recording 4 s before the slot ends
+spotSinks=[]
+
+#*--- slot decoded now by a receiver started at slot for k slots
+
+def cycleSlot(slot,k):
+    i=int((time.time()-slot+RX_DECODE)//SLOT)-1
+    return slot+SLOT*min(max(i,0),k-1)
+
+def parseSpot(line,slot):
+    m=SPOT_RE.match(line.strip())
+    if m==None:
+       return None
+    (t,snr,dt,f,drift,call,grid,dbm)=m.groups()
+    if t==None:
+       t=time.strftime("%Y-%m-%d %H:%M",time.gmtime(slot))
+    return wsprSpot(t[:16],float(snr),float(dt),float(f),int(drift),call,grid or "",int(dbm) if dbm else 0)
+
+def spotFileSink(spot):
+    with open(spotFile,'a') as f:
+         f.write("%s %6.1f %5.2f %10.6f %2d %-8s %-6s %2d\n" % spot)
+
+def spotHookSink(spot):
+    subprocess.Popen([args.spothook]+[str(x) for x in spot],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+
+#*--------------------------------------------------------------------------
+#* doReceive()
+#* Run the receiver (k slots from slot) and consume its output line by line
+#* as cycles decode
+#*--------------------------------------------------------------------------
+def doReceive(cmd,slot,k):
+    global child
+    log(1,"doReceive: [cmd] %s",cmd)
+    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, universal_newlines=True)
+    child=p
+    n=0
+    for line in p.stdout:
+        spot=parseSpot(line,cycleSlot(slot,k))
+        if spot==None:
+           log(1,"[RX] %s",line.rstrip("\n"))
+           continue
+        n=n+1
+        status["spots"]=n
+        status["total"]+=1
+        log(0,"[SPOT] %s %.1f %.2f %.6f %d %s %s %d",*spot)
+        for sink in spotSinks:
+            try:
+               sink(spot)
+            except Exception as e:
+               log(0,"doReceive: spot sink %s failed [%s]",sink.__name__,repr(e))
+    rc=p.wait()
+    if rc != 0:
+       log(0,"Error: failed to execute command: %s rc(%d)",cmd,rc)
+    return n
+
+#*--------------------------------------------------------------------------
+#* WSPR slot scheduler
+#* Slots start at every even UTC minute. Both rtlsdr_wsprd and wspr wait
+#* for the boundary by themselves, so they are launched SLOT_PREWARM seconds
+#* ahead of it with process startup, tuner and PLL setup already done when
+#* the slot begins.
+#* rtlsdr_wsprd records until ~4 s before the end of its last slot and then
+#* decodes, so the next process is usually launched later than that; it is
+#* still launched for the next slot (with a shorter lead) as long as
+#* SLOT_MINLEAD seconds are left before the boundary, only then the slot is
+#* missed. missedSlots counts the slots lost that way.
+#* The launch lateness and (TX) the measured start of the transmission
+#* against the boundary are logged as jitter on every slot
+#*--------------------------------------------------------------------------
+SLOT=120
+SLOT_PREWARM=5
+SLOT_MINLEAD=1
+jitterMax=0.0
+missedSlots=0
+
+def nextSlot(t):
+    return (int(t)//SLOT+1)*SLOT
+
+def sleepUntil(t):
+    while True:
+        d=t-time.time()
+        if d<=0:
+           return
+        time.sleep(d)
+
+#*--- first boundary that can still be reached, at least SLOT_MINLEAD ahead
+
+def planSlot(slot):
+    global missedSlots
+    now=time.time()
+    if slot-SLOT_MINLEAD>=now:
+       return slot
+    k=nextSlot(now+SLOT_PREWARM)
+    missedSlots=missedSlots+(k-slot)//SLOT
+    log(0,"[SLOT] %s missed, next slot %s",time.strftime("%H:%M:%S",time.gmtime(slot)),time.strftime("%H:%M:%S",time.gmtime(k)))
+    return k
+
+def putJitter(tag,slot,late):
+    global jitterMax
+    jitterMax=max(jitterMax,abs(late))
+    log(0,"[SLOT] %s %s jitter %+.3f s (max %.3f s)",tag,time.strftime("%H:%M:%S",time.gmtime(slot)),late,jitterMax)
+
+def launchSlot(tag,slot):
+    lead=slot-time.time()
+    if lead<SLOT_PREWARM:
+       log(0,"[SLOT] %s launch %s lead %.3f s (short)",tag,time.strftime("%H:%M:%S",time.gmtime(slot)),lead)
+       return
+    sleepUntil(slot-SLOT_PREWARM)
+    putJitter("%s launch" % tag,slot,time.time()-(slot-SLOT_PREWARM))
+
+#*--------------------------------------------------------------------------
+#* Telemetry
+#* tlmSource reads the Pi sensors straight from sysfs/procfs (no picheck.py
+#* interpreter per cycle); root lets it run over a fake tree for testing.
+#* The Pi exposes no supply voltage in sysfs, temperature and volts missing
+#* there are taken from vcgencmd (only on the real root)
+#* tlmSampler takes a reading every TLM_PERIOD seconds on its own thread and
+#* appends it to tlmFile as a fixed width record
+#*   uint32 epoch, int16 temp [0.01 C], uint16 volts [mV],
+#*   uint16 cpu clock [MHz], uint16 load average [0.01]
+#* Missing readings are stored as TLM_NONE. --tlm prints the last one as
+#* wsprtlm.py arguments (-t temp -b volts, a missing reading is left out
+#* and reported on stderr), --tlmdump the series as CSV (empty fields)
+#*--------------------------------------------------------------------------
+TLM_PERIOD=60
+TLM_REC=struct.Struct("<IhHHH")
+TLM_NONE=-1
+TLM_TEMP="sys/class/thermal/thermal_zone0/temp"
+TLM_VOLTS=["sys/class/power_supply/*/voltage_now","sys/class/hwmon/hwmon*/in0_input"]
+TLM_CPU="sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+TLM_LOAD="proc/loadavg"
+TLM_VCGENCMD={"temp":(["vcgencmd","measure_temp"],re.compile(r"temp=(-?[\d.]+)")),
+              "volts":(["vcgencmd","measure_volts"],re.compile(r"volt=([\d.]+)"))}
+
+class tlmSource:
+    def __init__(self,root="/"):
+        self.root=root
+
+    def readFile(self,name):
+        path=os.path.join(self.root,name)
+        if "*" in path:
+           l=sorted(glob.glob(path))
+           if len(l)==0:
+              return None
+           path=l[0]
+        try:
+           with open(path) as f:
+                return f.read().split()[0]
+        except (OSError,IndexError):
+           return None
+
+    def vcgencmd(self,what):
+        if self.root!="/":
+           return None
+        (cmd,r)=TLM_VCGENCMD[what]
+        try:
+           p=subprocess.run(cmd,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,timeout=5,universal_newlines=True)
+        except (OSError,subprocess.TimeoutExpired):
+           return None
+        m=r.search(p.stdout)
+        return None if m==None else float(m.group(1))
+
+    def temp(self):                                  #*-- C, sysfs gives millidegrees
+        v=self.readFile(TLM_TEMP)
+        return self.vcgencmd("temp") if v==None else int(v)/1000.0
+
+    def volts(self):                                 #*-- power_supply in uV, hwmon in mV
+        for name in TLM_VOLTS:
+            v=self.readFile(name)
+            if v!=None:
+               return int(v)/1000000.0 if "power_supply" in name else int(v)/1000.0
+        return self.vcgencmd("volts")
+
+    def cpu(self):                                   #*-- MHz, sysfs gives kHz
+        v=self.readFile(TLM_CPU)
+        return None if v==None else int(v)//1000
+
+    def load(self):
+        v=self.readFile(TLM_LOAD)
+        return None if v==None else float(v)
+
+    def sample(self):
+        return (int(time.time()),self.temp(),self.volts(),self.cpu(),self.load())
+
+def packTelemetry(t):
+    (ts,temp,volts,cpu,load)=t
+    return TLM_REC.pack(ts,
+                        TLM_NONE if temp==None else int(round(temp*100)),
+                        TLM_NONE&0xffff if volts==None else int(round(volts*1000)),
+                        TLM_NONE&0xffff if cpu==None else cpu,
+                        TLM_NONE&0xffff if load==None else min(int(round(load*100)),0xfffe))
+
+def unpackTelemetry(b):
+    (ts,temp,volts,cpu,load)=TLM_REC.unpack(b)
+    return (ts,
+            None if temp==TLM_NONE else temp/100.0,
+            None if volts==TLM_NONE&0xffff else volts/1000.0,
+            None if cpu==TLM_NONE&0xffff else cpu,
+            None if load==TLM_NONE&0xffff else load/100.0)
+
+def readTelemetry(name):
+    with open(name,"rb") as f:
+         b=f.read()
+    n=len(b)-len(b)%TLM_REC.size
+    return [unpackTelemetry(b[i:i+TLM_REC.size]) for i in range(0,n,TLM_REC.size)]
+
+class tlmSampler:
+    def __init__(self,source,name,period=TLM_PERIOD):
+        self.source=source
+        self.name=name
+        self.period=period
+        self.last=None
+
+    def take(self):
+        t=self.source.sample()
+        self.last=t
+        with open(self.name,"ab") as f:
+             f.write(packTelemetry(t))
+        log(0,"[TL] temp(%s) volts(%s) cpu(%s) load(%s)",*t[1:])
+        return t
+
+    def run(self):
+        while True:
+            try:
+               self.take()
+            except Exception as e:
+               log(0,"tlmSampler: exception while sampling [%s]",repr(e))
+            time.sleep(self.period-time.time()%self.period)
+
+    def start(self):
+        threading.Thread(target=self.run,daemon=True).start()
+
+#*--------------------------------------------------------------------------
+#* doTransmit()
+#* Run the beacon, the "TX started" line marks the actual slot start
+#*--------------------------------------------------------------------------
+def doTransmit(cmd,slot):
+    global child
+    log(1,"doTransmit: [cmd] %s",cmd)
+    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, universal_newlines=True)
+    child=p
+    for line in p.stdout:
+        log(1,"[TX] %s",line.rstrip("\n"))
+        if "TX started" in line:
+           putJitter("TX start",slot,time.time()-slot)
+    rc=p.wait()
+    if rc != 0:
+       log(0,"Error: failed to execute command: %s rc(%d)",cmd,rc)
+
+#*--------------------------------------------------------------------------
+#* Band hopping
+#* With --hop the band of every slot is taken from a rotation indexed by
+#* the slot number, so all stations following the same rotation meet on
+#* the same band. Missed slots (see planSlot) are not counted, the rotation
+#* resumes with the band that was due so every band is visited. "wsprnet" selects the coordinated hopping table (one band
+#* per even minute, the 10 bands cycling every 20 minutes), otherwise a
+#* comma separated list of bands is rotated. Consecutive slots on the same
+#* band are received with a single rtlsdr_wsprd run, a band change starts
+#* (pre-warmed) the receiver for the new band at the slot boundary.
+#* Without --hop every slot uses --band.
+#*--------------------------------------------------------------------------
+HOP_WSPRNET=["160m","80m","60m","40m","30m","20m","17m","15m","12m","10m"]
+hopList=[]
+bandStats={}
+
+def hopBand(slot):
+    if len(hopList)==0:
+       return band
+    return hopList[(slot//SLOT-missedSlots)%len(hopList)]
+
+def setBand(b):
+    if b!=status["band"]:
+       if status["band"]!="":
+          log(0,"[HOP] %s -> %s",status["band"],b)
+       status["band"]=b
+       status["freq"]=getFreq(b)
+    if b not in bandStats:
+       bandStats[b]={"slots":0,"spots":0,"tx":0}
+    return b
+
 #*--------------------------------------------------------------------------
 #* doService()
 #* Manages the monitor service
@@ -174,23 +582,18 @@ def doService(freq):
        #cmd='sudo chronyc -a makestep'
        cmd='sudo /home/pi/ntpd.sync'
        result=doShell(cmd)
-       log(0,"doService: TimeSync(%s)" % str(result).replace("\n",""))
- 
+       log(0,"doService: TimeSync(%s)",str(result).replace("\n",""))
+
+    tlmSampler(tlmSource(args.tlmroot),tlmFile).start()
+    threading.Thread(target=ctlServer,daemon=True).start()
+    status["started"]=time.time()
+    slot=nextSlot(time.time())
     while True:
        #*--------------------------*
        #* PTT low (receive)        *
        #*--------------------------*
        setPTT(False)
        #*--------------------------*
-       #* Read and log telemetry   *
-       #*--------------------------*
-       cmd="python /home/pi/WsprryPi/picheck.py -a"
-       result=doShell(cmd)
-       log(0,"[TL] %s" % str(result).replace("\n",""))
-       with open(tlmFile, 'a') as tlm:
-          log(1,"writing telemetry to file %s" % tlmFile)
-          tlm.write("%s" % result)
-       #*--------------------------*
        #* Receive WSPR             *
        #*--------------------------*
        if args.cycle != None:
@@ -201,35 +604,62 @@ def doService(freq):
           else:
              n=cycle
 
+       slot=planSlot(slot)
        if args.txonly == False:
-          log(0,"Starting receiver for %d cycles" % n)
-          try:
-             #cmd='sudo /home/pi/rtlsdr-wsprd/rtlsdr_wsprd -f %d -c %s -l %s -d 2 -n %d -a 1 -S' % (freq,id,grid,n) REMOVE  -a
-             cmd='sudo /home/pi/rtlsdr-wsprd/rtlsdr_wsprd -f %d -c %s -l %s -d 2 -n %d -g %d -S' % (freq,id,grid,n,args.gain)
-             result=doShell(cmd)       
-             log(0,"[RX]\n%s" % result)
-          except Exception as e:
-             log(0,"[RX] Exception while processing rtlsdr-wsprd [%s]" % repr(e))
+          end=slot+SLOT*n
+          while slot<end:
+             b=hopBand(slot)
+             k=1
+             while slot+SLOT*k<end and hopBand(slot+SLOT*k)==b:
+                k=k+1
+             doReceiveBlock(b,slot,k)
+             slot=planSlot(slot+SLOT*k)
        else: 
-          log(0,"Waiting for %d cycles" % n)
-          time.sleep(120*n)
+          log(0,"Waiting for %d cycles",n)
+          status.update(state="WAIT",slot=slot,cycles=n)
+          sleepUntil(slot+SLOT*n-SLOT_PREWARM)
+          slot=slot+SLOT*n
 
        if args.rxonly == False:
-       #*--------------------------*
-       #* PTT high (transmit)      *
-       #*--------------------------*
-          setPTT(True)
+          slot=planSlot(slot)
+          b=setBand(hopBand(slot))
        #*--------------------------*
        #* Transmit cycle           *
        #*--------------------------*
        #*--- NO USAR log(0,"Starting beacon %s grid=%s pwr=%s band=%s" (id,grid,pwr,band))
-          cmd='sudo /home/pi/WsprryPi/wspr -r -o -s -x 1 %s %s %s %s' % (id,grid,pwr,band)
+          cmd='sudo stdbuf -oL /home/pi/WsprryPi/wspr -r -o -s -x 1 %s %s %s %s' % (id,grid,pwr,b)
        #*--- NO USAR log(0,"[c]:%s" % cmd)
-          result=doShell(cmd)       
-          log(0,"[TX]\n%s" % result)
+          launchSlot("TX",slot)
+          status.update(state="TX",slot=slot,cycles=1)
+       #*--------------------------*
+       #* PTT high (transmit)      *
+       #*--------------------------*
+          setPTT(True)
+          doTransmit(cmd,slot)
+          bandStats[b]["tx"]+=1
+          slot=slot+SLOT
 
        setPTT(False)
 
+#*--------------------------------------------------------------------------
+#* doReceiveBlock()
+#* Receive k consecutive slots on one band with a single receiver run
+#*--------------------------------------------------------------------------
+def doReceiveBlock(b,slot,k):
+    b=setBand(b)
+    log(0,"Starting receiver for %d cycles on %s at %s",k,b,time.strftime("%H:%M:%S",time.gmtime(slot)))
+    try:
+       #cmd='sudo /home/pi/rtlsdr-wsprd/rtlsdr_wsprd -f %d -c %s -l %s -d 2 -n %d -a 1 -S' % (freq,id,grid,n) REMOVE  -a
+       cmd='sudo stdbuf -oL /home/pi/rtlsdr-wsprd/rtlsdr_wsprd -f %d -c %s -l %s -d 2 -n %d -g %d -S' % (getFreq(b),id,grid,k,args.gain)
+       launchSlot("RX",slot)
+       status.update(state="RX",slot=slot,cycles=k,spots=0)
+       n=doReceive(cmd,slot,k)
+       bandStats[b]["slots"]+=k
+       bandStats[b]["spots"]+=n
+       log(0,"[RX] %d spots in %d cycles on %s",n,k,b)
+    except Exception as e:
+       log(0,"[RX] Exception while processing rtlsdr-wsprd [%s]",repr(e))
+
 #*--------------------------------------------------------------------------
 #* getRandom
 #* Return an integer random number between two values [min,max]
@@ -248,56 +678,157 @@ def startService():
 
     freq=getFreq(band)
     if freq==0 :
-       log(0,'Non supported band(%s), exit' % band)
+       log(0,'Non supported band(%s), exit',band)
        exit()
-    log(1,"Starting daemon PID(%d)" % (myPID))
+    for b in hopList:
+        if getFreq(b)==0:
+           log(0,'Non supported band(%s) in hopping rotation, exit',b)
+           exit()
+    log(1,"Starting daemon PID(%d)",myPID)
     try:
       doService(freq)
     except Exception as e:
-      log(0,"Exception detected, program being terminated Exception(%s)" % repr(e))
+      log(0,"Exception detected, program being terminated Exception(%s)",repr(e))
     else:
       log(0,"Program is ending normally")
 
 
+#*--------------------------------------------------------------------------
+#* Single instance
+#* The daemon holds an exclusive flock on pidFile for its whole life, the
+#* kernel drops it when the process dies so a stale file never blocks a
+#* restart. A running instance is found by failing to get the same lock.
+#*--------------------------------------------------------------------------
+def acquireLock():
+    global pidFd
+    fd=os.open(pidFile,os.O_RDWR|os.O_CREAT,0o644)
+    try:
+       fcntl.flock(fd,fcntl.LOCK_EX|fcntl.LOCK_NB)
+    except BlockingIOError:
+       os.close(fd)
+       return False
+    os.ftruncate(fd,0)
+    os.write(fd,("%d\n" % myPID).encode())
+    pidFd=fd
+    return True
+
+#*--------------------------------------------------------------------------
+#* releaseLock
+#* Remove the control socket and drop the lock on a clean exit (the pidFile
+#* stays, an unlocked one means no daemon)
+#*--------------------------------------------------------------------------
+def releaseLock():
+    global pidFd
+    if pidFd == None:
+       return
+    try:
+       os.unlink(ctlSocket)
+    except FileNotFoundError:
+       pass
+    os.close(pidFd)
+    pidFd=None
+
 #*--------------------------------------------------------------------------
 #* isRunning
-#* Explore if another instance of the daemon is running
+#* Return the PID of the running daemon or '' when there is none
 #*--------------------------------------------------------------------------
 def isRunning():
-    cmd="sudo ps -aux | pgrep \"%s\" " % PROGRAM
-    log(1,"doExec: [cmd] %s" % cmd)
-    p = subprocess.Popen(cmd, shell=True, 
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    rc=p.wait()
-    for line in p.stdout:
-        s=line.decode("utf-8").replace("\n","")
-        log(2,"PID(%s)" % s)
-        if int(s)!=int(myPID):
-           log(2,"Detected PID(%s) as a running instance" % s)
-           return s
+    try:
+       fd=os.open(pidFile,os.O_RDONLY)
+    except FileNotFoundError:
+       return ""
+    try:
+       fcntl.flock(fd,fcntl.LOCK_SH|fcntl.LOCK_NB)
+    except BlockingIOError:
+       PID=os.read(fd,32).decode().strip()
+       log(2,"Detected PID(%s) as a running instance",PID)
+       return PID
+    finally:
+       os.close(fd)
     return ""
 
 #*--------------------------------------------------------------------------
-#* killChild
-#* Explore, list and kills all childs of a process plus the process itself
-#*--------------------------------------------------------------------------
-def killChild(PID):
-   try:
-     log(0,"Entering  parent identification thing PID %s" % PID)
-     parent = psutil.Process(int(PID))
-     log(0,"Parent process %s" % parent)
-     log(0,"killChild: process %s)" % parent)
-     for child in parent.children(recursive=True):  # or parent.children() for recursive=False
-       log(0,"killChild:     -- child(%s)" % child)
-       #child.kill()
-     #parent.kill()
-   except UnboundLocalError as error:
-     log(0,"killChild: Unable to kill parent PID")
-   except NameError as error:
-     log(2,"killChild: Allocation error")
-   except Exception as exception:
-     pass
+#* Control socket
+#* The daemon answers one line requests on a unix socket
+#*    status  live state (slot, band, spots)
+#*    list    daemon PID and its child processes
+#*    stop    terminate the daemon (same path as SIGTERM)
+#* so --status, --list and --stop need neither ps nor pgrep
+#*--------------------------------------------------------------------------
+status={"state":"IDLE","band":"","freq":0,"slot":0,"cycles":0,"spots":0,"total":0,"started":0}
+child=None
+
+def getChildren(pid):
+    l=[]
+    try:
+       for t in os.listdir("/proc/%d/task" % pid):
+           with open("/proc/%d/task/%s/children" % (pid,t)) as f:
+                for c in f.read().split():
+                    l.append(int(c))
+                    l=l+getChildren(int(c))
+    except OSError:
+       pass
+    return l
+
+def getCmdline(pid):
+    try:
+       with open("/proc/%d/cmdline" % pid,"rb") as f:
+            return f.read().replace(b"\0",b" ").decode(errors="ignore").strip()
+    except OSError:
+       return "?"
+
+def ctlReply(cmd):
+    if cmd=="status":
+       st=dict(status)
+       st["slot"]=time.strftime("%H:%M:%S",time.gmtime(st["slot"])) if st["slot"]>0 else "-"
+       st["started"]=time.strftime("%Y-%m-%d %H:%M:%S",time.gmtime(st["started"]))
+       return "\n".join(["PID(%d) %s" % (myPID," ".join("%s(%s)" % (k,v) for (k,v) in st.items()))]+
+                        ["   -- band(%s) slots(%d) spots(%d) tx(%d)" % (b,v["slots"],v["spots"],v["tx"]) for (b,v) in bandStats.items()])
+    if cmd=="list":
+       return "\n".join(["PID(%d) %s" % (myPID,getCmdline(myPID))]+["   -- child(%d) %s" % (c,getCmdline(c)) for c in getChildren(myPID)])
+    if cmd=="stop":
+       threading.Timer(0.1,os.kill,(myPID,signal.SIGTERM)).start()
+       return "PID(%d) stopping" % myPID
+    return "unknown request(%s)" % cmd
+
+def ctlServer():
+    try:
+       os.unlink(ctlSocket)
+    except FileNotFoundError:
+       pass
+    srv=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    srv.bind(ctlSocket)
+    srv.listen(4)
+    while True:
+        (c,a)=srv.accept()
+        try:
+           c.settimeout(1.0)
+           cmd=c.makefile().readline().strip()
+           log(1,"ctlServer: request(%s)",cmd)
+           c.sendall((ctlReply(cmd)+"\n").encode())
+        except OSError as e:
+           log(0,"ctlServer: exception [%s]",repr(e))
+        finally:
+           c.close()
+
+def ctlRequest(cmd):
+    c=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    c.settimeout(2.0)
+    try:
+       c.connect(ctlSocket)
+       c.sendall((cmd+"\n").encode())
+       reply=b""
+       while True:
+           b=c.recv(4096)
+           if not b:
+              break
+           reply=reply+b
+       return reply.decode().rstrip("\n")
+    except OSError:
+       return None
+    finally:
+       c.close()
+
 #*============================================================================
 #* Main Program
 #*
@@ -329,36 +860,74 @@ ap.add_argument("--ntpd",help="Force ntpd sync", required=False,default=False,ac
 ap.add_argument("--rxonly",help="Force only receiving", required=False,default=False,action="store_true")
 ap.add_argument("--txonly",help="Force ntpd transmitting", required=False,default=False,action="store_true")
 ap.add_argument("--list",help="List main PID and all childs", required=False,default=False,action="store_true")
+ap.add_argument("--hop",help="Band hopping, wsprnet or a list of bands i.e. 40m,30m,20m", required=False,default=None)
+ap.add_argument("--status",help="Show the state of the running daemon", required=False,default=False,action="store_true")
+ap.add_argument("--tlm",help="Print last telemetry sample as wsprtlm.py arguments", required=False,default=False,action="store_true")
+ap.add_argument("--tlmdump",help="Dump the telemetry series as CSV", required=False,default=False,action="store_true")
+ap.add_argument("--tlmroot",help="Root of the sysfs tree telemetry is read from", required=False,default="/")
+ap.add_argument("--spots",help="Append decoded spots to file", required=False,default=spotFile)
+ap.add_argument("--spothook",help="Command run with the fields of each decoded spot", required=False,default=None)
 
 args=ap.parse_args()
 
+#*---------------------------*
+#* Process telemetry queries *
+#*---------------------------*
+if args.tlm == True or args.tlmdump == True:
+   l=readTelemetry(tlmFile) if os.path.isfile(tlmFile) else []
+   if args.tlmdump == True:
+      print("time,temp,volts,cpu,load")
+      for t in l:
+          print("%s,%s,%s,%s,%s" % ((datetime.datetime.utcfromtimestamp(t[0]).isoformat(),)+tuple('' if x==None else x for x in t[1:])))
+   else:
+      t=l[-1] if len(l)>0 else tlmSource(args.tlmroot).sample()
+      st=[]
+      if t[1]!=None:
+         st.append("-t %.1f" % t[1])
+      else:
+         sys.stderr.write("%s: no temperature reading\n" % PROGRAM)
+      if t[2]!=None:
+         st.append("-b %.2f" % t[2])
+      else:
+         sys.stderr.write("%s: no voltage reading\n" % PROGRAM)
+      print(" ".join(st))
+   exit()
+
 #*---------------------------*
 #* Process log command       *
 #*---------------------------*
 
 if args.log == True :
    logFile="%s.log" % PROGRAM
-   with open(logFile, 'a') as f:
-      f.write("")
-   log(2,'(log) Set logfile(%s)' % logFile)
+   sink=logSink(logFile)
+   atexit.register(sink.close)
+   log(2,'(log) Set logfile(%s)',logFile)
 
-log(0,"Program %s Version %s PID(%d)" % (PROGRAM,VERSION,os.getpid()))
+log(0,"Program %s Version %s PID(%d)",PROGRAM,VERSION,os.getpid())
+
+#*---------------------------*
+#* Process spot sinks        *
+#*---------------------------*
+if args.spots != "":
+   spotFile=args.spots
+   spotSinks.append(spotFileSink)
+if args.spothook != None:
+   spotSinks.append(spotHookSink)
 
 #*---------------------------*
 #* Process receive only      *
 #*---------------------------*
 if args.mark != "":
-   log(0,"(mark) *** Checkpoint mark: %s ***" % args.mark)
+   log(0,"(mark) *** Checkpoint mark: %s ***",args.mark)
 
 
 if args.list == True:
    log(0,"(list) Listing all childs of running process")
-   PID=isRunning()
-   if PID =="":
+   reply=ctlRequest("list")
+   if reply == None:
       log(0,"(list) No process running found, exit")
    else:
-      log(0,"(list) Found process running PID(%s)" % PID)
-      killChild(PID)
+      log(0,"(list) %s",reply)
    exit()
 #*---------------------------*
 #* Process receive only      *
@@ -380,7 +949,7 @@ if args.txonly == True:
 
 if int(args.debug) != 0:
    DEBUGLEVEL=int(args.debug)
-   log(0,"(debug) Debug level set to %d" % DEBUGLEVEL)
+   log(0,"(debug) Debug level set to %d",DEBUGLEVEL)
 
 
 
@@ -389,14 +958,14 @@ if int(args.debug) != 0:
 #*---------------------------*
 if args.id != None :
    id=args.id.upper()
-   log(0,'(id) Set Callsign id(%s)' % id)
+   log(0,'(id) Set Callsign id(%s)',id)
 
 #*---------------------------*
 #* Process cycle command     *
 #*---------------------------*
 if args.cycle != None:
    cycle=int(args.cycle)
-   log(0,'(cycle) Set RX/TX cycle (%d)' % cycle)
+   log(0,'(cycle) Set RX/TX cycle (%d)',cycle)
 
 #*---------------------------*
 #* Process grid  command     *
@@ -404,29 +973,40 @@ if args.cycle != None:
 
 if args.grid != None :
    grid=args.grid.upper()
-   log(0,'(grid) Set maiden QTH Locator grid(%s)' % grid)
+   log(0,'(grid) Set maiden QTH Locator grid(%s)',grid)
 
 #*---------------------------*
 #* Process band command      *
 #*---------------------------*
 
 if args.band != None :
-   band=args.band.upper()
-   log(0,'(band) Set Band(%s)' % band)
+   band=args.band.lower()
+   log(0,'(band) Set Band(%s)',band)
+
+#*---------------------------*
+#* Process hop command       *
+#*---------------------------*
+
+if args.hop != None :
+   if args.hop.lower() == "wsprnet":
+      hopList=HOP_WSPRNET
+   else:
+      hopList=[x.strip().lower() for x in args.hop.split(",") if x.strip()!=""]
+   log(0,'(hop) Band hopping rotation(%s)',",".join(hopList))
 
 #*---------------------------*
 #* Process Tx command        *
 #*---------------------------*
 if args.tx != False :
    tx=args.tx
-   log(0,'(tx) Set Tx(%s)' % str(tx))
+   log(0,'(tx) Set Tx(%s)',str(tx))
 
 #*---------------------------*
 #* Process Power command     *
 #*---------------------------*
 if args.pwr != None :
    pwr=args.pwr
-   log(0,'(pwr) Set Power(%s)' % pwr)
+   log(0,'(pwr) Set Power(%s)',pwr)
 
 #*---------------------------*
 #* Process start command     *
@@ -436,33 +1016,35 @@ if args.start:
       log(0,"(start) Process is locked, run with --reset option to release")
       exit()
 
-   PID=isRunning()
-   if PID == '':
+   if acquireLock() == True:
       setPTT(False)
-      startService()
+      try:
+         startService()
+      finally:
+         shutdown()
    else:
-      log(0,"(start) Daemon already running PID(%s), exit" % PID)
+      log(0,"(start) Daemon already running PID(%s), exit",isRunning())
    exit()    
 #*---------------------------*
 #* Process stop command      *
 #*---------------------------*
 if args.stop:
-   pid=isRunning()
-   if(pid == ''):
+   reply=ctlRequest("stop")
+   if(reply == None):
      log(0,'Daemon is not running, exit')
    else:
-     log(0,'Daemon found PID(%s)' % pid)
+     log(0,'%s',reply)
    exit()
 #*----------------------------------------------------------------------------
 #* Review lock status
 #*----------------------------------------------------------------------------
 if args.lock == True:
    if os.path.isfile(lckFile) == True:
-      log(0,"(lock) Lock %s already exists, remove with --reset" % lckFile)
+      log(0,"(lock) Lock %s already exists, remove with --reset",lckFile)
    else:
       with open(lckFile, 'w+') as lck:
          lck.write(str(os.getpid()))
-      log(0,"(lock) Lock %s created" % lckFile)
+      log(0,"(lock) Lock %s created",lckFile)
    exit()
 #*---------------------------*
 #* Process reset command     *
@@ -471,18 +1053,22 @@ if args.lock == True:
 if args.reset == True:
    if os.path.isfile(lckFile) == True:
       os.remove(lckFile)
-      log(0,"(reset) Lock %s removed, start program with option --start" % lckFile)
+      log(0,"(reset) Lock %s removed, start program with option --start",lckFile)
    else:
       log(0,"(reset) No lock found, exit")
    exit()
 
 #*------------------------------------*
-#* Process list command (default)     *
+#* Process status command (default)   *
 #*------------------------------------*
-pid=isRunning()
-if (pid == ''):
-   log(0,'Status: Daemon is not running, exit')
+reply=ctlRequest("status")
+if (reply == None):
+   pid=isRunning()
+   if (pid == ''):
+      log(0,'Status: Daemon is not running, exit')
+   else:
+      log(0,'Status: Daemon is running PID(%s), control socket not answering',pid)
 else:
-   log(0,'Status: Daemon is running PID(%s)' % (pid))
+   log(0,'Status: %s',reply)
 exit()
 #*--------------------------------[End of program] -----------------------------------------------